@@ -0,0 +1,184 @@
+import dataclasses
+import json
+import os
+import shlex
+import sys
+import time
+from typing import List, Optional, Dict, TextIO
+
+from .environments import Python3Environment
+from .exceptions import CommandNotFound
+from .logging import dts_print
+from .shell import DTShell
+from .utils import replace_spaces
+
+# lines ending with this run concurrently with the adjacent lines ending with it
+PARALLEL_MARKER: str = "&"
+
+
+@dataclasses.dataclass
+class BatchCommand:
+    lineno: int
+    line: str
+    args: List[str]
+    parallel: bool = False
+    exit_code: Optional[int] = None
+    duration: Optional[float] = None
+
+    @property
+    def skipped(self) -> bool:
+        return self.exit_code is None
+
+    def as_dict(self) -> dict:
+        return {
+            "lineno": self.lineno,
+            "command": self.line,
+            "parallel": self.parallel,
+            "exit_code": self.exit_code,
+            "duration": self.duration,
+            "skipped": self.skipped,
+        }
+
+
+class BatchRunner:
+    """
+    Runs many commands on the same shell, one per line of a file. The shell is built only once.
+
+    Lines are run in order. Empty lines and lines starting with '#' are ignored, the 'dts' prefix is optional.
+    Consecutive lines ending with '&' are independent of each other and run concurrently in processes forked
+    from this one, the batch continues when all of them are done.
+    """
+
+    def __init__(self, shell: DTShell, source: str, keep_going: bool = False, summary: Optional[str] = None):
+        self.shell: DTShell = shell
+        self.source: str = source
+        self.keep_going: bool = keep_going
+        self.summary: Optional[str] = summary
+        self.commands: List[BatchCommand] = []
+
+    def run(self) -> int:
+        """
+        Runs the batch and returns the exit code of the first command that failed (0 if none did).
+        """
+        stime: float = time.time()
+        self.commands = self._parse()
+        exit_code: int = 0
+        i: int = 0
+        while i < len(self.commands):
+            # group parallel lines together
+            j: int = i + 1
+            if self.commands[i].parallel:
+                while j < len(self.commands) and self.commands[j].parallel:
+                    j += 1
+            group: List[BatchCommand] = self.commands[i:j]
+            if len(group) > 1:
+                self._run_parallel(group)
+            else:
+                self._run(group[0])
+            i = j
+            # check for failures
+            failed: List[BatchCommand] = [c for c in group if c.exit_code != 0]
+            if failed:
+                exit_code = exit_code or failed[0].exit_code
+                if not self.keep_going:
+                    break
+        # report
+        if self.summary is not None:
+            self._write_summary(exit_code, time.time() - stime)
+        return exit_code
+
+    def _parse(self) -> List[BatchCommand]:
+        fin: TextIO = sys.stdin if self.source == "-" else open(self.source, "rt")
+        commands: List[BatchCommand] = []
+        try:
+            for lineno, line in enumerate(fin, start=1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                parallel: bool = line.endswith(PARALLEL_MARKER)
+                if parallel:
+                    line = line[:-len(PARALLEL_MARKER)].rstrip()
+                try:
+                    args: List[str] = shlex.split(line)
+                except ValueError as e:
+                    raise ValueError(f"Line {lineno} of '{self.source}' is not valid: {e}")
+                if args and args[0] == "dts":
+                    args = args[1:]
+                commands.append(BatchCommand(lineno=lineno, line=line, args=args, parallel=parallel))
+        finally:
+            if fin is not sys.stdin:
+                fin.close()
+        return commands
+
+    def _execute(self, command: BatchCommand) -> int:
+        # the shell only prints a message for commands that do not exist
+        try:
+            self.shell.get_command(" ".join(map(replace_spaces, command.args)))
+        except CommandNotFound:
+            Python3Environment.run(self.shell, command.args)
+            return 1
+        try:
+            return Python3Environment.run(self.shell, command.args)
+        except SystemExit as e:
+            # commands are used to end the process when they are done
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            dts_print(str(e.code), color="red")
+            return 1
+
+    def _run(self, command: BatchCommand):
+        dts_print(f"[{command.lineno}] dts {shlex.join(command.args)}", color="cyan")
+        stime: float = time.time()
+        command.exit_code = self._execute(command)
+        command.duration = time.time() - stime
+        self._report(command)
+
+    def _run_parallel(self, commands: List[BatchCommand]):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        workers: Dict[int, BatchCommand] = {}
+        stimes: Dict[int, float] = {}
+        for command in commands:
+            dts_print(f"[{command.lineno}] dts {shlex.join(command.args)} &", color="cyan")
+            pid: int = os.fork()
+            if pid == 0:
+                # worker: run the command and leave without running the parent's exit handlers
+                exit_code: int = 1
+                try:
+                    exit_code = self._execute(command)
+                finally:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(exit_code)
+            workers[pid] = command
+            stimes[pid] = time.time()
+        # wait for all of them
+        while workers:
+            pid, status = os.wait()
+            if pid not in workers:
+                continue
+            command: BatchCommand = workers.pop(pid)
+            command.exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+            command.duration = time.time() - stimes[pid]
+            self._report(command)
+
+    @staticmethod
+    def _report(command: BatchCommand):
+        if command.exit_code == 0:
+            dts_print(f"[{command.lineno}] Done in {command.duration:.2f}s", color="green")
+        else:
+            dts_print(f"[{command.lineno}] Failed with exit code {command.exit_code} in "
+                      f"{command.duration:.2f}s", color="red")
+
+    def _write_summary(self, exit_code: int, duration: float):
+        summary: dict = {
+            "source": self.source,
+            "exit_code": exit_code,
+            "duration": duration,
+            "commands": [c.as_dict() for c in self.commands],
+        }
+        if self.summary == "-":
+            print(json.dumps(summary, indent=4))
+            return
+        with open(self.summary, "wt") as fout:
+            json.dump(summary, fout, indent=4)
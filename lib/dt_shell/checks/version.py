@@ -6,11 +6,10 @@ from typing import Optional, Tuple
 
 import requests
 import termcolor
-import yaml
 from requests import Response, HTTPError
 
 from .. import __version__
-from ..constants import DTShellConstants
+from ..constants import DB_PYPI_CACHE, CHECK_SHELL_UPDATE_MINS
 from ..exceptions import CouldNotGetVersion, NoCacheAvailable, URLException
 
 
@@ -47,68 +46,52 @@ def get_last_version_fresh() -> str:
         raise CouldNotGetVersion() from e
 
 
-def get_cache_filename() -> str:
-    d0 = os.path.expanduser(DTShellConstants.ROOT)
-    return os.path.join(d0, "pypi-cache.yaml")
-
-
 def read_cache() -> Tuple[str, datetime]:
+    from ..database import DTShellDatabase
     try:
-        fn = get_cache_filename()
-        if os.path.exists(fn):
-            data = open(fn).read()
-            interpreted = yaml.load(data, Loader=yaml.Loader)
-            version = interpreted["version"]
-            dt = interpreted["timestamp"]
-            return version, dt
-        else:
-            msg = "File %s does not exist." % fn
-            raise NoCacheAvailable(msg)
+        db: DTShellDatabase = DTShellDatabase.open(DB_PYPI_CACHE)
+        version = db.get("version")
+        dt = datetime.fromtimestamp(db.get("timestamp"))
+        return version, dt
+    except DTShellDatabase.NotFound:
+        raise NoCacheAvailable("No version cached.")
     except Exception as e:
         msg = "Could not read cache: %s" % e
         raise NoCacheAvailable(msg)
 
 
 def write_cache(version: str, dt: datetime) -> None:
-    fn = get_cache_filename()
-    d0 = os.path.dirname(fn)
-    if not os.path.exists(d0):
-        os.makedirs(d0)
-
-    with open(fn, "w") as f:
-        contents = dict(version=version, timestamp=dt)
-        y = yaml.dump(contents)
-        f.write(y)
-
+    from ..database import DTShellDatabase
+    db: DTShellDatabase = DTShellDatabase.open(DB_PYPI_CACHE)
+    db.update({"version": version, "timestamp": dt.timestamp()})
 
-def get_last_version() -> Optional[str]:
-    now = datetime.now()
-    update = False
 
-    version = None
+def version_cache_outdated() -> bool:
     try:
-        version, timestamp = read_cache()
+        _, timestamp = read_cache()
     except NoCacheAvailable:
-        timestamp = now
-        update = True
+        return True
+    return datetime.now() - timestamp > timedelta(minutes=CHECK_SHELL_UPDATE_MINS)
 
-    if not update:
-        delta = now - timestamp
-        if delta > timedelta(minutes=10):
-            # logger.debug('Version cache is outdated (%s).' % delta)
-            update = True
 
-    if update:
+def get_last_version(fresh: bool = True) -> Optional[str]:
+    """
+    Returns the latest version of the shell on PyPI. Unless `fresh` is False, PyPI is contacted when the
+    cached version is outdated.
+    """
+    if fresh and version_cache_outdated():
         # logger.debug('Getting last version from PyPI.')
         try:
             version = get_last_version_fresh()
-            write_cache(version, now)
+            write_cache(version, datetime.now())
             return version
         except CouldNotGetVersion:
             return None
-
-    # XXX: this might not be set
-    return version
+    try:
+        version, _ = read_cache()
+        return version
+    except NoCacheAvailable:
+        return None
 
 
 def is_older(a: str, b: str) -> bool:
@@ -118,8 +101,8 @@ def is_older(a: str, b: str) -> bool:
     return na < nb
 
 
-def check_for_updates() -> None:
-    latest_version = get_last_version()
+def check_for_updates(fresh: bool = True) -> None:
+    latest_version = get_last_version(fresh)
     # print('last version: %r' % latest_version)
     # print('installed: %r' % __version__)
 
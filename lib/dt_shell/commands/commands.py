@@ -1,6 +1,6 @@
 import os
+import sys
 import time
-import copy
 import glob
 import traceback
 import argparse
@@ -10,14 +10,19 @@ from dataclasses import dataclass
 from types import SimpleNamespace
 from typing import Dict, Type, Union, Optional, Mapping, Tuple, List, Any
 
-from .repository import CommandsRepository
+from filelock import FileLock, Timeout
+
+from .repository import CommandsRepository, GitTransfer, git_transfer, is_shallow, is_blobless, CLONE_MODE_FULL, \
+    CLONE_MODE_BLOBLESS, CLONE_MODE_SHALLOW, CLONE_OPTIONS
+from .revisions import CommandSetRevisions
 from .autocomplete import ArgumentParserCompleter
 from .. import __version__, logger
-from ..constants import CHECK_CMDS_UPDATE_MINS, DB_COMMAND_SET_UPDATES_CHECK, DTShellConstants, \
-    EMBEDDED_COMMAND_SET_NAME
+from ..constants import DB_COMMAND_SET_UPDATES_CHECK, DTShellConstants, EMBEDDED_COMMAND_SET_NAME, \
+    GIT_SUBMODULE_JOBS, CMDS_UPDATE_LOCK_WAIT_SECS, CHECK_CMDS_CHANGES_HISTORY
 from ..environments import ShellCommandEnvironmentAbs, Python3Environment
+from ..mirrors import GitMirrors
 from ..exceptions import UserError, InvalidRemote, CommandsLoadingException, CommandNotFound
-from ..utils import run_cmd, undo_replace_spaces
+from ..utils import run_cmd, undo_replace_spaces, compile_bytecode
 from ..typing import DTShell
 
 CommandName = str
@@ -146,13 +151,11 @@ class DTCommandAbs(metaclass=ABCMeta):
         # print('[%s, %r]@(%s, %s)' % (word, parts, cls.name, cls.__class__))
         if len(word) > 0:
             if len(cls.commands) > 0:
-                # search every command and their aliases
-                subcmds: Dict[str, Type[DTCommandAbs]] = copy.copy(cls.commands)
-                for subcmd_name, subcmd in cls.commands.items():
-                    subcmds.update({k: subcmd for k in subcmd.aliases()})
+                # search every command first and their aliases then
+                subcmd: Optional[Type[DTCommandAbs]] = cls.commands.resolve(word)
                 # if we have a match we keep looking down recursively
-                if word in subcmds:
-                    return subcmds[word].get_command(shell, " ".join(parts[1:]))
+                if subcmd is not None:
+                    return subcmd.get_command(shell, " ".join(parts[1:]))
                 else:
                     raise CommandNotFound(last_matched=cls, remaining=parts)
             else:
@@ -407,10 +410,25 @@ class CommandSet:
 
     def __post_init__(self):
         from .importer import import_commandset_configuration
+        from ..snapshot import ShellSnapshot
+        # command sets that we update run from the revision that was current when we started (if any)
+        self.repository_path: str = self.path
+        self.revisions: Optional[CommandSetRevisions] = None
+        # only one process at a time downloads, checks or updates the command set (the lock is reentrant)
+        self._lock: FileLock = FileLock(
+            os.path.join(os.path.dirname(self.repository_path), f".{os.path.basename(self.repository_path)}.lock")
+        )
+        if self.repository is not None and not self.leave_alone:
+            self.revisions = CommandSetRevisions(self.repository_path)
+            sha: Optional[str] = self.revisions.use_current()
+            if sha is not None:
+                self.path = self.revisions.path(sha)
         # load command set configuration
         self.configuration: Type[DTCommandSetConfigurationAbs] = import_commandset_configuration(self)
-        # load commands
-        self.commands = self._find_commands()
+        # load commands (reuse the ones discovered by the shell that handed execution over to us, if any)
+        snapshot: Optional[ShellSnapshot] = ShellSnapshot.current()
+        commands: Optional[CommandsTree] = snapshot.commands(self) if snapshot is not None else None
+        self.commands = commands if commands is not None else self._find_commands()
 
     def init(self):
         from .importer import import_commandset_init
@@ -463,6 +481,18 @@ class CommandSet:
         # reload commands
         self.commands = self._find_commands() or {}
 
+    def precompile(self) -> bool:
+        """
+        Compiles the command set to bytecode in the cache of the profile (see ShellProfile.pycache_path).
+        """
+        if self.profile is None or self.profile.readonly:
+            return False
+        try:
+            return compile_bytecode(sys.executable, self.path, self.profile.pycache_path)
+        except Exception as e:
+            logger.warning(f"Could not compile the command set '{self.name}': {e}")
+            return False
+
     def command_path(self, selector: str) -> str:
         return os.path.join(self.path, selector.strip(".").replace(".", os.path.sep))
 
@@ -471,31 +501,66 @@ class CommandSet:
         if self.repository is None:
             raise RuntimeError("You cannot 'download' a command set without a repository defined.")
         # ---
+        os.makedirs(os.path.dirname(self.repository_path), exist_ok=True)
+        with self._lock:
+            # another process might have downloaded it while we were waiting for it
+            if os.path.exists(self.repository_path):
+                logger.info(f"The command set '{self.name}' was downloaded by another process")
+                self.refresh()
+                return True
+            return self._download()
+
+    def _download(self) -> bool:
         remote_url = self.repository.remoteurl
         try:
-            logger.info(f"Downloading command set in {self.path} ...")
+            logger.info(f"Downloading command set in {self.repository_path} ...")
             # clone the repo
             branch: List[str] = ["--branch", self.repository.branch] if self.repository.branch else []
-            run_cmd(["git", "clone"] + branch + ["--recurse-submodules", remote_url, self.path])
-            logger.info("Command set downloaded successfully!")
+            mode: str = self.profile.settings.clone_mode
+            if mode not in CLONE_OPTIONS:
+                logger.warning(f"Unknown clone mode '{mode}', falling back to '{CLONE_MODE_FULL}'. "
+                               f"Known modes are: {list(CLONE_OPTIONS)}")
+                mode = CLONE_MODE_FULL
+            if mode == CLONE_MODE_SHALLOW:
+                transfer: GitTransfer = git_transfer(
+                    ["git", "clone", "--progress"] + branch + CLONE_OPTIONS[mode] +
+                    ["--recurse-submodules", f"--jobs={GIT_SUBMODULE_JOBS}", remote_url, self.repository_path]
+                )
+            else:
+                # the history comes from the mirror shared by all profiles, submodules from their remotes
+                transfer: GitTransfer = GitMirrors().clone(self.repository, self.repository_path, mode)
+                transfer += git_transfer(
+                    ["git", "-C", self.repository_path, "submodule", "update", "--init", "--recursive",
+                     "--progress", f"--jobs={GIT_SUBMODULE_JOBS}"]
+                )
+            how: str = f"{mode} clone" if mode == CLONE_MODE_SHALLOW else f"{mode} clone from the local mirror"
+            logger.info(f"Command set downloaded successfully ({how}, {transfer})!")
         except Exception as e:
             # Excepts as InvalidRemote
             logger.error(f"Unable to clone the repo at '{remote_url}':\n{str(e)}.")
             return False
+        # a fresh clone is as good as a check for updates
+        self.mark_as_just_updated()
         # refresh commands (outside try/except since clone succeeded)
         self.refresh()
+        # compile the new code so that the first run does not have to
+        self.precompile()
         return True
 
-    def update(self) -> bool:
+    def update(self, force: bool = False) -> bool:
+        """
+        Downloads the command set if needed and applies the updates available, if any. Unless forced (e.g., when
+        the user asks for updates), the remote is only checked when it is time to (see update_check_due).
+        """
         # check that the repo is initialized in the commands path
         self.ensure_commands_exist()
         # update the commands if they are outdated
-        return self.ensure_commands_updated()
+        return self.ensure_commands_updated(force)
 
     def ensure_commands_exist(self):
         # clone the commands if necessary
-        if not os.path.exists(self.path):
-            msg = f"I cannot find the command path {self.path}"
+        if not os.path.exists(self.repository_path):
+            msg = f"I cannot find the command path {self.repository_path}"
             if self.leave_alone:
                 raise Exception(msg)
             logger.debug(msg)
@@ -509,57 +574,229 @@ class CommandSet:
         if not os.path.exists(self.path):
             raise UserError(f"Commands not found at '{self.path}'.")
 
-    def commands_need_update(self) -> bool:
+    def commands_need_update(self, force: bool = False) -> bool:
         # command sets without repository cannot be updated
         if self.repository is None:
             return False
-        # ---
-        need_update: bool = False
+        # updates found (and downloaded) already, e.g., by the background refresher
+        if self.pending_update is not None:
+            return True
+        # the user asked for it, no matter when the last check happened
+        if force:
+            return self.check_for_updates(force=True)
         # get the current repo info
         db = self.profile.database(DB_COMMAND_SET_UPDATES_CHECK)
         # check if it's time to check for an update
-        record: dict
-        if db.contains(self.name):
-            record = db.get(self.name)
-            now = time.time()
-            last_time_checked = record["time"]
-            use_cached_commands = now - last_time_checked < CHECK_CMDS_UPDATE_MINS * 60
-        else:
+        if not db.contains(self.name):
             # save the initial update record
             self.mark_as_just_updated()
             return False
-
+        if not self.update_check_due:
+            return False
         # check for an updated remote
-        if not use_cached_commands:
-            logger.info(f"Checking for updates for the command set '{self.name}'...")
-            # get the local sha from file
-            local_sha: Optional[str] = record["sha"]
-            if local_sha is None:
-                logger.error(f"Command set '{self.name}' has a repository but no local sha. "
-                             f"This should not have happened. Contact technical support.")
-                # TODO: maybe corrupted repository? suggest removing and reinstalling the command set?
-                return False
+        return self.check_for_updates()
 
-            # get the remote sha from GitHub
-            remote_sha: Optional[str] = self.repository.remote_sha()
-            if remote_sha is None:
-                if self.repository.use_ssh:
-                    # give up on this, we don't get a SHA via SSH
-                    self.mark_as_just_updated()
+    def check_for_updates(self, force: bool = False) -> bool:
+        """
+        Looks for updates on the remote of the command set and downloads them without applying them
+        (see apply_updates). Returns whether there are updates to apply. Unless forced, the remote is not contacted
+        if another profile checked it recently.
+        """
+        if self.repository is None:
+            return False
+        db = self.profile.database(DB_COMMAND_SET_UPDATES_CHECK)
+        stime: float = time.time()
+        try:
+            with self._lock.acquire(timeout=CMDS_UPDATE_LOCK_WAIT_SECS):
+                # another process might have checked while we were waiting for it
+                db.reload()
+                record: Optional[dict] = db.get(self.name, None)
+                if record is not None and record["time"] >= stime:
+                    logger.debug(f"The command set '{self.name}' was just checked by another process")
+                    return self.pending_update is not None
+                return self._check_for_updates(force)
+        except Timeout:
+            logger.info(f"The command set '{self.name}' is being checked by another process, "
+                        f"using the last known state")
+            return self.pending_update is not None
+
+    def _check_for_updates(self, force: bool = False) -> bool:
+        logger.info(f"Checking for updates for the command set '{self.name}'...")
+        local_sha: Optional[str] = self.local_sha
+        shallow: bool = is_shallow(self.repository_path)
+        # the remote is contacted through the mirror shared by all profiles (shallow clones do it themselves)
+        direct: bool = shallow
+        mode: str = CLONE_MODE_BLOBLESS if not shallow and is_blobless(self.repository_path) else CLONE_MODE_FULL
+        remote_sha: Optional[str] = None
+        if not direct:
+            try:
+                remote_sha = GitMirrors().update(self.repository, mode, force=force)
+            except RuntimeError as e:
+                logger.warning(f"Could not update the mirror of the command set '{self.name}': {e}")
+                direct = True
+        if direct:
+            # the GitHub API is cheaper than a fetch when nothing changed (it does not work over SSH)
+            remote_sha = self.repository.remote_sha()
+        if remote_sha is None or remote_sha != local_sha:
+            branch: str = self.repository.branch
+            # a single fetch of the tip of the branch (submodules are fetched when the revision is prepared)
+            depth: List[str] = ["--depth", "1"] if shallow else []
+            try:
+                if direct:
+                    transfer: GitTransfer = git_transfer(
+                        ["git", "-C", self.repository_path, "fetch", "--progress"] + depth +
+                        ["origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}"]
+                    )
+                else:
+                    transfer: GitTransfer = GitMirrors().fetch(self.repository, self.repository_path, mode)
+                logger.info(f"Fetched the command set '{self.name}' ({transfer})")
+                stdout: str = run_cmd(["git", "-C", self.repository_path, "rev-parse", f"origin/{branch}"])
+                remote_sha = stdout.strip()
+            except RuntimeError:
+                if DTShellConstants.VERBOSE:
+                    traceback.print_exc()
+                logger.warning(f"An error occurred while fetching the updates for the command set '{self.name}'")
+                # back off so that we don't retry right away
+                self._record_check(local_sha, None, failed=True)
                 return False
+        # reset update check time
+        self._record_check(local_sha, remote_sha)
+        return remote_sha != local_sha
 
-            # check if we need to update
-            need_update = local_sha != remote_sha
-            # touch flag to reset update check time
-            self.mark_as_just_updated()
-        # ---
-        return need_update
+    @property
+    def update_check_due(self) -> bool:
+        """
+        Tells whether it is time to check the remote for updates. The interval between two checks adapts to how
+        often the remote changes (see _record_check).
+        """
+        if self.repository is None:
+            return False
+        record: Optional[dict] = self.profile.database(DB_COMMAND_SET_UPDATES_CHECK).get(self.name, None)
+        # never checked (e.g., the record did not come along with a profile moved from another machine)
+        if record is None:
+            return True
+        shortest, _ = self.profile.settings.update_check_bounds
+        return time.time() - record["time"] >= record.get("interval", shortest * 60)
 
-    def mark_as_just_updated(self):
+    def _record_check(self, local_sha: Optional[str], remote_sha: Optional[str], failed: bool = False):
+        """
+        Records the outcome of a check for updates together with the interval until the next one. The interval
+        doubles at every check that finds nothing new (or fails) and drops to the shortest one when the remote
+        changes. It never exceeds half the average time between the recent changes, so branches that change often
+        are checked often, all within the bounds given in the settings of the profile.
+        """
         db = self.profile.database(DB_COMMAND_SET_UPDATES_CHECK)
-        db.set(self.name, {"sha": self.local_sha, "time": time.time()})
+        record: dict = db.get(self.name, None) or {}
+        shortest, longest = (m * 60 for m in self.profile.settings.update_check_bounds)
+        now: float = time.time()
+        interval: float = record.get("interval", shortest)
+        changes: List[float] = record.get("changes", [])
+        failures: int = 0
+        previous: Optional[str] = record.get("remote_sha", None) or record.get("sha", None)
+        if failed:
+            failures = record.get("failures", 0) + 1
+            remote_sha = record.get("remote_sha", None)
+            interval *= 2
+        elif previous is not None and remote_sha is not None and remote_sha != previous:
+            changes = (changes + [now])[-CHECK_CMDS_CHANGES_HISTORY:]
+            interval = shortest
+        else:
+            interval *= 2
+        if changes:
+            interval = min(interval, (now - changes[0]) / len(changes) / 2)
+        record.update({
+            "sha": local_sha,
+            "remote_sha": remote_sha,
+            "time": now,
+            "interval": max(shortest, min(longest, interval)),
+            "changes": changes,
+            "failures": failures,
+        })
+        db.set(self.name, record)
 
-    def ensure_commands_updated(self) -> bool:
+    @property
+    def pending_update(self) -> Optional[str]:
+        """
+        SHA of the downloaded commit the command set will be updated to by apply_updates, None if the command set
+        is up-to-date as far as we know.
+        """
+        if self.repository is None:
+            return None
+        record: Optional[dict] = self.profile.database(DB_COMMAND_SET_UPDATES_CHECK).get(self.name, None)
+        if not record or record.get("remote_sha") in [None, record["sha"]]:
+            return None
+        return record["remote_sha"]
+
+    def prepare_updates(self) -> Optional[str]:
+        """
+        Checks out the commit downloaded by check_for_updates as a new revision of the command set (see
+        CommandSetRevisions) and compiles it. Processes using the command set do not see the new revision until
+        it is activated by apply_updates. Returns the path to the new revision, None if there is nothing to
+        prepare or another process is preparing it.
+        """
+        sha: Optional[str] = self.pending_update
+        if sha is None or self.revisions is None:
+            return None
+        if self.revisions.contains(sha):
+            return self.revisions.path(sha)
+        path: Optional[str] = self.revisions.prepare(sha)
+        if path is not None:
+            # compile the new code so that the first run does not have to
+            try:
+                compile_bytecode(sys.executable, path, self.profile.pycache_path)
+            except Exception as e:
+                logger.warning(f"Could not compile the command set '{self.name}': {e}")
+        return path
+
+    def apply_updates(self) -> bool:
+        """
+        Makes the revision with the commit downloaded by check_for_updates the current one, preparing it first
+        if needed. Returns whether the command set was updated.
+        """
+        if self.pending_update is None:
+            return False
+        try:
+            with self._lock.acquire(timeout=CMDS_UPDATE_LOCK_WAIT_SECS):
+                # another process might have applied the updates while we were waiting for it
+                self.profile.database(DB_COMMAND_SET_UPDATES_CHECK).reload()
+                sha: Optional[str] = self.pending_update
+                if sha is None:
+                    return False
+                logger.info(f"Updating the command set '{self.name}' to {sha[:8]}...")
+                if self.prepare_updates() is None:
+                    return False
+                self.revisions.activate(sha)
+                # mark as updated
+                self.mark_as_just_updated(sha)
+        except Timeout:
+            logger.info(f"The command set '{self.name}' is being updated by another process")
+            return False
+        logger.info(f"Command set '{self.name}' successfully updated!")
+        # move this process to the new revision
+        self._use_revision(sha)
+        # refresh commands
+        self.refresh()
+        return True
+
+    def _use_revision(self, sha: str):
+        from .finder import CommandSetFinder
+        # the import finder is bound to the path of the command set
+        finder: CommandSetFinder = CommandSetFinder.get(self)
+        installed: bool = finder.installed
+        finder.uninstall()
+        self.revisions.use(sha)
+        self.path = self.revisions.path(sha)
+        if installed:
+            CommandSetFinder.get(self).install()
+
+    def mark_as_just_updated(self, sha: Optional[str] = None):
+        db = self.profile.database(DB_COMMAND_SET_UPDATES_CHECK)
+        # the history of the remote is kept, it drives the interval between checks (see _record_check)
+        record: dict = db.get(self.name, None) or {}
+        record.update({"sha": sha or self.local_sha, "remote_sha": None, "time": time.time()})
+        db.set(self.name, record)
+
+    def ensure_commands_updated(self, force: bool = False) -> bool:
         # make sure the commands directory exists
         if not os.path.exists(self.path) and os.path.isdir(self.path):
             raise RuntimeError(f"There is no existing commands directory in '{self.path}'.")
@@ -570,34 +807,9 @@ class CommandSet:
 
         # Check for shell commands repo updates
         logger.debug(f"Checking for updates for the command set '{self.name}'...")
-        if self.commands_need_update():
-            logger.info(f"The command set '{self.name}' has available updates. Attempting to pull them.")
-            wait_on_retry_secs = 4
-            th = {2: "nd", 3: "rd", 4: "th"}
-            for trial in range(3):
-                try:
-                    run_cmd(["git", "-C", self.path, "fetch", "origin", self.repository.branch])
-                    run_cmd(["git", "-C", self.path, "reset", "--hard", f"origin/{self.repository.branch}"])
-                    run_cmd(["git", "-C", self.path, "pull", "--recurse-submodules", "origin",
-                             self.repository.branch])
-                    logger.info(f"Command set '{self.name}' successfully updated!")
-                except RuntimeError:
-                    if DTShellConstants.VERBOSE:
-                        traceback.print_exc()
-                    logger.warning(
-                        f"An error occurred while pulling the updated commands. In {wait_on_retry_secs} "
-                        f"seconds we will retry for the {trial + 2}-{th[trial + 2]} time"
-                    )
-                    time.sleep(wait_on_retry_secs)
-                else:
-                    break
-            run_cmd(["git", "-C", self.path, "submodule", "update"])
-            # mark as updated
-            self.mark_as_just_updated()
-            # refresh commands
-            self.refresh()
-            # ---
-            return True
+        if self.commands_need_update(force):
+            logger.info(f"The command set '{self.name}' has available updates. Attempting to apply them.")
+            return self.apply_updates()
         else:
             logger.debug(f"Command set '{self.name}' is up-to-date.")
             # ---
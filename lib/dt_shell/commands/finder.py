@@ -0,0 +1,192 @@
+import os
+import sys
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from importlib.machinery import ModuleSpec, PathFinder, FileFinder, SourceFileLoader, SourcelessFileLoader, \
+    ExtensionFileLoader, SOURCE_SUFFIXES, BYTECODE_SUFFIXES, EXTENSION_SUFFIXES
+from importlib.util import spec_from_file_location
+from typing import Dict, List, Optional, Set, Iterator, Sequence
+
+from .. import logger
+from ..constants import DTShellConstants
+
+
+class CommandSetFinder(MetaPathFinder):
+    """
+    Import finder resolving the top-level packages of a command set (e.g., 'devel', 'utils') without adding
+    the command set to PYTHONPATH. The content of the command set directories is listed only once, imports
+    of modules that do not belong to the command set are rejected with a single lookup in memory.
+    """
+
+    _finders: Dict[str, 'CommandSetFinder'] = {}
+    # where the bytecode of the command sets goes (see enable_bytecode_cache())
+    bytecode_cache: Optional[str] = None
+
+    def __init__(self, name: str, roots: List[str]):
+        self.name: str = name
+        # roots are given in order of priority
+        self.roots: List[str] = roots
+        self._listings: Optional[Dict[str, Set[str]]] = None
+
+    @classmethod
+    def get(cls, command_set) -> 'CommandSetFinder':
+        path: str = os.path.abspath(command_set.path)
+        if path not in cls._finders:
+            cls._finders[path] = CommandSetFinder(command_set.name, [os.path.join(path, "lib"), path])
+        return cls._finders[path]
+
+    @classmethod
+    def enable_bytecode_cache(cls, path: str):
+        """
+        Keeps the bytecode of the modules of all the command sets in the given directory instead of next to their
+        sources (e.g., read-only checkouts). Unlike PYTHONPYCACHEPREFIX, other modules are not affected.
+        """
+        cls.bytecode_cache = path
+        if _path_hook not in sys.path_hooks:
+            sys.path_hooks.insert(0, _path_hook)
+        # directories looked at already have a regular finder
+        for entry in list(sys.path_importer_cache):
+            if cls.within(entry):
+                del sys.path_importer_cache[entry]
+
+    @classmethod
+    def within(cls, path: str) -> bool:
+        """
+        Tells whether the given path is inside any of the command sets we know about.
+        """
+        path = os.path.abspath(path)
+        return any(os.path.commonpath([path, root]) == root for root in cls._finders)
+
+    @property
+    def installed(self) -> bool:
+        return self in sys.meta_path
+
+    def install(self):
+        """
+        Registers this finder for the rest of the session. Command sets installed last take priority over the
+        ones installed before them, and all of them take priority over the regular PYTHONPATH.
+        """
+        if self.bytecode_cache is not None:
+            for entry in list(sys.path_importer_cache):
+                if any(os.path.commonpath([os.path.abspath(entry), root]) == root for root in self.roots):
+                    del sys.path_importer_cache[entry]
+        if self.installed:
+            sys.meta_path.remove(self)
+        sys.meta_path.insert(self._position(), self)
+        if DTShellConstants.VERBOSE:
+            logger.debug(f"Import finder for command set '{self.name}' installed for {self.roots}")
+
+    def uninstall(self):
+        if self.installed:
+            sys.meta_path.remove(self)
+
+    @contextmanager
+    def activated(self) -> Iterator['CommandSetFinder']:
+        """
+        Makes the command set importable for the duration of the context, unless it is already installed.
+        """
+        if self.installed:
+            yield self
+            return
+        self.install()
+        try:
+            yield self
+        finally:
+            self.uninstall()
+
+    def owns(self, name: str) -> bool:
+        """
+        Tells whether the top-level package/module with the given name belongs to this command set.
+        """
+        return any(self._owner(name, root) for root in self.roots)
+
+    def claim(self, name: str):
+        """
+        Makes sure that the top-level package with the given name is imported from this command set. Python looks
+        at the modules imported already before asking any finder, a module with the same name imported from
+        somewhere else (e.g., 'code' from the standard library) is forgotten.
+        """
+        module = sys.modules.get(name, None)
+        if module is None or not self.owns(name):
+            return
+        locations: List[str] = list(getattr(module, "__path__", None) or []) or \
+            [f for f in [getattr(module, "__file__", None)] if f]
+        if any(os.path.commonpath([os.path.abspath(loc), root]) == root for loc in locations for root in self.roots):
+            return
+        if DTShellConstants.VERBOSE:
+            logger.debug(f"Module '{name}' ({module}) is shadowed by the command set '{self.name}'")
+        del sys.modules[name]
+
+    def find_spec(self, fullname: str, path: Optional[Sequence[str]] = None, target=None) -> Optional[ModuleSpec]:
+        # sub-modules are found through the __path__ of their parent package
+        if path is not None or "." in fullname:
+            return None
+        for root in self.roots:
+            if self._owner(fullname, root):
+                return PathFinder.find_spec(fullname, [root], target)
+        return None
+
+    def invalidate_caches(self):
+        self._listings = None
+
+    def _owner(self, name: str, root: str) -> bool:
+        listing: Set[str] = self._listing(root)
+        return name in listing or f"{name}.py" in listing
+
+    def _listing(self, root: str) -> Set[str]:
+        if self._listings is None:
+            self._listings = {}
+        if root not in self._listings:
+            try:
+                self._listings[root] = set(os.listdir(root))
+            except (FileNotFoundError, NotADirectoryError):
+                self._listings[root] = set()
+        return self._listings[root]
+
+    @staticmethod
+    def _position() -> int:
+        # right before the finders of other command sets or, if none, the regular PYTHONPATH finder
+        for i, finder in enumerate(sys.meta_path):
+            if isinstance(finder, CommandSetFinder) or finder is PathFinder:
+                return i
+        return len(sys.meta_path)
+
+
+class CachedSourceFileLoader(SourceFileLoader):
+    """
+    Loader of the sources of command sets, their bytecode is read from and written to the bytecode cache of the
+    command sets (see CommandSetFinder.enable_bytecode_cache()), where the shell compiles them ahead of time.
+    """
+
+    def get_data(self, path: str) -> bytes:
+        return super(CachedSourceFileLoader, self).get_data(_cached(path))
+
+    def set_data(self, path: str, data: bytes, *, _mode=0o666):
+        super(CachedSourceFileLoader, self).set_data(_cached(path), data, _mode=_mode)
+
+
+def command_set_spec(name: str, location: str, **kwargs) -> Optional[ModuleSpec]:
+    """
+    Same as importlib.util.spec_from_file_location() for files of command sets, uses the bytecode cache if any.
+    """
+    if CommandSetFinder.bytecode_cache is not None and location.endswith(tuple(SOURCE_SUFFIXES)):
+        kwargs["loader"] = CachedSourceFileLoader(name, location)
+    return spec_from_file_location(name, location, **kwargs)
+
+
+def _cached(path: str) -> str:
+    # where the bytecode python looks for next to the sources (i.e., '<dir>/__pycache__/<file>.pyc') is in the cache
+    head, tail = os.path.split(path)
+    if CommandSetFinder.bytecode_cache is None or os.path.basename(head) != "__pycache__":
+        return path
+    sources: str = os.path.abspath(os.path.dirname(head))
+    # same layout as PYTHONPYCACHEPREFIX, what compileall writes (see compile_bytecode())
+    return os.path.join(CommandSetFinder.bytecode_cache, sources.lstrip(os.path.sep), tail)
+
+
+def _path_hook(path: str) -> FileFinder:
+    # directories of command sets get a finder using our loader, everything else the regular one
+    if CommandSetFinder.bytecode_cache is None or not CommandSetFinder.within(path):
+        raise ImportError("not a directory of a command set")
+    return FileFinder(path, (ExtensionFileLoader, EXTENSION_SUFFIXES), (CachedSourceFileLoader, SOURCE_SUFFIXES),
+                      (SourcelessFileLoader, BYTECODE_SUFFIXES))
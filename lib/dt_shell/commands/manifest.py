@@ -0,0 +1,231 @@
+import argparse
+import dataclasses
+import hashlib
+import importlib
+import json
+import os
+from typing import Optional, Dict, List, Type, Any
+
+from .. import __version__, logger
+from ..constants import DTShellConstants
+from ..environments import ShellCommandEnvironmentAbs
+from ..utils import safe_pathname
+from .commands import CommandSet, DTCommandConfigurationAbs, default_command_configuration
+from .importer import import_configuration
+
+# bump this every time the format of the manifest changes
+MANIFEST_VERSION: int = 2
+
+def _jsonable(value: Any) -> bool:
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def environment_spec(environment: Optional[ShellCommandEnvironmentAbs]) -> Optional[dict]:
+    """
+    Turns an environment into a JSON-serializable specification.
+    Only environments defined by the shell library itself can be serialized.
+    """
+    if environment is None:
+        return {"class": None}
+    cls: type = environment.__class__
+    if not cls.__module__.startswith("dt_shell.") or not dataclasses.is_dataclass(environment):
+        return None
+    fields: dict = dataclasses.asdict(environment)
+    if not _jsonable(fields):
+        return None
+    return {"module": cls.__module__, "class": cls.__qualname__, "fields": fields}
+
+
+def environment_from_spec(spec: dict) -> Optional[ShellCommandEnvironmentAbs]:
+    if spec["class"] is None:
+        return None
+    module = importlib.import_module(spec["module"])
+    return getattr(module, spec["class"])(**spec["fields"])
+
+
+class ManifestCommandConfiguration(DTCommandConfigurationAbs):
+    """
+    Command configuration backed by a manifest entry instead of the command's own configuration.py file.
+    Argument parsers are not in the manifest (their defaults are often computed when they are built, e.g., from
+    the environment), the configuration.py file is imported the first time the parser is needed.
+    """
+    entry: dict = None
+    command_set: CommandSet = None
+    selector: str = None
+
+    @classmethod
+    def environment(cls, *args, **kwargs) -> Optional[ShellCommandEnvironmentAbs]:
+        return environment_from_spec(cls.entry["environment"])
+
+    @classmethod
+    def parser(cls, *args, **kwargs) -> Optional[argparse.ArgumentParser]:
+        return import_configuration(cls.command_set, cls.selector).parser(*args, **kwargs)
+
+    @classmethod
+    def aliases(cls) -> List[str]:
+        return list(cls.entry["aliases"])
+
+
+def git_head(path: str) -> Optional[str]:
+    """
+    Returns the SHA of the HEAD of the git repository at the given path without spawning git.
+    """
+    gitdir: str = os.path.join(path, ".git")
+    try:
+        # worktrees and submodules use a file pointing to the actual git directory
+        if os.path.isfile(gitdir):
+            with open(gitdir, "rt") as fin:
+                gitdir = os.path.join(path, fin.read().strip().split("gitdir:", 1)[1].strip())
+        with open(os.path.join(gitdir, "HEAD"), "rt") as fin:
+            head: str = fin.read().strip()
+        if not head.startswith("ref:"):
+            return head
+        ref: str = head.split(":", 1)[1].strip()
+        # worktrees keep their refs in the common git directory
+        commondir: str = gitdir
+        if os.path.isfile(os.path.join(gitdir, "commondir")):
+            with open(os.path.join(gitdir, "commondir"), "rt") as fin:
+                commondir = os.path.join(gitdir, fin.read().strip())
+        for d in [gitdir, commondir]:
+            ref_fpath: str = os.path.join(d, ref)
+            if os.path.isfile(ref_fpath):
+                with open(ref_fpath, "rt") as fin:
+                    return fin.read().strip()
+        # packed refs
+        with open(os.path.join(commondir, "packed-refs"), "rt") as fin:
+            for line in fin:
+                if line.rstrip().endswith(f" {ref}"):
+                    return line.split(" ", 1)[0]
+    except (OSError, IndexError):
+        pass
+    return None
+
+
+@dataclasses.dataclass
+class CommandSetManifest:
+    """
+    Persistent record of what the shell learns by importing the configuration.py files of a command set:
+    aliases and execution environment of every command.
+    The manifest is invalidated as soon as the git HEAD of the command set or any of its Python files changes.
+    """
+    command_set: CommandSet
+    fingerprint: str
+    commands: Dict[str, dict] = dataclasses.field(default_factory=dict)
+    fresh: bool = False
+    dirty: bool = False
+
+    @property
+    def path(self) -> str:
+        return self.location(self.command_set)
+
+    @staticmethod
+    def location(command_set: CommandSet) -> str:
+        return os.path.join(command_set.profile.path, "manifests", f"{safe_pathname(command_set.name)}.json")
+
+    @classmethod
+    def load(cls, command_set: CommandSet) -> 'CommandSetManifest':
+        fingerprint: str = cls.compute_fingerprint(command_set)
+        manifest_fpath: str = cls.location(command_set)
+        try:
+            with open(manifest_fpath, "rt") as fin:
+                content: dict = json.load(fin)
+            if content["version"] == MANIFEST_VERSION and content["fingerprint"] == fingerprint:
+                return CommandSetManifest(command_set, fingerprint, content["commands"], fresh=True)
+            if DTShellConstants.VERBOSE:
+                logger.debug(f"Manifest for command set '{command_set.name}' is outdated")
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError):
+            logger.debug(f"Manifest '{manifest_fpath}' is corrupted, it will be regenerated")
+        return CommandSetManifest(command_set, fingerprint)
+
+    @staticmethod
+    def compute_fingerprint(command_set: CommandSet) -> str:
+        h = hashlib.sha1()
+        h.update(f"{MANIFEST_VERSION}:{__version__}:{git_head(command_set.path)}".encode("utf-8"))
+        # uncommitted changes too, configuration files can import any other module of the command set
+        for root, dirs, files in os.walk(command_set.path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+            for fname in sorted(files):
+                if not fname.endswith(".py"):
+                    continue
+                fpath: str = os.path.join(root, fname)
+                try:
+                    stat: os.stat_result = os.stat(fpath)
+                except OSError:
+                    continue
+                h.update(f"{os.path.relpath(fpath, command_set.path)}:{stat.st_mtime_ns}:{stat.st_size}"
+                         .encode("utf-8"))
+        return h.hexdigest()
+
+    def contains(self, selector: str) -> bool:
+        return selector in self.commands
+
+    def configuration(self, selector: str) -> Optional[Type[DTCommandConfigurationAbs]]:
+        """
+        Returns a configuration class for the given command built from the manifest, None if the manifest
+        does not know about this command.
+        """
+        entry: Optional[dict] = self.commands.get(selector, None)
+        if entry is None:
+            return None
+        if entry.get("default", False):
+            return default_command_configuration.DTCommandConfiguration
+        name: str = f"ManifestCommandConfiguration[{self.command_set.name}:{selector}]"
+        # noinspection PyTypeChecker
+        return type(name, (ManifestCommandConfiguration,), {
+            "entry": entry, "command_set": self.command_set, "selector": selector
+        })
+
+    def record(self, selector: str, configuration: Type[DTCommandConfigurationAbs]):
+        """
+        Records what the given configuration class tells us about the given command.
+        """
+        if self.contains(selector):
+            return
+        entry: dict
+        if configuration is default_command_configuration.DTCommandConfiguration:
+            # the default configuration is also what we get when the configuration fails to load
+            configuration_fpath: str = os.path.join(self.command_set.command_path(selector), "configuration.py")
+            if os.path.exists(configuration_fpath):
+                return
+            entry = {"default": True}
+        else:
+            try:
+                entry = {
+                    "aliases": list(configuration.aliases()),
+                    "environment": environment_spec(configuration.environment()),
+                }
+            except Exception as e:
+                logger.debug(f"Command '{selector}' cannot be added to the manifest: {e}")
+                return
+            # things we cannot serialize remain out of the manifest
+            if entry["environment"] is None:
+                if DTShellConstants.VERBOSE:
+                    logger.debug(f"Command '{selector}' cannot be added to the manifest, its configuration "
+                                 f"is not serializable")
+                return
+        self.commands[selector] = entry
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty or self.command_set.profile.readonly:
+            return
+        manifest_fpath: str = self.path
+        tmp_fpath: str = f"{manifest_fpath}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(manifest_fpath), exist_ok=True)
+            with open(tmp_fpath, "wt") as fout:
+                json.dump({
+                    "version": MANIFEST_VERSION,
+                    "fingerprint": self.fingerprint,
+                    "commands": self.commands,
+                }, fout)
+            os.replace(tmp_fpath, manifest_fpath)
+            self.dirty = False
+        except OSError as e:
+            logger.debug(f"Could not write manifest '{manifest_fpath}': {e}")
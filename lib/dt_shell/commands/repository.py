@@ -1,15 +1,149 @@
 import json
 import os
+import re
+import shlex
+import signal
+import subprocess
+import time
 import traceback
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 from dt_shell_cli import logger
 from ..exceptions import RunCommandException
 from ..checks.version import get_url
-from ..constants import DEFAULT_COMMAND_SET_REPOSITORY, DTShellConstants
+from ..constants import DEFAULT_COMMAND_SET_REPOSITORY, DTShellConstants, DEFAULT_SSH_CONTROL_DIR, \
+    GIT_LS_REMOTE_TIMEOUT_SECS, SSH_CONTROL_PERSIST_SECS
 from ..utils import run_cmd, provider_username_project_from_git_url, indent_block
 
+# how command sets are cloned (see ShellProfileSettings.clone_mode)
+CLONE_MODE_FULL: str = "full"
+CLONE_MODE_BLOBLESS: str = "blobless"
+CLONE_MODE_SHALLOW: str = "shallow"
+CLONE_MODES: List[str] = [CLONE_MODE_FULL, CLONE_MODE_BLOBLESS, CLONE_MODE_SHALLOW]
+BLOBLESS_FILTER: str = "blob:none"
+
+# options given to `git clone` for each clone mode
+CLONE_OPTIONS: Dict[str, List[str]] = {
+    CLONE_MODE_FULL: [],
+    # all the history, file contents are downloaded only for the commits we check out
+    CLONE_MODE_BLOBLESS: [f"--filter={BLOBLESS_FILTER}"],
+    # only the tip of the branch (no history, tags are not available to tell the version)
+    CLONE_MODE_SHALLOW: ["--depth", "1", "--shallow-submodules"],
+}
+
+_RECEIVED_PATTERN = re.compile(r"Receiving objects:\s+100% \([^)]*\), ([\d.]+) (bytes|KiB|MiB|GiB)")
+_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+
+@dataclass
+class GitTransfer:
+    # bytes received from the remote, as reported by git
+    received: int = 0
+    duration: float = 0.0
+
+    def __add__(self, other: 'GitTransfer') -> 'GitTransfer':
+        return GitTransfer(self.received + other.received, self.duration + other.duration)
+
+    def __str__(self) -> str:
+        size: float = self.received
+        for unit in ["B", "KB", "MB"]:
+            if size < 1024:
+                return f"{size:.1f}{unit} in {self.duration:.1f}s"
+            size /= 1024
+        return f"{size:.1f}GB in {self.duration:.1f}s"
+
+
+def is_shallow(path: str) -> bool:
+    """
+    Tells whether the git repository at the given path was cloned with a limited depth.
+    """
+    return os.path.isfile(os.path.join(path, ".git", "shallow"))
+
+
+def is_blobless(path: str) -> bool:
+    """
+    Tells whether the git repository at the given path downloads the contents of files only when needed.
+    """
+    partial: Optional[str] = run_cmd(["git", "-C", path, "config", "--get", "extensions.partialClone"],
+                                     suppress_errors=True)
+    return bool(partial and partial.strip())
+
+
+def git_environment(interactive: bool = True) -> Dict[str, str]:
+    """
+    Environment for git commands talking to remotes. SSH connections are shared through a master connection that
+    outlives the commands for a while, so that consecutive commands talking to the same host skip the SSH
+    handshake. When not interactive (e.g., in the background), git and SSH fail instead of asking for credentials
+    or passphrases.
+    """
+    env: Dict[str, str] = {**os.environ, "LC_ALL": "C"}
+    if not interactive:
+        env["GIT_TERMINAL_PROMPT"] = "0"
+    # respect custom SSH setups
+    if "GIT_SSH_COMMAND" not in env and "GIT_SSH" not in env:
+        control_dir: str = os.environ.get("DTSHELL_SSH_CONTROL", DEFAULT_SSH_CONTROL_DIR)
+        os.makedirs(control_dir, mode=0o700, exist_ok=True)
+        ssh: List[str] = [
+            "ssh",
+            "-o ControlMaster=auto",
+            f"-o ControlPath={shlex.quote(os.path.join(control_dir, '%C'))}",
+            f"-o ControlPersist={SSH_CONTROL_PERSIST_SECS}",
+        ]
+        if not interactive:
+            ssh.insert(1, "-o BatchMode=yes")
+        env["GIT_SSH_COMMAND"] = " ".join(ssh)
+    return env
+
+
+def git_ls_remote(url: str, branch: str, timeout: float = GIT_LS_REMOTE_TIMEOUT_SECS) -> Optional[str]:
+    """
+    Asks the remote at the given URL for the SHA of the tip of the given branch. Works with any provider and
+    protocol (including SSH). Returns None if the remote cannot be reached within the given time, if it refuses
+    us or if the branch does not exist.
+    """
+    cmd: List[str] = ["git", "ls-remote", "--exit-code", url, f"refs/heads/{branch}"]
+    logger.debug("$ %s" % cmd)
+    # git runs in its own process group so that the transport (e.g., ssh) is stopped with it
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                            env=git_environment(interactive=False), start_new_session=True)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.communicate()
+        logger.warning(f"The remote '{url}' did not answer within {timeout}s")
+        return None
+    if proc.returncode != 0:
+        logger.warning(f"Could not fetch the remote SHA of the branch '{branch}' from '{url}'")
+        logger.debug(stderr.decode("utf-8", errors="replace"))
+        return None
+    line: str = stdout.decode("utf-8", errors="replace").strip()
+    return line.split()[0] if line else None
+
+
+def git_transfer(cmd: List[str]) -> GitTransfer:
+    """
+    Runs a git command talking to a remote (e.g., clone, fetch) and returns how much it downloaded and how long
+    it took. Git can ask the user for credentials unless running in the background. Raises RunCommandException
+    if the command fails.
+    """
+    logger.debug("$ %s" % cmd)
+    stime: float = time.time()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          env=git_environment(interactive=not DTShellConstants.BACKGROUND), stdin=subprocess.DEVNULL)
+    stdout: str = proc.stdout.decode("utf-8", errors="replace")
+    stderr: str = proc.stderr.decode("utf-8", errors="replace")
+    if proc.returncode != 0:
+        msg = "The command %r failed with exit code %d.\nError:\n%s\nOutput:\n%s\n" % (
+            cmd, proc.returncode, indent_block(stderr), indent_block(stdout))
+        raise RunCommandException(msg, proc.returncode, stdout, stderr)
+    # progress lines are overwritten with carriage returns, the last one of each transfer has the total
+    received: int = sum(
+        int(float(value) * _UNITS[unit]) for value, unit in _RECEIVED_PATTERN.findall(stderr)
+    )
+    return GitTransfer(received=received, duration=time.time() - stime)
+
 
 @dataclass
 class CommandsRepository:
@@ -60,33 +194,34 @@ class CommandsRepository:
         )
 
     def remote_sha(self) -> Optional[str]:
+        # the GitHub API does not work with SSH (e.g., private repositories) nor with other providers
+        if self.use_ssh or self.provider != "github.com":
+            logger.info(f"Fetching remote SHA from {self.provider} ...")
+            return git_ls_remote(self.remoteurl, self.branch)
         # Get the remote sha from GitHub
         logger.info("Fetching remote SHA from github.com ...")
-        if self.use_ssh:
-            logger.warning(f"Command set '{self.username}/{self.project}' is using SSH. Cannot fetch remote SHA.")
-            return None
-        else:
-            remote_url: str = self.apiurl_with_branch
-            # contact github
-            try:
-                content = get_url(remote_url)
-            except Exception:
-                if DTShellConstants.VERBOSE:
-                    traceback.print_exc()
-                logger.debug(f"URL called: {remote_url}")
-                logger.warning(f"An error occurred while fetching the remote SHA for repository {self.remoteurl}")
-                return None
-            # parse output
-            try:
-                data = json.loads(content)
-                return data["commit"]["sha"]
-            except Exception:
-                if DTShellConstants.VERBOSE:
-                    traceback.print_exc()
-                logger.debug(f"URL called: {remote_url}\n"
-                             f"Object returned by github:\n\n{indent_block(content)}")
-                logger.warning(f"An error occurred while fetching the remote SHA for repository {self.remoteurl}")
-                return None
+        remote_url: str = self.apiurl_with_branch
+        # contact github
+        try:
+            content = get_url(remote_url)
+        except Exception:
+            if DTShellConstants.VERBOSE:
+                traceback.print_exc()
+            logger.debug(f"URL called: {remote_url}")
+            logger.warning(f"An error occurred while fetching the remote SHA for repository {self.remoteurl}")
+            # e.g., API rate limits, git itself might still get through
+            return git_ls_remote(self.remoteurl, self.branch)
+        # parse output
+        try:
+            data = json.loads(content)
+            return data["commit"]["sha"]
+        except Exception:
+            if DTShellConstants.VERBOSE:
+                traceback.print_exc()
+            logger.debug(f"URL called: {remote_url}\n"
+                         f"Object returned by github:\n\n{indent_block(content)}")
+            logger.warning(f"An error occurred while fetching the remote SHA for repository {self.remoteurl}")
+            return git_ls_remote(self.remoteurl, self.branch)
 
     @classmethod
     def given_distro(cls, distro: str) -> 'CommandsRepository':
@@ -0,0 +1,162 @@
+import fcntl
+import os
+import shutil
+from typing import Optional, Dict, IO, List
+
+from .repository import GitTransfer, git_transfer, is_shallow
+from .. import logger
+from ..constants import GIT_SUBMODULE_JOBS
+from ..utils import run_cmd
+
+# name of the symlink pointing to the revision new processes use
+CURRENT: str = "current"
+
+
+class CommandSetRevisions:
+    """
+    Immutable checkouts of a command set, one per commit, stored as git worktrees of the repository the command
+    set was cloned into. The symlink 'current' points to the revision new processes use. Updates are checked
+    out next to it and activated by replacing the symlink, processes that are running keep using the revision
+    they started with. Each process holds a shared lock on the revision it uses, revisions nobody holds a lock
+    on (other than the current one) are garbage.
+    """
+
+    # locks held by this process on the revisions it uses, they are released when the process ends
+    _in_use: Dict[str, IO] = {}
+
+    def __init__(self, repository: str):
+        self.repository: str = os.path.abspath(repository)
+        self.location: str = os.path.join(os.path.dirname(self.repository), ".revisions",
+                                          os.path.basename(self.repository))
+
+    @property
+    def current(self) -> Optional[str]:
+        """
+        SHA of the current revision, None if the command set was never updated through revisions.
+        """
+        try:
+            return os.path.basename(os.readlink(self.current_link))
+        except OSError:
+            return None
+
+    @property
+    def current_link(self) -> str:
+        return os.path.join(self.location, CURRENT)
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.location, sha)
+
+    def contains(self, sha: str) -> bool:
+        # revisions are complete only once they are marked as such
+        return os.path.isfile(self._marker(sha))
+
+    def revisions(self) -> List[str]:
+        if not os.path.isdir(self.location):
+            return []
+        return sorted(
+            name for name in os.listdir(self.location)
+            if name != CURRENT and os.path.isdir(self.path(name)) and not os.path.islink(self.path(name))
+        )
+
+    def use(self, sha: str) -> bool:
+        """
+        Marks the given revision as used by this process until the process ends. Returns False if the revision
+        does not exist (anymore).
+        """
+        fpath: str = self._lock(sha)
+        if fpath not in self._in_use:
+            os.makedirs(self.location, exist_ok=True)
+            fd: IO = open(fpath, "a")
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            self._in_use[fpath] = fd
+        # the revision might have been removed between the time we found it and the time we locked it
+        return self.contains(sha)
+
+    def use_current(self) -> Optional[str]:
+        """
+        Marks the current revision as used by this process and returns its SHA, None if there is no current
+        revision.
+        """
+        for _ in range(3):
+            sha: Optional[str] = self.current
+            if sha is None or self.use(sha):
+                return sha
+        return None
+
+    def prepare(self, sha: str) -> Optional[str]:
+        """
+        Checks out the given commit (including its submodules) as a new revision. Returns its path, None if
+        another process is preparing the same revision right now.
+        """
+        destination: str = self.path(sha)
+        if self.contains(sha):
+            return destination
+        os.makedirs(self.location, exist_ok=True)
+        with open(self._lock(sha), "a") as fd:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"Revision {sha[:8]} of '{self.repository}' is being prepared by another process")
+                return None
+            # leftovers of interrupted attempts
+            self._remove(sha)
+            logger.info(f"Preparing revision {sha[:8]} of '{self.repository}'...")
+            transfer: GitTransfer = git_transfer(
+                ["git", "-C", self.repository, "worktree", "add", "--detach", "--force", destination, sha]
+            )
+            # submodules are fetched in parallel, as deep as the repository they belong to
+            depth: List[str] = ["--depth", "1"] if is_shallow(self.repository) else []
+            transfer += git_transfer(
+                ["git", "-C", destination, "submodule", "update", "--init", "--recursive", "--progress",
+                 f"--jobs={GIT_SUBMODULE_JOBS}"] + depth
+            )
+            logger.info(f"Revision {sha[:8]} of '{self.repository}' prepared ({transfer})")
+            # mark as complete
+            with open(self._marker(sha), "wt"):
+                pass
+        return destination
+
+    def activate(self, sha: str):
+        """
+        Makes the given (prepared) revision the current one.
+        """
+        if not self.contains(sha):
+            raise RuntimeError(f"Revision {sha[:8]} of '{self.repository}' was not prepared")
+        tmp: str = f"{self.current_link}.{os.getpid()}.tmp"
+        os.symlink(sha, tmp)
+        os.replace(tmp, self.current_link)
+        logger.debug(f"Revision {sha[:8]} of '{self.repository}' is now the current one")
+
+    def garbage_collect(self) -> List[str]:
+        """
+        Removes the revisions that are not current and that no process uses. Returns the SHAs of the removed
+        revisions.
+        """
+        current: Optional[str] = self.current
+        removed: List[str] = []
+        for sha in self.revisions():
+            if sha == current or self._lock(sha) in self._in_use:
+                continue
+            with open(self._lock(sha), "a") as fd:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                logger.debug(f"Removing unused revision {sha[:8]} of '{self.repository}'")
+                self._remove(sha)
+                os.remove(self._lock(sha))
+            removed.append(sha)
+        return removed
+
+    def _remove(self, sha: str):
+        # git refuses to remove worktrees with submodules, we remove them ourselves and let git prune them
+        if os.path.exists(self._marker(sha)):
+            os.remove(self._marker(sha))
+        shutil.rmtree(self.path(sha), ignore_errors=True)
+        run_cmd(["git", "-C", self.repository, "worktree", "prune"], suppress_errors=True)
+
+    def _marker(self, sha: str) -> str:
+        return os.path.join(self.location, f".{sha}.ready")
+
+    def _lock(self, sha: str) -> str:
+        return os.path.join(self.location, f".{sha}.lock")
@@ -0,0 +1,265 @@
+import dataclasses
+import os
+import sys
+import traceback
+from typing import Dict, Optional, Type, List, Iterator, Mapping, Union
+
+from .. import logger
+from ..constants import IGNORE_ENVIRONMENTS
+from ..environments import ShellCommandEnvironmentAbs, DEFAULT_COMMAND_ENVIRONMENT
+from ..exceptions import UserError, UserAborted, CommandsLoadingException
+from ..utils import indent_block
+from .commands import CommandSet, CommandDescriptor, DTCommandAbs, DTCommandPlaceholder, \
+    DTCommandConfigurationAbs
+from .finder import CommandSetFinder
+from .importer import import_command, import_configuration
+from .manifest import CommandSetManifest
+
+
+@dataclasses.dataclass(eq=False)
+class CommandNode:
+    """
+    Lightweight record of a command in the tree of commands.
+    The class object representing the command (and its argument parser) is only created the first time
+    it is needed.
+    """
+    name: str
+    level: int
+    selector: str
+    command_set: CommandSet
+    skeleton: bool
+    descriptor: Optional[CommandDescriptor] = None
+    children: Dict[str, 'CommandNode'] = dataclasses.field(default_factory=dict)
+    manifest: Optional[CommandSetManifest] = None
+    # lazily populated
+    _configuration: Optional[Type[DTCommandConfigurationAbs]] = None
+    _klass: Optional[Type[DTCommandAbs]] = None
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.descriptor is not None
+
+    @property
+    def package(self) -> str:
+        return self.selector[:-len(self.name)]
+
+    @property
+    def configuration(self) -> Type[DTCommandConfigurationAbs]:
+        if self._configuration is None:
+            # in skeleton mode we can trust the manifest instead of importing the configuration
+            if self.skeleton and self.manifest is not None:
+                self._configuration = self.manifest.configuration(self.selector)
+            if self._configuration is None:
+                self._configuration = import_configuration(self.command_set, self.selector)
+                if self.manifest is not None:
+                    self.manifest.record(self.selector, self._configuration)
+        return self._configuration
+
+    @property
+    def known_configuration(self) -> Optional[Type[DTCommandConfigurationAbs]]:
+        """
+        Configuration of the command if known already (loaded or in the manifest), it is never imported here.
+        """
+        if self._configuration is None and self.manifest is not None:
+            return self.manifest.configuration(self.selector)
+        return self._configuration
+
+    @property
+    def aliases(self) -> List[str]:
+        return self.configuration.aliases()
+
+    @property
+    def environment(self) -> Optional[ShellCommandEnvironmentAbs]:
+        return self._environment(self.configuration) if self.is_leaf else None
+
+    @property
+    def known_environment(self) -> Optional[ShellCommandEnvironmentAbs]:
+        """
+        Environment of the command if known without importing its configuration, None otherwise.
+        """
+        if not self.is_leaf:
+            return None
+        configuration: Optional[Type[DTCommandConfigurationAbs]] = self.known_configuration
+        return self._environment(configuration) if configuration is not None else None
+
+    def _environment(self, configuration: Type[DTCommandConfigurationAbs]) -> ShellCommandEnvironmentAbs:
+        # if we ignore environments, we assume default global environment for every command
+        if IGNORE_ENVIRONMENTS:
+            return DEFAULT_COMMAND_ENVIRONMENT
+        # figure out the environment for this command
+        environment: Optional[ShellCommandEnvironmentAbs] = configuration.environment()
+        if environment is None:
+            # revert to command set's default environment
+            environment = self.command_set.configuration.default_environment()
+        if environment is None:
+            # use default environment
+            environment = DEFAULT_COMMAND_ENVIRONMENT
+        return environment
+
+    @property
+    def materialized(self) -> bool:
+        return self._klass is not None
+
+    @property
+    def klass(self) -> Type[DTCommandAbs]:
+        if self._klass is None:
+            self._klass = self._materialize()
+        return self._klass
+
+    def walk(self) -> Iterator['CommandNode']:
+        yield self
+        for child in self.children.values():
+            yield from child.walk()
+
+    def _materialize(self) -> Type[DTCommandAbs]:
+        configuration: Type[DTCommandConfigurationAbs] = self.configuration
+        # make a new (temporary) class
+        klass: Type[DTCommandAbs] = type(self.name, (DTCommandPlaceholder,), {})
+
+        if self.is_leaf:
+            descriptor: CommandDescriptor = self.descriptor
+            command_set: CommandSet = self.command_set
+
+            # load command configuration
+            descriptor.configuration = configuration
+
+            # add environment to command's descriptor
+            descriptor.environment = self.environment
+
+            # import class only if this is the environment in which the commands will run
+            if not self.skeleton:
+                try:
+                    klass = import_command(command_set, descriptor.path)
+                except UserError:
+                    raise
+                except (UserAborted, KeyboardInterrupt):
+                    raise
+                except ModuleNotFoundError as e:
+                    msg = f"The command '{self.selector.replace('.', '/')}' could not be imported.\n\n" \
+                          f"ModuleNotFoundError: {e}" \
+                          f"\n\n{self._import_details()}\n\n" \
+                          f"{traceback.format_exc()}"
+                    self._fail(msg)
+                except BaseException:
+                    se = traceback.format_exc()
+                    msg = (
+                        f"Cannot load command class {descriptor.selector}.command.DTCommand "
+                        f"(package={self.package}, command={self.name}):\n\n{se}"
+                    )
+                    self._fail(msg)
+
+            # link descriptor <-> command
+            descriptor.command = klass
+            klass.descriptor = descriptor
+
+        # give command its own info
+        klass.name = self.name
+        klass.level = self.level
+        klass.parser = LazyParser(self)
+        klass.commands = CommandNodesMap(self.children)
+        return klass
+
+    def _import_details(self) -> str:
+        lines: List[str] = []
+        cs_path: str = os.path.abspath(os.path.realpath(self.command_set.path))
+        # check import finder
+        finder: CommandSetFinder = CommandSetFinder.get(self.command_set)
+        lines += [f"\t- finder[{self.command_set.name}] installed: {finder.installed}; roots: {finder.roots}"]
+        top: str = self.selector.split(".")[0]
+        lines += [f"\t- package[{top}] owned by command set: {finder.owns(top)}"]
+        # module already loaded?
+        m: str = ""
+        for p in self.selector.split("."):
+            m = f"{m}.{p}".lstrip(".")
+            mod = sys.modules.get(m, None)
+            if mod:
+                lines.append(f"\t- module[{m}] already loaded: True; {dir(mod)}")
+            else:
+                lines.append(f"\t- module[{m}] already loaded: False")
+        # check all __init__ files
+        fpath: str = os.path.join(cs_path)
+        for p in self.selector.split("."):
+            fpath = os.path.join(fpath, p)
+            init_fpath = os.path.join(fpath, "__init__.py")
+            lines.append(f"\t- file[{init_fpath}] exists: {os.path.isfile(init_fpath)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _fail(msg: str):
+        sep = "-" * 128
+        logger.error(
+            f"\n\n\n!   Could not load command. Detailed error message is printed below.\n" +
+            indent_block(f"\n\n{sep}\n\n\n{msg}\n\n{sep}\n\n") +
+            f"\n\n!   Could not load command. Detailed error message is printed above.\n\n"
+        )
+        raise CommandsLoadingException("The command could not be loaded. Detailed error messages are "
+                                       "reported above.")
+
+
+class LazyParser:
+    """
+    Class attribute that creates the argument parser of a command the first time it is accessed.
+    """
+
+    def __init__(self, node: CommandNode):
+        self._node: CommandNode = node
+
+    def __get__(self, instance, owner):
+        parser = self._node.configuration.parser()
+        # replace ourselves with the actual parser
+        setattr(owner, "parser", parser)
+        return parser
+
+
+class CommandNodesMap(Mapping):
+    """
+    Read-only map from command names to command classes, classes are materialized on access.
+    """
+
+    def __init__(self, nodes: Dict[str, CommandNode]):
+        self._nodes: Dict[str, CommandNode] = nodes
+
+    def __getitem__(self, name: str) -> Type[DTCommandAbs]:
+        return self._nodes[name].klass
+
+    def __contains__(self, name) -> bool:
+        return name in self._nodes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def resolve(self, word: str) -> Optional[Type[DTCommandAbs]]:
+        """
+        Returns the command with the given name or alias, None if not found.
+        """
+        if word in self._nodes:
+            return self._nodes[word].klass
+        # aliases come from the configurations, no need to materialize the other commands
+        for node in self._nodes.values():
+            if word in node.aliases:
+                return node.klass
+        return None
+
+
+class CommandsNamespace:
+    """
+    Namespace exposing the tree of commands as attributes (e.g., `shell.include.devel.build`).
+    Later trees override earlier ones, the same way later command sets override earlier ones.
+    """
+
+    def __init__(self, trees: List[Dict[str, CommandNode]]):
+        self._trees: List[Dict[str, CommandNode]] = trees
+
+    def __getattr__(self, name: str) -> Union['CommandsNamespace', Type[DTCommandAbs]]:
+        matches: List[CommandNode] = [tree[name] for tree in self._trees if name in tree]
+        if not matches:
+            raise AttributeError(name)
+        if matches[-1].is_leaf:
+            return matches[-1].klass
+        return CommandsNamespace([node.children for node in matches if not node.is_leaf])
+
+    def __dir__(self) -> List[str]:
+        return sorted({name for tree in self._trees for name in tree})
@@ -42,15 +42,34 @@ class DTShellConstants:
     DEBUG: bool = False
     VERBOSE: bool = False
     QUIET: bool = False
+    # non-interactive mode, skips cosmetic and periodic steps and never prompts (see `--lean`)
+    LEAN: bool = False
+    # set in processes running in the background (e.g., the refresher), nobody is there to answer prompts
+    BACKGROUND: bool = False
 
 
 # commands update
-CHECK_CMDS_UPDATE_MINS = 5
+CHECK_CMDS_UPDATE_MINS = 5   # shortest interval between checks for updates of a command set
+CHECK_CMDS_UPDATE_MAX_MINS = 60 * 24   # longest one, reached by command sets that do not change
+CHECK_CMDS_CHANGES_HISTORY = 5   # changes of the remote remembered per command set
+CHECK_SHELL_UPDATE_MINS = 10
+CMDS_UPDATE_LOCK_WAIT_SECS = 5   # how long to wait for another process checking/updating the same command set
+GIT_SUBMODULE_JOBS = 8   # submodules of command sets are fetched in parallel
+GIT_LS_REMOTE_TIMEOUT_SECS = 20   # remotes that do not answer within this time are considered unreachable
+SSH_CONTROL_PERSIST_SECS = 60 * 10   # SSH connections to git remotes are kept open (and reused) this long
 CHECK_BILLBOARD_UPDATE_SECS = 60 * 60 * 24   # every 24 hours
 PUSH_USER_EVENTS_TO_HUB_SECS = 60 * 60 * 1   # every 1 hour
+SESSION_TASKS_SECS = 60   # interactive sessions run their background tasks at most every minute
+
+# interactive sessions
+SESSION_HISTORY_LENGTH = 1000
 
 SHELL_LIB_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_PROFILES_DIR = os.path.join(DEFAULT_ROOT, "profiles")
+DEFAULT_VENVS_DIR = os.path.join(DEFAULT_ROOT, "venvs")
+DEFAULT_WHEELHOUSE_DIR = os.path.join(DEFAULT_ROOT, "wheelhouse")
+DEFAULT_MIRRORS_DIR = os.path.join(DEFAULT_ROOT, "mirrors")
+DEFAULT_SSH_CONTROL_DIR = os.path.join(DEFAULT_ROOT, "ssh")
 
 IGNORE_ENVIRONMENTS: bool = os.environ.get("IGNORE_ENVIRONMENTS", "0").lower() in ["1", "y", "yes"]
 
@@ -120,3 +139,14 @@ DB_MIGRATIONS: str = "migrations"
 DB_UPDATES_CHECK: str = "updates_check"
 DB_BILLBOARDS: str = "billboards"
 DB_STATISTICS_EVENTS: str = "stats_events"
+DB_VIRTUAL_ENVIRONMENTS: str = "virtual_environments"
+DB_BASH_COMPLETION_INSTALL: str = "bash-completion-install"
+DB_PYPI_CACHE: str = "pypi_cache"
+DB_GIT_MIRRORS: str = "git_mirrors"
+
+# small databases holding one-time and periodic markers, they share a single file per location (see DTShellState)
+STATE_DATABASES: List[str] = [
+    DB_MIGRATIONS, DB_BASH_COMPLETION_INSTALL, DB_UPDATES_CHECK, DB_COMMAND_SET_UPDATES_CHECK,
+    DB_INSTALLED_DEPENDENCIES, DB_PYPI_CACHE, DB_GIT_MIRRORS,
+]
+STATE_FILE: str = "state.json"
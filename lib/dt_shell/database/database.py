@@ -1,13 +1,16 @@
 import copy
+import json
 import os.path
 from abc import abstractmethod, ABC
 from contextlib import contextmanager
 from threading import Semaphore
-from typing import Union, TypeVar, Generic, Tuple, Optional, Dict, Iterator, ContextManager
+from typing import Union, TypeVar, Generic, Tuple, Optional, Dict, Iterator, ContextManager, Iterable, \
+    Callable
 
 import yaml
 from filelock import FileLock, Timeout
 
+from ..constants import STATE_DATABASES, STATE_FILE
 from ..exceptions import ConfigInvalid
 from ..utils import safe_pathname
 
@@ -43,6 +46,75 @@ SerializableValue = Union[SerializedValue, DTSerializable]
 SerializableTypes = (SerializedValue, *NATURALLY_SERIALIZABLE)
 
 
+class DTShellState:
+    """
+    Single file holding the content of many small databases (see STATE_DATABASES) stored in the same location.
+    The file is read once, changes are applied (under a file lock) to what is on disk at the time of writing so
+    that processes writing the same or different databases at the same time do not overwrite each other.
+    """
+
+    _instances: Dict[str, 'DTShellState'] = {}
+
+    def __init__(self, location: str):
+        self.path: str = os.path.abspath(os.path.join(location, STATE_FILE))
+        self._lock: FileLock = FileLock(f"{self.path}.lock", timeout=10)
+        self._sections: Dict[str, dict] = self._read()
+
+    @classmethod
+    def get(cls, location: str) -> 'DTShellState':
+        location = os.path.abspath(location)
+        if location not in cls._instances:
+            cls._instances[location] = DTShellState(location)
+        return cls._instances[location]
+
+    def section(self, name: str) -> Optional[dict]:
+        return self._sections.get(name, None)
+
+    def reload(self):
+        self._sections = self._read()
+
+    def write(self, name: str, data: dict):
+        """
+        Replaces the content of the given section.
+        """
+        self._modify(name, lambda _: data)
+
+    def merge(self, name: str, changed: dict, deleted: Iterable[str] = ()) -> dict:
+        """
+        Applies the given changes to the given section as it is on disk right now, changes made by other processes
+        to other records of the same section are kept. Returns the new content of the section.
+        """
+        return self._modify(name, lambda current: {
+            **{k: v for k, v in current.items() if k not in deleted}, **changed
+        })
+
+    def _modify(self, name: str, change: Callable[[dict], dict]) -> dict:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            with self._lock:
+                # other processes might have changed the file in the meantime
+                self._sections = self._read()
+                self._sections[name] = change(self._sections.get(name, None) or {})
+                tmp_fpath: str = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_fpath, "wt") as fout:
+                    json.dump({"version": 1, "sections": self._sections}, fout)
+                os.replace(tmp_fpath, self.path)
+                return self._sections[name]
+        except Timeout:
+            raise TimeoutError(f"Could not acquire lock for '{self.path}'. "
+                               f"If this happens often, delete the file {self.path}.lock")
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "rt") as fin:
+                return json.load(fin)["sections"]
+        except FileNotFoundError:
+            return {}
+        except (ValueError, KeyError, TypeError):
+            # these are only markers and caches, we can start over
+            return {}
+
+
 class DTShellDatabase(Generic[T]):
 
     _instances: Dict[Tuple[str, str], 'DTShellDatabase'] = {}
@@ -60,6 +132,7 @@ class DTShellDatabase(Generic[T]):
         self._lock: Semaphore = Semaphore()
         self._atomic: FileLock = FileLock(f"{self.yaml}.lock", timeout=10)
         self._in_memory: bool = False
+        self._state: Optional[DTShellState] = None
         # ---
         raise RuntimeError(f'Call {self.__class__.__name__}.open() instead')
 
@@ -80,6 +153,7 @@ class DTShellDatabase(Generic[T]):
             inst._lock = Semaphore()
             inst._atomic = FileLock(f"{inst.yaml}.lock", timeout=10)
             inst._in_memory = False
+            inst._state = DTShellState.get(location) if name in STATE_DATABASES else None
             # set custom init args
             for k, v in (init_args or {}).items():
                 setattr(inst, k, v)
@@ -101,6 +175,13 @@ class DTShellDatabase(Generic[T]):
         # ---
         return yaml_fpath
 
+    @property
+    def fpath(self) -> str:
+        """
+        Path to the file holding the content of this database.
+        """
+        return self._state.path if self._state is not None else self.yaml
+
     @contextmanager
     def in_memory(self) -> ContextManager:
         # code to acquire resource
@@ -140,7 +221,7 @@ class DTShellDatabase(Generic[T]):
         # persistent data
         with self._lock:
             self._data.pop(key, None)
-        self._write()
+        self._write(deleted=[key])
 
     def set(self, key: Key, value: T):
         key = self._key(key)
@@ -152,7 +233,7 @@ class DTShellDatabase(Generic[T]):
                 self._data[key] = value
                 self._ephemeral.pop(key, None)
             # ---
-        self._write()
+        self._write(changed={} if self._in_memory else {key: value})
 
     def keys(self) -> Iterator[Key]:
         with self._lock:
@@ -169,6 +250,15 @@ class DTShellDatabase(Generic[T]):
             data: dict = copy.copy(self._data)
         return iter(data.items())
 
+    def reload(self):
+        """
+        Reads the database from disk again, e.g., after another process changed it.
+        """
+        with self._lock:
+            if self._state is not None:
+                self._state.reload()
+            self._load()
+
     def clear(self):
         """
         Removes all the records from the database.
@@ -181,9 +271,22 @@ class DTShellDatabase(Generic[T]):
         Update this database with the records from the given database.
         """
         self._data.update(d)
-        self._write()
+        self._write(changed=d)
 
     def _load(self):
+        if self._state is not None:
+            data: Optional[dict] = self._state.section(self._name)
+            if data is not None:
+                self._data = data
+                return
+            # carry over the content of the database from the time it had its own file
+            if os.path.isfile(self.yaml):
+                self._load_yaml()
+                self._write()
+            return
+        self._load_yaml()
+
+    def _load_yaml(self):
         if not self._readonly:
             # make files if they don't exist
             if not os.path.exists(self.yaml):
@@ -209,10 +312,18 @@ class DTShellDatabase(Generic[T]):
                 raise ConfigInvalid(f"Database file '{self.yaml}' is corrupted. Check with "
                                     f"technical support if it is ok to delete this file.")
 
-    def _write(self):
+    def _write(self, changed: Optional[dict] = None, deleted: Iterable[str] = ()):
         # skip writing to disk if in read-only mode
         if self._readonly:
             return
+        # databases in the state file only write their own section, the records that changed if we know which
+        if self._state is not None:
+            with self._lock:
+                if changed is None and not deleted:
+                    self._state.write(self._name, {**self._data})
+                else:
+                    self._data = {**self._state.merge(self._name, changed or {}, deleted)}
+            return
         # complete data with other metadata
         with self._lock:
             content = {**EMPTY_DB, "data": {**self._data}}
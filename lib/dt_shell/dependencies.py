@@ -0,0 +1,182 @@
+import glob
+import os
+import re
+import subprocess
+import tempfile
+import time
+from typing import List, Dict, Optional, Set
+
+from . import logger
+from .utils import pip_install, pip_resolve, pip_uninstall, BOOTSTRAP_DISTRIBUTIONS
+from .wheelhouse import normalize_name, installed_distributions
+
+
+def read_lock(fpath: str) -> Dict[str, str]:
+    """
+    Returns the pinned distributions (normalized name -> version) in the given lock file.
+    """
+    pins: Dict[str, str] = {}
+    if not os.path.isfile(fpath):
+        return pins
+    with open(fpath, "rt") as fin:
+        for line in fin:
+            line = line.strip()
+            if not line or line.startswith("#") or "==" not in line:
+                continue
+            name, _, version = line.partition("==")
+            pins[normalize_name(name)] = version
+    return pins
+
+
+def write_lock(fpath: str, venv_dir: str, requirements: List[str]) -> Dict[str, str]:
+    """
+    Records the distributions installed in the given virtual environment as a pip requirements file.
+    Returns the pinned distributions.
+    """
+    pins: Dict[str, str] = {
+        name: version for name, version in installed_distributions(venv_dir)
+        if name not in BOOTSTRAP_DISTRIBUTIONS
+    }
+    lines: List[str] = [
+        "# This file was generated by the Duckietown Shell, do not edit.",
+        f"# Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+        "# Resolved from:",
+        *[f"#   {os.path.abspath(r)}" for r in requirements],
+        *[f"{name}=={version}" for name, version in sorted(pins.items())],
+    ]
+    tmp_fpath: str = f"{fpath}.{os.getpid()}.tmp"
+    with open(tmp_fpath, "wt") as fout:
+        fout.write("\n".join(lines) + "\n")
+    os.replace(tmp_fpath, fpath)
+    return pins
+
+
+def install_dependencies(interpreter: str, venv_dir: str, requirements: List[str], prune: bool = True):
+    """
+    Installs the given dependencies lists in the given virtual environment as a single set.
+    The lists are resolved together first, then only the distributions that differ from what is installed
+    are (un)installed. Falls back to installing everything at once if pip cannot resolve without installing.
+
+    Args:
+        interpreter:    Interpreter of the virtual environment
+        venv_dir:       Path to the virtual environment
+        requirements:   Paths to the dependencies lists
+        prune:          Whether to uninstall the distributions that are no longer required
+    """
+    resolution: Optional[List[dict]] = pip_resolve(interpreter, requirements)
+    if resolution is None:
+        logger.debug("Could not resolve the dependencies in advance, installing all of them")
+        pip_install(interpreter, requirements)
+        return
+    # what we need
+    wanted: Dict[str, str] = {}
+    specs: Dict[str, str] = {}
+    for distribution in resolution:
+        name: str = normalize_name(distribution["metadata"]["name"])
+        wanted[name] = distribution["metadata"]["version"]
+        specs[name] = _requirement(distribution)
+    # what we have
+    installed: Dict[str, str] = dict(installed_distributions(venv_dir))
+    to_install: List[str] = [
+        name for name, version in wanted.items()
+        # distributions not coming from an index cannot be compared by version
+        if installed.get(name, None) != version or "==" not in specs[name]
+    ]
+    to_remove: List[str] = [
+        name for name in installed
+        if name not in wanted and name not in BOOTSTRAP_DISTRIBUTIONS
+    ] if prune else []
+    logger.debug(f"Dependencies: {len(to_install)} to install, {len(to_remove)} to remove, "
+                 f"{len(wanted) - len(to_install)} unchanged")
+    # remove what is not needed anymore
+    if to_remove:
+        logger.info(f"Removing {len(to_remove)} dependencies no longer needed...")
+        pip_uninstall(interpreter, to_remove)
+    # install what changed, the resolution is complete so we do not need pip to look at dependencies again
+    if to_install:
+        fd, fpath = tempfile.mkstemp(prefix="dts-requirements-", suffix=".txt")
+        with os.fdopen(fd, "wt") as fout:
+            fout.write("\n".join(specs[name] for name in to_install) + "\n")
+        try:
+            pip_install(interpreter, fpath, options=["--no-deps"])
+        finally:
+            os.remove(fpath)
+
+
+def requested_distributions(requirements: List[str]) -> Set[str]:
+    """
+    Returns the (normalized) names of the distributions listed in the given dependencies lists, including
+    the lists they refer to.
+    """
+    names: Set[str] = set()
+    for fpath in requirements:
+        with open(fpath, "rt") as fin:
+            for line in fin:
+                line = line.split("#", 1)[0].strip()
+                if line.startswith(("-r ", "--requirement ")):
+                    nested: str = os.path.join(os.path.dirname(fpath), line.split(None, 1)[1])
+                    names.update(requested_distributions([nested]))
+                    continue
+                match = re.match(r"^([A-Za-z0-9][A-Za-z0-9._-]*)", line)
+                if match:
+                    names.add(normalize_name(match.group(1)))
+    return names
+
+
+def smoke_test(interpreter: str, venv_dir: str, requirements: List[str]) -> bool:
+    """
+    Imports the top-level modules of the distributions listed in the given dependencies lists with the
+    interpreter of the given virtual environment. Returns whether all of them could be imported.
+    """
+    wanted: Set[str] = requested_distributions(requirements)
+    modules: Set[str] = set()
+    for dist_info in glob.glob(os.path.join(venv_dir, "lib", "python*", "site-packages", "*.dist-info")):
+        name: str = normalize_name(os.path.basename(dist_info).split("-", 1)[0])
+        top_level: str = os.path.join(dist_info, "top_level.txt")
+        if name not in wanted or not os.path.isfile(top_level):
+            continue
+        with open(top_level, "rt") as fin:
+            modules.update(m.strip().replace("/", ".") for m in fin if m.strip())
+    if not modules:
+        return True
+    logger.debug(f"Importing {sorted(modules)} in the virtual environment '{venv_dir}'...")
+    env: Dict[str, str] = {k: v for k, v in os.environ.items() if k not in ["PYTHONPATH", "PYTHONHOME"]}
+    try:
+        subprocess.check_output(
+            [interpreter, "-c", "import importlib, sys; [importlib.import_module(m) for m in sys.argv[1:]]",
+             *sorted(modules)],
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            env=env,
+        )
+    except subprocess.CalledProcessError as e:
+        logger.error(f"The virtual environment '{venv_dir}' failed the import test:\n"
+                     f"{e.output.decode('utf-8', errors='replace')}")
+        return False
+    return True
+
+
+def log_lock_changes(old: Dict[str, str], new: Dict[str, str]):
+    changes: List[str] = [
+        *[f"  + {name}=={new[name]}" for name in sorted(set(new) - set(old))],
+        *[f"  - {name}=={old[name]}" for name in sorted(set(old) - set(new))],
+        *[f"  ~ {name}: {old[name]} -> {new[name]}"
+          for name in sorted(set(old) & set(new)) if old[name] != new[name]],
+    ]
+    if changes:
+        logger.info("Dependencies changed:\n" + "\n".join(changes))
+
+
+def _requirement(distribution: dict) -> str:
+    # see https://pip.pypa.io/en/stable/reference/installation-report/
+    name: str = distribution["metadata"]["name"]
+    info: dict = distribution.get("download_info", {})
+    url: str = info.get("url", "")
+    if "vcs_info" in info:
+        vcs: dict = info["vcs_info"]
+        return f"{name} @ {vcs['vcs']}+{url}@{vcs['commit_id']}"
+    if "dir_info" in info:
+        return f"{name} @ {url}"
+    if distribution.get("is_direct", False):
+        return f"{name} @ {url}"
+    return f"{name}=={distribution['metadata']['version']}"
@@ -0,0 +1,27 @@
+import argparse
+from typing import List
+
+from dt_shell import DTCommandAbs, DTShell, UserError
+from dt_shell.fanout import FanOut
+
+
+class DTCommand(DTCommandAbs):
+    help = "Runs the same command against many targets (e.g., robots) in parallel, " \
+           "e.g., dts fanout -j 8 --targets robots.txt -- duckiebot dashboard {target}"
+
+    @staticmethod
+    def command(shell: DTShell, args: List[str]):
+        parsed: argparse.Namespace = DTCommand.parser.parse_args(args)
+        # ---
+        command: List[str] = parsed.command[1:] if parsed.command[:1] == ["--"] else parsed.command
+        if not command:
+            raise UserError("You need to give a command to run, e.g., "
+                            "dts fanout --targets robots.txt -- duckiebot dashboard {target}")
+        targets: List[str] = FanOut.load_targets(parsed.targets)
+        failed: int = FanOut(shell, command, targets, jobs=parsed.jobs).run()
+        if failed:
+            exit(1)
+
+    @staticmethod
+    def complete(shell: DTShell, word: str, line: str) -> List[str]:
+        return []
@@ -0,0 +1,29 @@
+import argparse
+from typing import Optional, List
+
+from dt_shell.commands import DTCommandConfigurationAbs
+
+
+class DTCommandConfiguration(DTCommandConfigurationAbs):
+
+    @classmethod
+    def parser(cls, *args, **kwargs) -> Optional[argparse.ArgumentParser]:
+        """
+        The parser this command will use.
+        """
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-j', '--jobs', type=int, default=4,
+                            help='Number of targets to run the command against at the same time')
+        parser.add_argument('--targets', type=str, required=True,
+                            help="File containing the targets, one per line ('-' to read them from stdin)")
+        parser.add_argument('command', nargs=argparse.REMAINDER,
+                            help="Command to run, '{target}' is replaced with the target "
+                                 "(appended to the command if not given)")
+        return parser
+
+    @classmethod
+    def aliases(cls) -> List[str]:
+        """
+        Alternative names for this command.
+        """
+        return []
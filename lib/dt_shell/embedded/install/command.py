@@ -1,16 +1,39 @@
 import argparse
+import dataclasses
 import os
-from typing import List, cast, Optional
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List, cast, Optional, Dict
 
 import requests
+from termcolor import colored
 
-from dt_shell import DTCommandAbs, DTShell, dtslogger, RunCommandException
+from dt_shell import DTCommandAbs, DTShell, dtslogger, RunCommandException, UserError
 from dt_shell.commands import CommandSet
 from dt_shell.commands.repository import CommandsRepository
 from dt_shell.constants import DB_USER_COMMAND_SETS_REPOSITORIES
 from dt_shell.database import DTShellDatabase
+from dt_shell.logging import dts_print
 from dt_shell.utils import run_cmd
 
+# the SSH setup is checked once per run, no matter how many private repositories we install
+_ssh_checked: Dict[str, bool] = {}
+_ssh_lock: Lock = Lock()
+
+
+@dataclasses.dataclass
+class InstallEntry:
+    repository: str
+    branch: str
+    url: Optional[str] = None
+    command_set: Optional[CommandSet] = None
+    status: str = "PENDING"
+    message: str = ""
+    duration: float = 0.0
+
 
 class DTCommand(DTCommandAbs):
     help = "Installs a new command set."
@@ -19,28 +42,67 @@ class DTCommand(DTCommandAbs):
     def command(shell: DTShell, args: List[str]):
         parsed: argparse.Namespace = DTCommand.parser.parse_args(args)
         # ---
+        if parsed.manifest is not None:
+            if parsed.repository is not None:
+                raise UserError("Give either a repository or a manifest, not both.")
+            entries: List[InstallEntry] = DTCommand.load_manifest(parsed.manifest)
+            if not DTCommand.install_many(shell, entries, jobs=parsed.jobs):
+                sys.exit(1)
+            return
+        if parsed.repository is None:
+            raise UserError("You need to give a repository to install (or a manifest, see --manifest).")
+        # ---
+        try:
+            url: str = DTCommand.resolve(parsed.repository, parsed.branch)
+        except UserError as e:
+            dtslogger.error(str(e))
+            return
+        # ---
+        # define command set properties
+        cs: CommandSet = DTCommand.make_command_set(shell, url, parsed.branch)
+        # open the database
+        db: DTShellDatabase[dict] = shell.profile.database(DB_USER_COMMAND_SETS_REPOSITORIES)
+        # make sure the command set is not already installed
+        if db.contains(cs.name):
+            dtslogger.info(f"Command set '{cs.name}' is already installed.")
+            return
+        # install command set
+        dtslogger.info(f"Downloading command set '{cs.name}'...")
+        cs.ensure_commands_exist()
+        # add commands to the list of user command sets
+        dtslogger.debug(f"Adding command set '{cs.name}' to the list of user command sets.")
+        db.set(cs.name, cs.repository.as_dict())
+        # done
+        dtslogger.info(f"Command set '{cs.name}' installed successfully.")
+
+    @staticmethod
+    def resolve(repository: str, branch: str) -> str:
+        """
+        Turns what the user gave us into the URL of the repository, public repositories are preferred.
+        Raises UserError if the repository is private and SSH is not configured properly.
+        """
         url: Optional[str] = None
         # sanitize the repository URL
-        parsed.repository = parsed.repository.strip("/")
-        if parsed.repository.endswith(".git"):
-            parsed.repository = parsed.repository[:-4]
+        repository = repository.strip("/")
+        if repository.endswith(".git"):
+            repository = repository[:-4]
         # - public URL
-        if ":" not in parsed.repository:
-            dtslogger.debug(f"Checking if '{parsed.repository}' is a public repository.")
+        if ":" not in repository:
+            dtslogger.debug(f"Checking if '{repository}' is a public repository.")
             # assume the URL is fully qualified
-            public_url = parsed.repository
+            public_url = repository
             # add the protocol if missing
-            if cast(str, parsed.repository).count("/") == 2:
+            if cast(str, repository).count("/") == 2:
                 # matches the pattern "server/owner/repo"
                 public_url = f"https://{public_url}"
             # default to github.com
             if not public_url.startswith('http'):
-                public_url = f"https://github.com/{parsed.repository}"
+                public_url = f"https://github.com/{repository}"
             # ---
             url = public_url
             dtslogger.debug(f"Assuming the URL is the following: {url}")
             # try to reach the repository at the public URL
-            repo: CommandsRepository = CommandsRepository.from_remoteurl(url, parsed.branch)
+            repo: CommandsRepository = CommandsRepository.from_remoteurl(url, branch)
             try:
                 dtslogger.debug(f"> HEAD {repo.apiurl}")
                 requests.head(repo.apiurl, timeout=5).raise_for_status()
@@ -49,58 +111,167 @@ class DTCommand(DTCommandAbs):
                 dtslogger.info(f"Repository not found at {public_url}. Assuming it is a private repository.")
                 url = None
 
-        if ":" in parsed.repository or url is None:
+        if ":" in repository or url is None:
             # assume the URL is a private repository
-            dtslogger.debug(f"Assuming '{parsed.repository}' is a private repository.")
+            dtslogger.debug(f"Assuming '{repository}' is a private repository.")
             # - private URL
-            private_url = parsed.repository
+            private_url = repository
             # add the protocol if missing
-            if ":" in parsed.repository:
+            if ":" in repository:
                 if not private_url.startswith('git@'):
                     private_url = f"git@{private_url}"
             else:
-                private_url = f"git@github.com:{parsed.repository}"
+                private_url = f"git@github.com:{repository}"
             # ---
             url = private_url
             dtslogger.debug(f"Assuming the URL is the following: {url}")
             # check if SSH is configured properly
-            dtslogger.debug("Checking if SSH is configured properly.")
-            try:
-                cmd = ["ssh", "-T", "git@github.com"]
-                dtslogger.debug(f"$ {' '.join(cmd)}")
-                run_cmd(cmd)
-            except RunCommandException as e:
-                if e.exit_code == 1 and "successfully" in e.stderr.lower():
-                    dtslogger.info("SSH communication with GitHub is successful.")
-                else:
-                    dtslogger.error("SSH is not configured properly. The command 'ssh -T git@github.com' fails.")
-                    return
-        # ---
-        # define command set properties
-        repository: CommandsRepository = CommandsRepository.from_remoteurl(url, parsed.branch)
+            if not DTCommand.check_ssh():
+                raise UserError("SSH is not configured properly. The command 'ssh -T git@github.com' fails.")
+        return url
+
+    @staticmethod
+    def check_ssh() -> bool:
+        host: str = "git@github.com"
+        with _ssh_lock:
+            if host not in _ssh_checked:
+                dtslogger.debug("Checking if SSH is configured properly.")
+                try:
+                    cmd = ["ssh", "-T", host]
+                    dtslogger.debug(f"$ {' '.join(cmd)}")
+                    run_cmd(cmd)
+                    _ssh_checked[host] = True
+                except RunCommandException as e:
+                    _ssh_checked[host] = e.exit_code == 1 and "successfully" in e.stderr.lower()
+                    if _ssh_checked[host]:
+                        dtslogger.info("SSH communication with GitHub is successful.")
+            return _ssh_checked[host]
+
+    @staticmethod
+    def make_command_set(shell: DTShell, url: str, branch: str) -> CommandSet:
+        repository: CommandsRepository = CommandsRepository.from_remoteurl(url, branch)
         name: str = f"{repository.username}__{repository.project}"
         path: str = os.path.join(shell.profile.path, "commands", name)
         # create command set
-        cs: CommandSet = CommandSet(
+        return CommandSet(
             name=name,
             path=path,
             profile=shell.profile,
             repository=repository,
         )
-        # open the database
+
+    @staticmethod
+    def load_manifest(fpath: str) -> List[InstallEntry]:
+        """
+        Reads the command sets to install from the given file, one per line in the same format the command takes
+        them, i.e., '<repository> [<branch>]'. Empty lines and lines starting with '#' are ignored.
+        """
+        fin = sys.stdin if fpath == "-" else open(fpath, "rt")
+        try:
+            lines: List[str] = [line.strip() for line in fin]
+        finally:
+            if fin is not sys.stdin:
+                fin.close()
+        entries: List[InstallEntry] = []
+        for i, line in enumerate(lines):
+            if not line or line.startswith("#"):
+                continue
+            words: List[str] = line.split()
+            if len(words) > 2:
+                raise UserError(f"Invalid line {i + 1} in the manifest '{fpath}': {line}\n"
+                                f"Expected format: <repository> [<branch>]")
+            entries.append(InstallEntry(repository=words[0], branch=words[1] if len(words) > 1 else "main"))
+        return entries
+
+    @staticmethod
+    def install_many(shell: DTShell, entries: List[InstallEntry], jobs: int = 4) -> bool:
+        """
+        Installs many command sets at once. Repositories are resolved and downloaded in parallel, the list of
+        user command sets is written once at the end. Returns whether all the command sets were installed.
+        """
         db: DTShellDatabase[dict] = shell.profile.database(DB_USER_COMMAND_SETS_REPOSITORIES)
-        # make sure the command set is not already installed
-        if db.contains(cs.name):
-            dtslogger.info(f"Command set '{cs.name}' is already installed.")
-            return
-        # install command set
-        dtslogger.info(f"Downloading command set '{cs.name}'...")
-        cs.ensure_commands_exist()
-        # add commands to the list of user command sets
-        dtslogger.debug(f"Adding command set '{cs.name}' to the list of user command sets.")
-        db.set(cs.name, cs.repository.as_dict())
-        # done
-        dtslogger.info(f"Command set '{cs.name}' installed successfully.")
+        jobs = max(1, jobs)
+        # resolve all the repositories first, mistakes in the manifest show up before we download anything
+        dtslogger.info(f"Resolving {len(entries)} repositories...")
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(DTCommand._resolve_entry, entries))
+        names: List[str] = []
+        for entry in entries:
+            if entry.status != "PENDING":
+                continue
+            entry.command_set = DTCommand.make_command_set(shell, entry.url, entry.branch)
+            if db.contains(entry.command_set.name):
+                entry.status, entry.message = "SKIPPED", "already installed"
+            elif entry.command_set.name in names:
+                entry.status, entry.message = "SKIPPED", "duplicate"
+            names.append(entry.command_set.name)
+        # download
+        to_download: List[InstallEntry] = [e for e in entries if e.status == "PENDING"]
+        dtslogger.info(f"Downloading {len(to_download)} command sets...")
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(DTCommand._download_entry, to_download))
+        # add the new command sets to the list of user command sets (all at once)
+        installed: Dict[str, dict] = {
+            e.command_set.name: e.command_set.repository.as_dict() for e in entries if e.status == "OK"
+        }
+        if installed:
+            dtslogger.debug(f"Adding {len(installed)} command sets to the list of user command sets.")
+            db.update(installed)
+        DTCommand._print_summary(entries)
+        return all(e.status != "FAILED" for e in entries)
+
+    @staticmethod
+    def _resolve_entry(entry: InstallEntry):
+        stime: float = time.time()
+        try:
+            entry.url = DTCommand.resolve(entry.repository, entry.branch)
+        except UserError as e:
+            entry.status, entry.message = "FAILED", str(e)
+        except Exception as e:
+            entry.status, entry.message = "FAILED", f"{e.__class__.__name__}: {e}"
+        entry.duration += time.time() - stime
+
+    @staticmethod
+    def _download_entry(entry: InstallEntry):
+        stime: float = time.time()
+        cs: CommandSet = entry.command_set
+        try:
+            dtslogger.info(f"Downloading command set '{cs.name}'...")
+            # leftovers of previous attempts are reused, unless they are broken (e.g., an interrupted clone)
+            if os.path.isdir(cs.repository_path) and not DTCommand._is_valid_clone(cs):
+                dtslogger.info(f"Removing the incomplete clone of the command set '{cs.name}'...")
+                shutil.rmtree(cs.repository_path)
+            if os.path.isdir(cs.repository_path) or cs.download():
+                entry.status = "OK"
+            else:
+                entry.status, entry.message = "FAILED", f"could not clone {cs.repository.remoteurl}"
+        except Exception as e:
+            entry.status, entry.message = "FAILED", f"{e.__class__.__name__}: {e}"
+        entry.duration += time.time() - stime
+
+    @staticmethod
+    def _is_valid_clone(cs: CommandSet) -> bool:
+        # without its own .git, git would look at the repositories containing this directory
+        if not os.path.exists(os.path.join(cs.repository_path, ".git")):
+            return False
+        try:
+            run_cmd(["git", "-C", cs.repository_path, "rev-parse", "--verify", "--quiet", "HEAD"])
+            return True
+        except RunCommandException:
+            return False
+
+    @staticmethod
+    def _print_summary(entries: List[InstallEntry]):
+        colors: Dict[str, str] = {"OK": "green", "SKIPPED": "yellow", "FAILED": "red"}
+        width: int = max([len(e.repository) for e in entries] + [len("repository")])
+        rows: List[str] = [f"{'repository':<{width}}  {'branch':<10}  {'status':<7}  {'time':>8}  details"]
+        for e in entries:
+            status: str = colored(f"{e.status:<7}", colors.get(e.status, None))
+            message: str = e.message.splitlines()[0] if e.message else ""
+            rows.append(f"{e.repository:<{width}}  {e.branch:<10}  {status}  {e.duration:>7.2f}s  {message}")
+        failed: int = len([e for e in entries if e.status == "FAILED"])
+        dts_print(f"Installed {len([e for e in entries if e.status == 'OK'])} of {len(entries)} command sets, "
+                  f"{failed} failed:\n\n" + "\n".join(rows) + "\n")
 
     @staticmethod
     def complete(shell: DTShell, word: str, line: str) -> List[str]:
@@ -20,9 +20,15 @@ class DTCommandConfiguration(DTCommandConfigurationAbs):
         The parser this command will use.
         """
         parser = argparse.ArgumentParser()
-        parser.add_argument('repository', help='The repository containing the command set to install. '
-                                               'Format: "[server/]owner/repo" or a fully qualified URL.')
+        parser.add_argument('repository', nargs='?', default=None,
+                            help='The repository containing the command set to install. '
+                                 'Format: "[server/]owner/repo" or a fully qualified URL.')
         parser.add_argument('branch', nargs='?', default='main', help='The branch to install. (default: main)')
+        parser.add_argument('--manifest', type=str, default=None,
+                            help="File listing the command sets to install, one '<repository> [<branch>]' per line "
+                                 "('-' to read them from stdin)")
+        parser.add_argument('-j', '--jobs', type=int, default=4,
+                            help='Number of command sets to download at the same time (with --manifest)')
         return parser
 
     @classmethod
@@ -1,25 +1,47 @@
+import os
+import shutil
 import sys
 from typing import Optional, List
 
 from dt_shell import DTCommandAbs, DTShell, dtslogger
-from dt_shell.constants import SHELL_REQUIREMENTS_LIST
 from dt_shell.database.utils import InstalledDependenciesDatabase
-from dt_shell.utils import pip_install
+from dt_shell.dependencies import install_dependencies, write_lock
+from dt_shell.environments import VirtualPython3Environment
+from dt_shell.venvs import VirtualEnvironmentsPool
 
 
 class DTCommand(DTCommandAbs):
 
     @staticmethod
     def command(shell: DTShell, args: List[str]):
-        # install dependencies
-        cache: InstalledDependenciesDatabase = InstalledDependenciesDatabase.load(shell.profile)
-        # - shell
-        dtslogger.info("Installing shell dependencies...")
-        pip_install(sys.executable, SHELL_REQUIREMENTS_LIST)
-        cache.mark_as_installed(SHELL_REQUIREMENTS_LIST)
-        # - command sets
-        for cs in shell.command_sets:
-            requirements_list: Optional[str] = cs.configuration.requirements()
-            dtslogger.info(f"Installing dependencies for command set '{cs.name}'...")
-            pip_install(sys.executable, requirements_list)
-            cache.mark_as_installed(requirements_list)
+        pool: VirtualEnvironmentsPool = VirtualEnvironmentsPool()
+        key: Optional[str] = pool.key_of(shell.profile)
+        # shell and command sets are resolved together
+        requirements: List[str] = VirtualPython3Environment.requirements(shell)
+        if key is None:
+            # the environment belongs to this profile (or to the user, see DTSHELL_VENV_DIR)
+            venv_dir: str = os.environ.get("DTSHELL_VENV_DIR", None) or sys.prefix
+            cache: InstalledDependenciesDatabase = InstalledDependenciesDatabase.load(shell.profile)
+            dtslogger.info("Installing dependencies for the shell and the command sets...")
+            install_dependencies(os.path.join(venv_dir, "bin", "python3"), venv_dir, requirements,
+                                 prune=not os.environ.get("DTSHELL_VENV_DIR", None))
+            for requirements_list in requirements:
+                cache.mark_as_installed(requirements_list)
+        else:
+            # environments in the pool are shared with other profiles, we never change them in place, a new one
+            # is built from scratch and swapped in
+            key = pool.key(requirements)
+            venv_dir: str = pool.path(key)
+            tmp_key: str = f"{key}.{os.getpid()}.tmp"
+            with pool.lock(key):
+                dtslogger.info("Building a new virtual environment for the shell and the command sets...")
+                try:
+                    VirtualPython3Environment.build(pool.path(tmp_key), requirements, pool.dependencies(tmp_key))
+                except BaseException:
+                    shutil.rmtree(pool.path(tmp_key), ignore_errors=True)
+                    raise
+                pool.replace(key, tmp_key)
+            pool.assign(shell.profile, key)
+        # keep track of what is installed in the profile
+        write_lock(shell.profile.requirements_lock, venv_dir, requirements)
+        dtslogger.info("Dependencies reinstalled successfully.")
@@ -70,6 +70,8 @@ class DTCommand(DTCommandAbs):
                 continue
             # update command set
             cs.update()
+            # compile it so that the first command does not have to (only what changed is compiled)
+            cs.precompile()
         logger.setLevel(logging.WARNING)
 
     @staticmethod
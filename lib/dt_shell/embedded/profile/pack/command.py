@@ -0,0 +1,31 @@
+import argparse
+import os
+from typing import List
+
+from dt_shell import DTCommandAbs, DTShell, dtslogger
+from dt_shell.packing import ProfilePack, default_fpath
+
+
+class DTCommand(DTCommandAbs):
+    help = 'Packs the current profile into a single archive that can be unpacked on other machines offline'
+
+    @staticmethod
+    def command(shell: DTShell, args: List[str]):
+        # parse arguments
+        parsed: argparse.Namespace = DTCommand.parser.parse_args(args)
+        # ---
+        fpath: str = parsed.output or default_fpath(shell.profile.name)
+        if parsed.secrets:
+            dtslogger.warning("The archive will contain the secrets of the profile, keep it safe.")
+        dtslogger.info(f"Packing the profile '{shell.profile.name}'...")
+        manifest: dict = ProfilePack(fpath).pack(shell.profile, secrets=parsed.secrets,
+                                                 dependencies=parsed.dependencies)
+        size: float = os.path.getsize(fpath) / 1024 ** 2
+        dtslogger.info(f"Profile packed in '{fpath}' ({size:.1f} MB) with {len(manifest['command_sets'])} "
+                       f"command set(s) and {len(manifest['wheels'])} wheel(s).\n"
+                       f"Unpack it on other machines with:\n\n"
+                       f"\t\tdts profile unpack {os.path.basename(fpath)}\n")
+
+    @staticmethod
+    def complete(shell: DTShell, word: str, line: str) -> List[str]:
+        return []
@@ -0,0 +1,23 @@
+import argparse
+from typing import Optional, List
+
+from dt_shell.commands import DTCommandConfigurationAbs
+
+
+class DTCommandConfiguration(DTCommandConfigurationAbs):
+
+    @classmethod
+    def parser(cls, **kwargs) -> Optional[argparse.ArgumentParser]:
+        parser: argparse.ArgumentParser = argparse.ArgumentParser()
+        parser.add_argument("-o", "--output", type=str, default=None,
+                            help="Archive to write (default: <profile>.dts-profile.tar.gz)")
+        parser.add_argument("--secrets", action="store_true", default=False,
+                            help="Include the secrets of the profile (e.g., tokens, registry credentials)")
+        parser.add_argument("--no-dependencies", dest="dependencies", action="store_false", default=True,
+                            help="Do not include the Python dependencies")
+        # ---
+        return parser
+
+    @classmethod
+    def aliases(cls) -> List[str]:
+        return []
@@ -0,0 +1,36 @@
+import argparse
+import os
+from typing import List
+
+from dt_shell import DTCommandAbs, DTShell, UserError, dtslogger
+from dt_shell.packing import ProfilePack
+from dt_shell.profile import ShellProfile
+
+
+class DTCommand(DTCommandAbs):
+    help = 'Sets up a profile from an archive made with `dts profile pack`'
+
+    @staticmethod
+    def command(shell: DTShell, args: List[str]):
+        # parse arguments
+        parsed: argparse.Namespace = DTCommand.parser.parse_args(args)
+        # ---
+        if not os.path.isfile(parsed.archive):
+            raise UserError(f"File '{parsed.archive}' not found")
+        pack: ProfilePack = ProfilePack(parsed.archive)
+        name: str = parsed.name or pack.manifest()["profile"]
+        if parsed.force and name == shell.profile.name:
+            raise UserError("The profile in use cannot be replaced, switch to another profile first.")
+        dtslogger.info(f"Unpacking the profile archive '{parsed.archive}'...")
+        profile: ShellProfile = pack.unpack(name=name, force=parsed.force)
+        dtslogger.info(f"Profile '{profile.name}' ready in '{profile.path}'.")
+        # set the new profile as the profile to load at the next launch
+        if parsed.switch:
+            shell.settings.profile = profile.name
+            dtslogger.info(f"Active profile is now set to '{profile.name}'")
+        else:
+            dtslogger.info(f"Use the following command to switch to it.\n\n\t\tdts profile switch {profile.name}\n")
+
+    @staticmethod
+    def complete(shell: DTShell, word: str, line: str) -> List[str]:
+        return []
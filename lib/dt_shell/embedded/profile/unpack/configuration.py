@@ -0,0 +1,24 @@
+import argparse
+from typing import Optional, List
+
+from dt_shell.commands import DTCommandConfigurationAbs
+
+
+class DTCommandConfiguration(DTCommandConfigurationAbs):
+
+    @classmethod
+    def parser(cls, **kwargs) -> Optional[argparse.ArgumentParser]:
+        parser: argparse.ArgumentParser = argparse.ArgumentParser()
+        parser.add_argument("archive", type=str, help="Archive made with 'dts profile pack'")
+        parser.add_argument("--name", type=str, default=None,
+                            help="Name of the new profile (default: the name of the packed profile)")
+        parser.add_argument("--force", action="store_true", default=False,
+                            help="Replace the profile with the same name, if any")
+        parser.add_argument("--switch", action="store_true", default=False,
+                            help="Switch to the new profile")
+        # ---
+        return parser
+
+    @classmethod
+    def aliases(cls) -> List[str]:
+        return []
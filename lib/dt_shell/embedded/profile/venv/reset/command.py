@@ -0,0 +1,70 @@
+import os.path
+import shutil
+from typing import List, Optional
+
+import questionary
+from filelock import Timeout
+
+from dt_shell import DTCommandAbs, DTShell, dtslogger
+from dt_shell.venvs import VirtualEnvironmentsPool
+
+
+class DTCommand(DTCommandAbs):
+    help = "Resets the current profile Python's virtual environment"
+
+    @staticmethod
+    def command(shell: DTShell, args: List[str]):
+        venv_path: str = os.path.join(shell.profile.path, "venv")
+        pool: VirtualEnvironmentsPool = VirtualEnvironmentsPool()
+        key: Optional[str] = pool.key_of(shell.profile)
+        # shared virtual environment, the other profiles get a new one as well
+        others: List[str] = [p for p in pool.references().get(key, []) if p != shell.profile.name] if key else []
+        # make sure the user known what is doing
+        dtslogger.warning(
+            "\n"
+            "---\n"
+            "\n"
+            "This operation will delete this profile's virtual environment.\n"
+            + (f"The environment is shared with the profiles {', '.join(others)}, it will be reset for them "
+               f"as well.\n" if others else "") +
+            "This is usually a safe operation as the environment will be recreated the next time the shell is run.\n"
+            "\n---"
+        )
+        proceed: bool = questionary.confirm("Do you want to continue?").ask()
+        # ---
+        if not proceed:
+            dtslogger.info("Operation aborted!")
+            return
+
+        # delete virtual environment
+        if key is not None:
+            # the environment is in the shared pool, leaving it there would give it back to us at the next run
+            try:
+                with pool.lock(key, timeout=0):
+                    dtslogger.info("Deleting virtual environment...")
+                    pool.remove(key)
+            except Timeout:
+                dtslogger.error("The virtual environment is being built by another process, try again later.")
+                return
+            pool.release(shell.profile)
+        elif os.path.islink(venv_path):
+            # environment outside the pool, not ours to delete
+            dtslogger.info("Detaching virtual environment from the profile...")
+            pool.release(shell.profile)
+        elif os.path.exists(venv_path):
+            dtslogger.info("Deleting virtual environment...")
+            dtslogger.debug(f"Removing path '{venv_path}'")
+            shutil.rmtree(venv_path)
+        else:
+            dtslogger.error(f"The virtual environment was expected to be found at '{venv_path}' but this path "
+                            f"does not exist. This should not have happened.")
+            return
+        # remove the virtual environments that are not used by any profile
+        removed: List[str] = pool.garbage_collect()
+        if removed:
+            dtslogger.info(f"Removed {len(removed)} virtual environment(s) no longer used by any profile.")
+        dtslogger.info("Virtual environment successfully reset.")
+
+    @staticmethod
+    def complete(shell: DTShell, word: str, line: str) -> List[str]:
+        return []
@@ -0,0 +1,23 @@
+import argparse
+from typing import List
+
+from dt_shell import DTCommandAbs, DTShell
+from dt_shell.session import InteractiveSession
+
+
+class DTCommand(DTCommandAbs):
+    help = "Starts an interactive session running commands one after the other on the same shell. " \
+           "Type 'reload' to pick up changes to the command sets, 'exit' to end the session."
+
+    @staticmethod
+    def command(shell: DTShell, args: List[str]):
+        parsed: argparse.Namespace = DTCommand.parser.parse_args(args)
+        # ---
+        session: InteractiveSession = InteractiveSession(shell, prompt=parsed.prompt)
+        exit_code: int = session.run()
+        if exit_code != 0:
+            exit(exit_code)
+
+    @staticmethod
+    def complete(shell: DTShell, word: str, line: str) -> List[str]:
+        return []
@@ -0,0 +1,24 @@
+import argparse
+from typing import Optional, List
+
+from dt_shell.commands import DTCommandConfigurationAbs
+
+
+class DTCommandConfiguration(DTCommandConfigurationAbs):
+
+    @classmethod
+    def parser(cls, *args, **kwargs) -> Optional[argparse.ArgumentParser]:
+        """
+        The parser this command will use.
+        """
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--prompt', type=str, default="dts> ",
+                            help='Prompt to show when waiting for a command')
+        return parser
+
+    @classmethod
+    def aliases(cls) -> List[str]:
+        """
+        Alternative names for this command.
+        """
+        return []
@@ -0,0 +1,42 @@
+import argparse
+from typing import List, Set, Optional
+
+from dt_shell import DTCommandAbs, DTShell, dtslogger
+from dt_shell.utils import wheelhouse_dir
+from dt_shell.venvs import VirtualEnvironmentsPool
+from dt_shell.wheelhouse import Distribution, installed_distributions, prune, size, wheels
+
+
+def _fmt_size(n: int) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if n < 1024:
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+class DTCommand(DTCommandAbs):
+    help = "Shows and prunes the local cache of Python wheels used to install the profiles' dependencies."
+
+    @staticmethod
+    def command(shell: DTShell, args: List[str]):
+        parsed: argparse.Namespace = DTCommand.parser.parse_args(args)
+        # ---
+        if parsed.prune:
+            keep: Optional[Set[Distribution]] = None
+            if not parsed.all:
+                # keep what is installed in the virtual environments still in use
+                keep = set()
+                for _, venv_dir in VirtualEnvironmentsPool().entries():
+                    keep.update(installed_distributions(venv_dir))
+            before: int = size()
+            removed: List[str] = prune(keep)
+            dtslogger.info(f"Removed {len(removed)} wheel(s), {_fmt_size(before - size())} freed.")
+        # report
+        print(f"Wheelhouse: {wheelhouse_dir()}\n"
+              f"Wheels:     {len(wheels())}\n"
+              f"Size:       {_fmt_size(size())}")
+
+    @staticmethod
+    def complete(shell: DTShell, word: str, line: str) -> List[str]:
+        return []
@@ -0,0 +1,26 @@
+import argparse
+from typing import Optional, List
+
+from dt_shell.commands import DTCommandConfigurationAbs
+
+
+class DTCommandConfiguration(DTCommandConfigurationAbs):
+
+    @classmethod
+    def parser(cls, *args, **kwargs) -> Optional[argparse.ArgumentParser]:
+        """
+        The parser this command will use.
+        """
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--prune', action='store_true', default=False,
+                            help='Remove the wheels not installed in any of the shared virtual environments')
+        parser.add_argument('--all', action='store_true', default=False,
+                            help='Used together with --prune, remove all the wheels')
+        return parser
+
+    @classmethod
+    def aliases(cls) -> List[str]:
+        """
+        Alternative names for this command.
+        """
+        return []
@@ -1,3 +1,4 @@
+import contextlib
 import dataclasses
 import os
 import subprocess
@@ -11,10 +12,14 @@ from typing import Optional, List, Dict
 from . import logger
 from .exceptions import ShellInitException, InvalidEnvironment, CommandsLoadingException, UserError, \
     UserAborted
-from .constants import SHELL_LIB_DIR, SHELL_REQUIREMENTS_LIST, DTShellConstants
+from .constants import SHELL_LIB_DIR, SHELL_REQUIREMENTS_LIST, DTShellConstants, DB_SETTINGS, DB_PROFILES, \
+    DB_USER_COMMAND_SETS_REPOSITORIES
 from .database.utils import InstalledDependenciesDatabase
+from .venvs import VirtualEnvironmentsPool
+from .dependencies import install_dependencies, read_lock, write_lock, log_lock_changes
 from .logging import dts_print
-from .utils import install_pip_tool, pip_install, replace_spaces, print_debug_info, pretty_json
+from .utils import install_pip_tool, replace_spaces, print_debug_info, pretty_json, \
+    compile_bytecode
 
 
 class ShellCommandEnvironmentAbs(metaclass=ABCMeta):
@@ -32,6 +37,15 @@ class Python3Environment(ShellCommandEnvironmentAbs):
     """
 
     def execute(self, shell, args: List[str]):
+        exit_code: int = self.run(shell, args)
+        if exit_code != 0:
+            sys.exit(exit_code)
+
+    @staticmethod
+    def run(shell, args: List[str]) -> int:
+        """
+        Runs the given command in this interpreter and returns its exit code.
+        """
         from .shell import DTShell
         from dtproject.exceptions import DTProjectNotFound
         shell: DTShell
@@ -45,12 +59,12 @@ class Python3Environment(ShellCommandEnvironmentAbs):
             msg = str(e)
             dts_print(msg, "red")
             print_debug_info()
-            sys.exit(1)
+            return 1
         except known_exceptions as e:
             msg = str(e)
             dts_print(msg, "red")
             print_debug_info()
-            sys.exit(1)
+            return 1
         except SystemExit:
             raise
         except (UserAborted, KeyboardInterrupt):
@@ -60,7 +74,8 @@ class Python3Environment(ShellCommandEnvironmentAbs):
             msg = format_exc()
             dts_print(msg, "red", attrs=["bold"])
             print_debug_info()
-            sys.exit(2)
+            return 2
+        return 0
 
 
 @dataclasses.dataclass
@@ -70,30 +85,152 @@ class VirtualPython3Environment(ShellCommandEnvironmentAbs):
     Default for the 'ente' distribution.
     """
 
-    def execute(self, shell, _: List[str]):
+    def execute(self, shell, args: List[str]):
         from .shell import DTShell
+        from .snapshot import ShellSnapshot, DTSHELL_SNAPSHOT_ENV
         shell: DTShell
         # ---
         # we make a virtual environment
         DTSHELL_VENV_DIR: str = os.environ.get("DTSHELL_VENV_DIR", None)
         venv_leave_alone: bool = False
+        pool: Optional[VirtualEnvironmentsPool] = None
+        requirements: List[str] = self.requirements(shell)
+        # whether we run in the environment the profile used until now while a new one is being built
+        stale: bool = False
         if DTSHELL_VENV_DIR:
             logger.info(
                 f"Using virtual environment from '{DTSHELL_VENV_DIR}' as instructed by the environment "
                 f"variable DTSHELL_VENV_DIR.")
             venv_dir: str = DTSHELL_VENV_DIR
             venv_leave_alone = True
+            cache: InstalledDependenciesDatabase = InstalledDependenciesDatabase.load(shell.profile)
         else:
-            venv_dir: str = os.path.join(shell.profile.path, "venv")
+            # virtual environments are shared among profiles with the same dependencies
+            pool = VirtualEnvironmentsPool()
+            key: str = pool.key(requirements)
+            venv_dir: str = pool.path(key)
+            # the new environment might be in the works (see stage()), we do not wait for it
+            current: Optional[str] = pool.key_of(shell.profile)
+            if current is not None and current != key and pool.contains(current) and pool.locked(key):
+                logger.info("The virtual environment is being updated in the background, the current one "
+                            "will be used until then.")
+                key, venv_dir, stale = current, pool.path(current), True
 
-        # define path to virtual env's interpreter
-        interpreter_fpath: str = os.path.join(venv_dir, "bin", "python3")
+        # keep track of changes to the virtual environment
+        venv_changed: bool = False
+
+        # no other shell can build the same environment while we do
+        with (pool.lock(key) if pool is not None and not stale else contextlib.nullcontext()):
+            if pool is not None and not pool.contains(key):
+                profile_venv: str = os.path.join(shell.profile.path, "venv")
+                legacy: InstalledDependenciesDatabase = InstalledDependenciesDatabase.load(shell.profile)
+                if os.path.isdir(profile_venv) and not os.path.islink(profile_venv):
+                    # profiles used to have their own environment, we move it to the pool
+                    pool.adopt(key, profile_venv, dict(legacy.items()))
+                else:
+                    # start from the environment used by the profile until now (if any)
+                    current: Optional[str] = pool.key_of(shell.profile)
+                    seed: Optional[str] = pool.path(current) if current and pool.contains(current) else None
+                    seed_deps: Optional[dict] = dict(pool.dependencies(current).items()) if seed else None
+                    pool.make(key, seed, seed_deps)
+            if pool is not None:
+                cache: InstalledDependenciesDatabase = pool.dependencies(key)
+
+            # define path to virtual env's interpreter
+            interpreter_fpath: str = os.path.join(venv_dir, "bin", "python3")
+
+            if not stale:
+                # make the environment and install the dependencies
+                owners: Dict[str, str] = {SHELL_REQUIREMENTS_LIST: "the shell"}
+                for cs in shell.command_sets:
+                    owners[cs.configuration.requirements()] = f"the command set '{cs.name}'"
+                venv_changed = self.build(venv_dir, requirements, cache, leave_alone=venv_leave_alone,
+                                          owners=owners)
+
+                # keep track of what is installed in the profile
+                lock_fpath: str = shell.profile.requirements_lock
+                if venv_changed or not os.path.isfile(lock_fpath):
+                    old: Dict[str, str] = read_lock(lock_fpath)
+                    new: Dict[str, str] = write_lock(lock_fpath, venv_dir, requirements)
+                    if old:
+                        log_lock_changes(old, new)
+
+        # point the profile to its environment
+        if pool is not None:
+            pool.assign(shell.profile, key)
+
+        # compile new packages (next to their sources, the environment is ours) so that the first run does not
+        # have to
+        if venv_changed:
+            logger.info("Compiling python dependencies...")
+            compile_bytecode(interpreter_fpath, os.path.join(venv_dir, "lib"))
+
+        # run shell in virtual environment
+        import dt_shell_cli
+        main_py: str = os.path.join(os.path.abspath(dt_shell_cli.__path__[0]), "main.py")
+        exec_args: List[str] = [interpreter_fpath, interpreter_fpath, main_py, *sys.argv[1:]]
+
+        extra_env: Dict[str, str] = {
+            "EXTRA_PYTHONPATH": ":".join(sys.path),
+            "IGNORE_ENVIRONMENTS": "1",
+        }
+        exec_env: Dict[str, str] = {**os.environ, **extra_env}
+
+        # let the launcher go straight to the virtual environment the next time, if nothing changes
+        if not stale:
+            try:
+                self._write_launcher_stamp(shell, interpreter_fpath, main_py, extra_env, cache.fpath)
+            except Exception as e:
+                logger.debug(f"Could not write the launcher stamp: {e}")
+
+        # hand over what we know already so that the new shell does not have to compute it again
+        try:
+            exec_env[DTSHELL_SNAPSHOT_ENV] = ShellSnapshot.capture(shell).save()
+        except Exception as e:
+            logger.debug(f"Could not save a snapshot of the shell: {e}")
+        exec_env.pop("PYTHONPATH", None)
+
+        if DTShellConstants.VERBOSE:
+            logger.debug(f"Running command: {exec_args}")
+            logger.debug(f"Environment: {exec_env}")
+
+        # noinspection PyTypeChecker
+        logger.debug(f"Delegating execution to:\n"
+                     f"\tCommand: {exec_args}\n"
+                     f"\tEnvironment: {pretty_json(exec_env, indent_len=12)}")
+        os.execle(*exec_args, exec_env)
+
+    @staticmethod
+    def requirements(shell) -> List[str]:
+        """
+        Dependencies lists of the shell and of the command sets of the given shell.
+        """
+        return [SHELL_REQUIREMENTS_LIST] + [
+            cs.configuration.requirements() for cs in shell.command_sets
+            if cs.configuration.requirements() is not None
+        ]
 
+    @staticmethod
+    def build(venv_dir: str, requirements: List[str], cache: InstalledDependenciesDatabase,
+              leave_alone: bool = False, owners: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Makes the virtual environment (if needed) and installs the given dependencies lists in it.
+        Returns whether the environment changed.
+
+        Args:
+            venv_dir:       Path to the virtual environment
+            requirements:   Paths to the dependencies lists
+            cache:          Database of the dependencies lists installed in the environment
+            leave_alone:    Whether the environment is managed by the user (never created nor pruned)
+            owners:         Names to use for the dependencies lists in the messages to the user
+        """
+        changed: bool = False
+        interpreter_fpath: str = os.path.join(venv_dir, "bin", "python3")
         # make and configure env path if it does not exist
         # TODO: this is a place where a --hard-reset flag would ignore the fact that the venv already exists
         #  and make a new one
         if not os.path.exists(interpreter_fpath):
-            if venv_leave_alone:
+            if leave_alone:
                 msg: str = f"The custom Virtual Environment path '{venv_dir}' was given but no virtual " \
                            f"environments were found at that location."
                 logger.error(msg)
@@ -111,61 +248,104 @@ class VirtualPython3Environment(ShellCommandEnvironmentAbs):
                 prompt="dts"
             )
             install_pip_tool(interpreter_fpath)
+            changed = True
 
-        # install dependencies
-        cache: InstalledDependenciesDatabase = InstalledDependenciesDatabase.load(shell.profile)
-        # - shell
+        # install dependencies (shell and command sets are resolved together)
         if DTShellConstants.VERBOSE:
-            logger.debug("Checking for changes in the shell's dependencies list...")
-        if cache.needs_install_step(SHELL_REQUIREMENTS_LIST):
+            logger.debug("Checking for changes in the dependencies lists...")
+        outdated: List[str] = [r for r in requirements if cache.needs_install_step(r)]
+        if outdated:
             # warn user of detected changes (if any)
-            if cache.contains(SHELL_REQUIREMENTS_LIST):
-                logger.info("Detected changes in the dependencies list for the shell")
+            for requirements_list in outdated:
+                if cache.contains(requirements_list):
+                    owner: str = (owners or {}).get(requirements_list, f"'{requirements_list}'")
+                    logger.info(f"Detected changes in the dependencies list for {owner}")
             # proceed with installing new dependencies
-            logger.info("Installing shell dependencies...")
-            pip_install(interpreter_fpath, SHELL_REQUIREMENTS_LIST)
-            cache.mark_as_installed(SHELL_REQUIREMENTS_LIST)
+            logger.info("Installing dependencies...")
+            install_dependencies(interpreter_fpath, venv_dir, requirements, prune=not leave_alone)
+            for requirements_list in requirements:
+                cache.mark_as_installed(requirements_list)
+            changed = True
         else:
             if DTShellConstants.VERBOSE:
                 logger.debug("No new dependencies or constraints detected")
-        # - command sets
-        for cs in shell.command_sets:
-            if DTShellConstants.VERBOSE:
-                logger.debug(f"Checking for changes in the dependencies list for command set '{cs.name}'...")
-            requirements_list: Optional[str] = cs.configuration.requirements()
-            if cache.needs_install_step(requirements_list):
-                # warn user of detected changes (if any)
-                if cache.contains(requirements_list):
-                    logger.info(f"Detected changes in the dependencies list for the command set '{cs.name}'")
-                # proceed with installing new dependencies
-                logger.info(f"Installing dependencies for command set '{cs.name}'...")
-                pip_install(interpreter_fpath, requirements_list)
-                cache.mark_as_installed(requirements_list)
-            else:
-                if DTShellConstants.VERBOSE:
-                    logger.debug("No new dependencies or constraints detected")
+        return changed
 
-        # run shell in virtual environment
-        import dt_shell_cli
-        main_py: str = os.path.join(os.path.abspath(dt_shell_cli.__path__[0]), "main.py")
-        exec_args: List[str] = [interpreter_fpath, interpreter_fpath, main_py, *sys.argv[1:]]
-
-        exec_env: Dict[str, str] = {
-            **os.environ,
-            "EXTRA_PYTHONPATH": ":".join(sys.path),
-            "IGNORE_ENVIRONMENTS": "1",
-        }
-        exec_env.pop("PYTHONPATH", None)
-
-        if DTShellConstants.VERBOSE:
-            logger.debug(f"Running command: {exec_args}")
-            logger.debug(f"Environment: {exec_env}")
+    @classmethod
+    def stage(cls, shell) -> bool:
+        """
+        Starts building, in the background, the environment needed by the current dependencies lists if the
+        profile is still using one built for different lists (e.g., after a command set update).
+        Commands keep running in the current environment until the new one is ready and swapped in.
+        Returns whether a build was started.
+        """
+        from .shell import DTShell
+        from .staging import stage_in_background
+        shell: DTShell
+        # environments given by the user are left alone
+        if os.environ.get("DTSHELL_VENV_DIR", None):
+            return False
+        pool: VirtualEnvironmentsPool = VirtualEnvironmentsPool()
+        current: Optional[str] = pool.key_of(shell.profile)
+        # nothing to keep using in the meantime, the next command will build it
+        if current is None or not pool.contains(current):
+            return False
+        requirements: List[str] = cls.requirements(shell)
+        key: str = pool.key(requirements)
+        # already there (e.g., shared with another profile) or in the works
+        if key == current or pool.contains(key) or pool.locked(key):
+            return False
+        logger.info("The dependencies changed, a new virtual environment will be prepared in the background.")
+        stage_in_background(shell.profile, requirements, pool.log(key), pool.staging(key))
+        return True
 
-        # noinspection PyTypeChecker
-        logger.debug(f"Delegating execution to:\n"
-                     f"\tCommand: {exec_args}\n"
-                     f"\tEnvironment: {pretty_json(exec_env, indent_len=12)}")
-        os.execle(*exec_args, exec_env)
+    @staticmethod
+    def _write_launcher_stamp(shell, interpreter: str, main_py: str, extra_env: Dict[str, str],
+                              dependencies_db: str):
+        from .shell import DTShell
+        from .database import DTShellDatabase
+        from .commands.manifest import CommandSetManifest
+        from dt_shell_launcher import read_stamp, write_stamp
+        shell: DTShell
+        # nothing to do if the current stamp is still good
+        stamp: Optional[dict] = read_stamp()
+        if stamp is not None and (stamp["interpreter"], stamp["main"], stamp["exec_env"]) == \
+                (interpreter, main_py, extra_env):
+            return
+        # any change to these files requires the full shell to run
+        profile_dbs: List[str] = [DB_SETTINGS, DB_USER_COMMAND_SETS_REPOSITORIES]
+        watch: List[str] = [
+            os.path.join(SHELL_LIB_DIR, "__init__.py"),
+            SHELL_REQUIREMENTS_LIST,
+            DTShellDatabase.open(DB_SETTINGS).fpath,
+            DTShellDatabase.open(DB_PROFILES).fpath,
+            *[shell.profile.database(db).fpath for db in profile_dbs],
+            dependencies_db,
+        ]
+        for cs in shell.command_sets:
+            watch.append(os.path.join(cs.path, "__command_set__", "configuration.py"))
+            # commands learned later make it into the stamp as soon as they are in the manifest
+            watch.append(CommandSetManifest.location(cs))
+            # updates activate a new revision of the command set
+            if cs.revisions is not None:
+                watch.append(cs.revisions.current_link)
+            requirements: Optional[str] = cs.configuration.requirements()
+            if requirements is not None:
+                watch.append(os.path.abspath(requirements))
+        # commands that do not run in this environment cannot be launched straight into it, neither can those
+        # whose environment is not in the manifest yet (configurations are not imported here)
+        excluded: List[str] = []
+        for name, node in shell.command_nodes.items():
+            leaves = [n for n in node.walk() if n.is_leaf]
+            if all(isinstance(n.known_environment, VirtualPython3Environment) for n in leaves):
+                continue
+            excluded.append(name)
+            if node.known_configuration is not None:
+                excluded.extend(node.known_configuration.aliases())
+            else:
+                # aliases are only known by the configuration itself
+                excluded.extend(node.aliases)
+        write_stamp(interpreter, main_py, extra_env, watch, excluded)
 
 
 @dataclasses.dataclass
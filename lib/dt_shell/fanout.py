@@ -0,0 +1,157 @@
+import dataclasses
+import os
+import selectors
+import sys
+import time
+from typing import List, Optional, Dict
+
+from termcolor import colored
+
+from .commands import CommandDescriptor
+from .exceptions import CommandNotFound, UserError
+from .logging import dts_print
+from .shell import DTShell
+from .utils import replace_spaces
+
+# placeholder replaced with the target in the arguments of the command
+TARGET_PLACEHOLDER: str = "{target}"
+
+
+@dataclasses.dataclass
+class FanOutTarget:
+    name: str
+    args: List[str]
+    pid: Optional[int] = None
+    exit_code: Optional[int] = None
+    stime: Optional[float] = None
+    duration: Optional[float] = None
+    # output not terminated by a newline yet
+    buffer: bytes = b""
+
+
+class FanOut:
+    """
+    Runs the same command against many targets, each in a process forked from this one, so that the shell,
+    the profile and the commands are loaded only once. The output of each process is prefixed with the name
+    of its target.
+    """
+
+    def __init__(self, shell: DTShell, args: List[str], targets: List[str], jobs: int = 4):
+        self.shell: DTShell = shell
+        self.jobs: int = max(1, jobs)
+        # the target goes where the placeholder is, at the end if there is no placeholder
+        if not any(TARGET_PLACEHOLDER in arg for arg in args):
+            args = args + [TARGET_PLACEHOLDER]
+        self.targets: List[FanOutTarget] = [
+            FanOutTarget(name=target, args=[arg.replace(TARGET_PLACEHOLDER, target) for arg in args])
+            for target in targets
+        ]
+        self._width: int = max([len(t) for t in targets] + [0])
+
+    @staticmethod
+    def load_targets(fpath: str) -> List[str]:
+        """
+        Reads the targets from the given file, one per line. Empty lines and lines starting with '#' are ignored.
+        """
+        fin = sys.stdin if fpath == "-" else open(fpath, "rt")
+        try:
+            lines: List[str] = [line.strip() for line in fin]
+        finally:
+            if fin is not sys.stdin:
+                fin.close()
+        return [line for line in lines if line and not line.startswith("#")]
+
+    def run(self) -> int:
+        """
+        Runs the command against all the targets and returns the number of targets it failed for.
+        """
+        if not self.targets:
+            return 0
+        # resolve the command before forking, mistakes are reported only once
+        command: CommandDescriptor = self._resolve(self.targets[0].args)
+        # ---
+        pending: List[FanOutTarget] = list(self.targets)
+        running: Dict[int, FanOutTarget] = {}
+        selector: selectors.DefaultSelector = selectors.DefaultSelector()
+        while pending or running:
+            # start new workers
+            while pending and len(running) < self.jobs:
+                target: FanOutTarget = pending.pop(0)
+                fd: int = self._start(command, target)
+                running[fd] = target
+                selector.register(fd, selectors.EVENT_READ)
+            # forward the output of the workers
+            for key, _ in selector.select():
+                fd: int = key.fd
+                target: FanOutTarget = running[fd]
+                data: bytes = os.read(fd, 65536)
+                if data:
+                    self._forward(target, data)
+                    continue
+                # the worker closed its output, it is done
+                selector.unregister(fd)
+                os.close(fd)
+                del running[fd]
+                self._join(target)
+        selector.close()
+        self._print_table()
+        return len([t for t in self.targets if t.exit_code != 0])
+
+    def _resolve(self, args: List[str]) -> CommandDescriptor:
+        cmdline: str = " ".join(map(replace_spaces, args))
+        try:
+            return self.shell.get_command(cmdline)
+        except CommandNotFound:
+            raise UserError(f"Command not found: dts {' '.join(args)}")
+
+    def _start(self, command: CommandDescriptor, target: FanOutTarget) -> int:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        rfd, wfd = os.pipe()
+        pid: int = os.fork()
+        if pid == 0:
+            # worker: send everything to the parent and leave without running the parent's exit handlers
+            os.close(rfd)
+            os.dup2(wfd, sys.stdout.fileno())
+            os.dup2(wfd, sys.stderr.fileno())
+            os.close(wfd)
+            exit_code: int = 1
+            try:
+                command.environment.execute(self.shell, list(map(replace_spaces, target.args)))
+                exit_code = 0
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except BaseException as e:
+                print(f"{e.__class__.__name__}: {e}")
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        os.close(wfd)
+        target.pid = pid
+        target.stime = time.time()
+        return rfd
+
+    def _join(self, target: FanOutTarget):
+        if target.buffer:
+            self._forward(target, b"\n")
+        _, status = os.waitpid(target.pid, 0)
+        target.exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+        target.duration = time.time() - target.stime
+
+    def _forward(self, target: FanOutTarget, data: bytes):
+        lines: List[bytes] = (target.buffer + data).split(b"\n")
+        target.buffer = lines.pop()
+        prefix: str = colored(f"[{target.name:>{self._width}}]", "cyan")
+        for line in lines:
+            sys.stdout.write(f"{prefix} {line.decode('utf-8', errors='replace')}\n")
+        sys.stdout.flush()
+
+    def _print_table(self):
+        width: int = max(self._width, len("target"))
+        rows: List[str] = [f"{'target':<{width}}  {'status':<6}  {'code':>4}  {'time':>8}"]
+        for t in self.targets:
+            status: str = colored(f"{'OK':<6}", "green") if t.exit_code == 0 else colored(f"{'FAILED':<6}", "red")
+            rows.append(f"{t.name:<{width}}  {status}  {t.exit_code:>4}  {t.duration:>7.2f}s")
+        failed: int = len([t for t in self.targets if t.exit_code != 0])
+        dts_print(f"Ran against {len(self.targets)} targets, {failed} failed:\n\n" + "\n".join(rows) + "\n")
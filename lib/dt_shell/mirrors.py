@@ -0,0 +1,138 @@
+import hashlib
+import os
+import shutil
+import time
+from typing import Optional, List
+
+from filelock import FileLock
+
+from . import logger
+from .commands.repository import CommandsRepository, GitTransfer, git_transfer, CLONE_MODE_FULL, \
+    CLONE_MODE_BLOBLESS, CLONE_OPTIONS, BLOBLESS_FILTER
+from .constants import DEFAULT_MIRRORS_DIR, DB_GIT_MIRRORS, CHECK_CMDS_UPDATE_MINS
+from .database import DTShellDatabase
+from .exceptions import RunCommandException
+from .utils import run_cmd, safe_pathname
+
+# a clone or a fetch of a large repository on a slow connection can take a while
+MIRROR_LOCK_TIMEOUT_SECS: int = 60 * 10
+# clone modes with a mirror of their own (shallow clones talk to their remotes directly)
+MIRROR_MODES: List[str] = [CLONE_MODE_FULL, CLONE_MODE_BLOBLESS]
+
+
+class GitMirrors:
+    """
+    Bare mirrors of the repositories of the command sets, one per remote and clone mode, shared among profiles.
+    Profiles clone from the mirrors borrowing their objects (through git alternates) and fetch from them, so that
+    each remote is contacted once per machine no matter how many profiles use it. Blobless mirrors only have the
+    history, clones made from them download the contents of the files they check out from the remote. The database
+    'git_mirrors' keeps track of the last time each branch of each remote was checked for updates.
+    """
+
+    def __init__(self, location: Optional[str] = None):
+        self.location: str = location or os.environ.get("DTSHELL_MIRRORS", DEFAULT_MIRRORS_DIR)
+        self._db: DTShellDatabase[dict] = DTShellDatabase.open(DB_GIT_MIRRORS)
+
+    def path(self, url: str, mode: str = CLONE_MODE_FULL) -> str:
+        if mode not in MIRROR_MODES:
+            raise ValueError(f"Clone mode '{mode}' does not use mirrors, known modes are: {MIRROR_MODES}")
+        name: str = safe_pathname(url.rstrip("/").split("/")[-1].split(":")[-1])
+        suffix: str = "" if mode == CLONE_MODE_FULL else f"-{mode}"
+        return os.path.join(self.location,
+                            f"{name}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}{suffix}.git")
+
+    def contains(self, url: str, mode: str = CLONE_MODE_FULL) -> bool:
+        return os.path.isfile(os.path.join(self.path(url, mode), "HEAD"))
+
+    def lock(self, url: str, mode: str = CLONE_MODE_FULL) -> FileLock:
+        os.makedirs(self.location, exist_ok=True)
+        return FileLock(f"{self.path(url, mode)}.lock", timeout=MIRROR_LOCK_TIMEOUT_SECS)
+
+    def ensure(self, url: str, mode: str = CLONE_MODE_FULL) -> GitTransfer:
+        """
+        Makes the mirror of the given remote if it does not exist. Call with the lock held.
+        """
+        destination: str = self.path(url, mode)
+        if self.contains(url, mode):
+            return GitTransfer()
+        logger.info(f"Creating a local {mode} mirror of '{url}'...")
+        tmp: str = f"{destination}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        transfer: GitTransfer = git_transfer(["git", "clone", "--progress", "--mirror"] + CLONE_OPTIONS[mode] +
+                                             [url, tmp])
+        # clones borrow objects from the mirror, they must never be pruned from it (e.g., by 'fetch --prune' and
+        # an automatic gc after a force-push)
+        run_cmd(["git", "-C", tmp, "config", "gc.auto", "0"])
+        run_cmd(["git", "-C", tmp, "config", "gc.pruneExpire", "never"])
+        os.rename(tmp, destination)
+        logger.info(f"Mirror of '{url}' created ({transfer})")
+        return transfer
+
+    def update(self, repository: CommandsRepository, mode: str = CLONE_MODE_FULL, force: bool = False) \
+            -> Optional[str]:
+        """
+        Brings the branch of the given repository up-to-date in its mirror (unless somebody else did it recently
+        and we are not forced to) and returns the SHA of its tip.
+        """
+        url: str = repository.remoteurl
+        key: str = f"{url}#{repository.branch}" if mode == CLONE_MODE_FULL else f"{url}#{repository.branch}#{mode}"
+        with self.lock(url, mode):
+            # other profiles might have checked this branch in the meantime
+            self._db.reload()
+            record: Optional[dict] = self._db.get(key, None)
+            if not force and record is not None and time.time() - record["time"] < CHECK_CMDS_UPDATE_MINS * 60 \
+                    and self.contains(url, mode):
+                logger.debug(f"Branch '{repository.branch}' of '{url}' was checked recently")
+                return record["sha"]
+            self.ensure(url, mode)
+            sha: Optional[str] = self._tip(url, repository.branch, mode)
+            # the GitHub API is cheaper than a fetch when nothing changed (it does not work over SSH)
+            remote_sha: Optional[str] = repository.remote_sha()
+            if remote_sha is None or remote_sha != sha:
+                transfer: GitTransfer = git_transfer(
+                    ["git", "-C", self.path(url, mode), "fetch", "--progress", "--prune", "--tags", "origin",
+                     f"+refs/heads/{repository.branch}:refs/heads/{repository.branch}"]
+                )
+                logger.info(f"Mirror of '{url}' updated ({transfer})")
+                sha = self._tip(url, repository.branch, mode)
+            self._db.set(key, {"sha": sha, "time": time.time()})
+            return sha
+
+    def clone(self, repository: CommandsRepository, destination: str, mode: str = CLONE_MODE_FULL) -> GitTransfer:
+        """
+        Clones the given repository from its mirror into the given (non-existing) directory. The clone borrows the
+        objects of the mirror, its remote 'origin' points to the actual remote.
+        """
+        url: str = repository.remoteurl
+        with self.lock(url, mode):
+            transfer: GitTransfer = self.ensure(url, mode)
+            branch: List[str] = ["--branch", repository.branch] if repository.branch else []
+            run_cmd(["git", "clone", "--shared", "--no-checkout"] + branch + [self.path(url, mode), destination])
+        run_cmd(["git", "-C", destination, "remote", "set-url", "origin", url])
+        if mode == CLONE_MODE_BLOBLESS:
+            # the contents of the files are not in the mirror, the clone gets them from the remote when needed
+            for key, value in [("core.repositoryFormatVersion", "1"), ("remote.origin.promisor", "true"),
+                               ("remote.origin.partialCloneFilter", BLOBLESS_FILTER),
+                               ("extensions.partialClone", "origin")]:
+                run_cmd(["git", "-C", destination, "config", key, value])
+        # the checkout of a blobless clone talks to the remote
+        transfer += git_transfer(["git", "-C", destination, "checkout", "--quiet"])
+        return transfer
+
+    def fetch(self, repository: CommandsRepository, destination: str, mode: str = CLONE_MODE_FULL) -> GitTransfer:
+        """
+        Brings the remote branch of the given repository in the clone at the given path up-to-date with the mirror.
+        """
+        url: str = repository.remoteurl
+        branch: str = repository.branch
+        with self.lock(url, mode):
+            return git_transfer(
+                ["git", "-C", destination, "fetch", "--progress", "--tags", self.path(url, mode),
+                 f"+refs/heads/{branch}:refs/remotes/origin/{branch}"]
+            )
+
+    def _tip(self, url: str, branch: str, mode: str = CLONE_MODE_FULL) -> Optional[str]:
+        try:
+            return run_cmd(["git", "-C", self.path(url, mode), "rev-parse", f"refs/heads/{branch}"]).strip()
+        except RunCommandException:
+            return None
@@ -0,0 +1,252 @@
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from typing import List, Optional, Set, Dict
+
+from . import logger, __version__
+from .commands import CommandSet
+from .commands.repository import CommandsRepository, is_shallow, is_blobless
+from .constants import DB_SECRETS, DB_SECRETS_DOCKER, DB_STATISTICS_EVENTS, DB_PROFILES, DEFAULT_PROFILES_DIR, \
+    STATE_DATABASES, DB_INSTALLED_DEPENDENCIES, DB_COMMAND_SET_UPDATES_CHECK
+from .database import DTShellDatabase
+from .database.database import DTShellState
+from .exceptions import UserError
+from .profile import ShellProfile
+from .utils import run_cmd, safe_pathname, wheelhouse_dir
+from .wheelhouse import Distribution, installed_distributions, wheel_distribution, wheels
+
+# bump this every time the layout of the archives changes
+PACK_VERSION: int = 1
+PACK_MANIFEST: str = "manifest.json"
+PACK_EXTENSION: str = ".dts-profile.tar.gz"
+# databases that never leave the machine they were made on (unless asked to)
+SECRET_DATABASES: List[str] = [DB_SECRETS, DB_SECRETS_DOCKER]
+LOCAL_DATABASES: List[str] = [DB_STATISTICS_EVENTS]
+# records of the shared state file that describe this machine only (e.g., what is installed in the environment
+# built here), the other machine starts over
+LOCAL_STATE: List[str] = [DB_INSTALLED_DEPENDENCIES]
+
+
+class ProfilePack:
+    """
+    Single-file archive of a profile that sets up the same profile on another machine without network access.
+    It contains the databases of the profile (secrets only if asked to), a git bundle of each command set at the
+    commit in use, and the wheels of all the Python dependencies installed in the virtual environment of the
+    profile. Unpacking puts the databases and the command sets in place and adds the wheels to the local
+    wheelhouse, the first launch builds the virtual environment from those.
+    """
+
+    def __init__(self, fpath: str):
+        self.fpath: str = os.path.abspath(fpath)
+
+    def manifest(self) -> dict:
+        """
+        Reads the manifest of the archive (without unpacking it).
+        """
+        try:
+            with tarfile.open(self.fpath, "r:*") as tar:
+                return json.load(tar.extractfile(PACK_MANIFEST))
+        except (OSError, KeyError, ValueError, tarfile.TarError):
+            raise UserError(f"The file '{self.fpath}' is not a profile archive.")
+
+    def pack(self, profile: ShellProfile, secrets: bool = False, dependencies: bool = True) -> dict:
+        """
+        Writes the archive of the given profile. Returns its manifest.
+        """
+        staging: str = tempfile.mkdtemp(prefix="dts-pack-")
+        try:
+            manifest: dict = {
+                "version": PACK_VERSION,
+                "profile": profile.name,
+                "shell": __version__,
+                "time": time.time(),
+                # wheels only work on similar machines
+                "platform": _platform(),
+                "command_sets": [],
+                "wheels": [],
+            }
+            # databases
+            os.makedirs(os.path.join(staging, "databases"))
+            excluded: List[str] = LOCAL_DATABASES + ([] if secrets else SECRET_DATABASES)
+            for fpath in glob.glob(os.path.join(profile.path, "databases", "*.yaml")):
+                name: str = os.path.basename(fpath)[:-len(".yaml")]
+                if name in map(safe_pathname, excluded):
+                    continue
+                shutil.copy2(fpath, os.path.join(staging, "databases"))
+            self._pack_state(os.path.join(profile.path, "databases"), os.path.join(staging, "databases"))
+            if os.path.isfile(profile.requirements_lock):
+                shutil.copy2(profile.requirements_lock, os.path.join(staging, "requirements.lock"))
+            # command sets
+            os.makedirs(os.path.join(staging, "bundles"))
+            for cs in profile.command_sets:
+                entry: Optional[dict] = self._bundle(cs, os.path.join(staging, "bundles"))
+                if entry is not None:
+                    manifest["command_sets"].append(entry)
+            # dependencies
+            if dependencies:
+                os.makedirs(os.path.join(staging, "wheels"))
+                for fpath in self._wheels(profile):
+                    shutil.copy2(fpath, os.path.join(staging, "wheels"))
+                    manifest["wheels"].append(os.path.basename(fpath))
+            with open(os.path.join(staging, PACK_MANIFEST), "wt") as fout:
+                json.dump(manifest, fout, indent=4, sort_keys=True)
+            # archive
+            tmp: str = f"{self.fpath}.{os.getpid()}.tmp"
+            with tarfile.open(tmp, "w:gz") as tar:
+                for name in sorted(os.listdir(staging)):
+                    tar.add(os.path.join(staging, name), arcname=name)
+            os.replace(tmp, self.fpath)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return manifest
+
+    def unpack(self, name: Optional[str] = None, force: bool = False) -> ShellProfile:
+        """
+        Sets up the profile contained in the archive, under the given name (the original one if not given).
+        Raises UserError if a profile with the same name exists already (unless forced to replace it).
+        """
+        manifest: dict = self.manifest()
+        if manifest.get("version") != PACK_VERSION:
+            raise UserError(f"The profile archive '{self.fpath}' has format v{manifest.get('version')}, "
+                            f"this shell only reads v{PACK_VERSION}. Update the shell and try again.")
+        name = name or manifest["profile"]
+        profiles: DTShellDatabase = DTShellDatabase.open(DB_PROFILES)
+        if profiles.contains(name) and not force:
+            raise UserError(f"A profile named '{name}' exists already. Choose another name or replace it.")
+        if manifest["platform"] != _platform() and manifest["wheels"]:
+            logger.warning(f"The profile was packed on a different platform ({manifest['platform']}), "
+                           f"its dependencies might need to be downloaded again.")
+        staging: str = tempfile.mkdtemp(prefix="dts-unpack-")
+        try:
+            with tarfile.open(self.fpath, "r:*") as tar:
+                _extract(tar, staging)
+            # the profile goes where new profiles go
+            profiles_dir: str = os.environ.get("DTSHELL_PROFILES", DEFAULT_PROFILES_DIR)
+            path: str = profiles.get(name, None) or os.path.join(profiles_dir, safe_pathname(name))
+            if os.path.exists(path):
+                logger.info(f"Replacing the profile in '{path}'...")
+                shutil.rmtree(path)
+            os.makedirs(path)
+            # databases
+            shutil.copytree(os.path.join(staging, "databases"), os.path.join(path, "databases"))
+            if os.path.isfile(os.path.join(staging, "requirements.lock")):
+                shutil.copy2(os.path.join(staging, "requirements.lock"), os.path.join(path, "requirements.lock"))
+            # command sets
+            for entry in manifest["command_sets"]:
+                self._unbundle(entry, os.path.join(staging, "bundles"), os.path.join(path, "commands"))
+            # dependencies
+            os.makedirs(wheelhouse_dir(), exist_ok=True)
+            added: int = 0
+            for wheel in manifest["wheels"]:
+                destination: str = os.path.join(wheelhouse_dir(), wheel)
+                if not os.path.exists(destination):
+                    shutil.move(os.path.join(staging, "wheels", wheel), destination)
+                    added += 1
+            logger.info(f"Added {added} wheel(s) to the local wheelhouse")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        # register the profile
+        profiles.set(name, path)
+        return ShellProfile(name, path=path)
+
+    @staticmethod
+    def _pack_state(source: str, destination: str):
+        # the small databases of the profile live in a single file (see DTShellState)
+        state: DTShellState = DTShellState(source)
+        packed: DTShellState = DTShellState(destination)
+        for name in STATE_DATABASES:
+            data: Optional[dict] = state.section(name)
+            if data is None or name in LOCAL_STATE:
+                continue
+            if name == DB_COMMAND_SET_UPDATES_CHECK:
+                # updates found here are downloaded in the clones of this machine, bundles have the current commit
+                data = {cs: {**record, "remote_sha": None} if isinstance(record, dict) else record
+                        for cs, record in data.items()}
+            packed.write(name, data)
+        # the lock is not part of the state
+        if os.path.exists(f"{packed.path}.lock"):
+            os.remove(f"{packed.path}.lock")
+
+    @staticmethod
+    def _bundle(cs: CommandSet, destination: str) -> Optional[dict]:
+        # command sets given by the user and the embedded one are not ours to move around
+        if cs.repository is None or cs.leave_alone:
+            return None
+        if not os.path.isdir(cs.path):
+            logger.warning(f"The command set '{cs.name}' was never downloaded, it will be at the first launch.")
+            return None
+        if is_shallow(cs.repository_path):
+            logger.warning(f"The command set '{cs.name}' is a shallow clone and cannot be packed, "
+                           f"it will be downloaded at the first launch.")
+            return None
+        if os.path.isfile(os.path.join(cs.path, ".gitmodules")):
+            logger.warning(f"The submodules of the command set '{cs.name}' are not packed, "
+                           f"they will be downloaded at the first launch.")
+        sha: str = cs.local_sha
+        bundle: str = f"{safe_pathname(cs.name)}.bundle"
+        logger.info(f"Packing the command set '{cs.name}' at {sha[:8]}...")
+        if is_blobless(cs.repository_path):
+            # bundles are complete, git downloads what the clone does not have yet
+            logger.info(f"The command set '{cs.name}' is a blobless clone, the content of its history will be "
+                        f"downloaded first.")
+        run_cmd(["git", "-C", cs.path, "bundle", "create", os.path.join(destination, bundle), "HEAD"])
+        return {"name": cs.name, "repository": cs.repository.as_dict(), "sha": sha, "bundle": bundle}
+
+    @staticmethod
+    def _unbundle(entry: dict, bundles: str, commands: str):
+        repository: CommandsRepository = CommandsRepository.from_dict(entry["repository"])
+        destination: str = os.path.join(commands, entry["name"])
+        branch: str = repository.branch
+        sha: str = entry["sha"]
+        logger.info(f"Unpacking the command set '{entry['name']}' at {sha[:8]}...")
+        run_cmd(["git", "clone", "--quiet", "--no-checkout", os.path.join(bundles, entry["bundle"]), destination])
+        # make it look like it was cloned from its remote, updates work as usual
+        run_cmd(["git", "-C", destination, "remote", "set-url", "origin", repository.remoteurl])
+        run_cmd(["git", "-C", destination, "update-ref", f"refs/remotes/origin/{branch}", sha])
+        run_cmd(["git", "-C", destination, "checkout", "--quiet", "-B", branch, sha])
+        run_cmd(["git", "-C", destination, "branch", "--quiet", f"--set-upstream-to=origin/{branch}"])
+
+    @staticmethod
+    def _wheels(profile: ShellProfile) -> List[str]:
+        venv_dir: str = os.environ.get("DTSHELL_VENV_DIR", None) or os.path.realpath(
+            os.path.join(profile.path, "venv"))
+        if not os.path.isdir(venv_dir):
+            logger.warning("The profile has no virtual environment yet, its dependencies are not packed.")
+            return []
+        installed: Set[Distribution] = installed_distributions(venv_dir)
+        available: Dict[Distribution, str] = {wheel_distribution(fpath): fpath for fpath in wheels()}
+        missing: List[str] = sorted(f"{n}=={v}" for n, v in installed if (n, v) not in available)
+        if missing:
+            logger.warning(f"Some dependencies are not in the local wheelhouse and are not packed, they will be "
+                           f"downloaded at the first launch: {', '.join(missing)}")
+        return sorted(fpath for dist, fpath in available.items() if dist in installed)
+
+
+def default_fpath(profile: str) -> str:
+    return os.path.abspath(f"{safe_pathname(profile)}{PACK_EXTENSION}")
+
+
+def _platform() -> str:
+    return f"{platform.system()}-{platform.machine()}-py{sys.version_info.major}.{sys.version_info.minor}"
+
+
+def _extract(tar: tarfile.TarFile, destination: str):
+    # archives come from other machines, nothing can end up outside the destination
+    if hasattr(tarfile, "data_filter"):
+        try:
+            tar.extractall(destination, filter="data")
+        except tarfile.FilterError as e:
+            raise UserError(f"The profile archive contains an invalid entry: {e.tarinfo.name}")
+        return
+    root: str = os.path.realpath(destination)
+    for member in tar.getmembers():
+        target: str = os.path.realpath(os.path.join(destination, member.name))
+        if os.path.commonpath([root, target]) != root or member.issym() or member.islnk():
+            raise UserError(f"The profile archive contains an invalid entry: {member.name}")
+    tar.extractall(destination)
@@ -16,11 +16,11 @@ from yaml.scanner import ScannerError
 
 from . import logger, __version__
 from .commands import CommandSet, CommandDescriptor
-from .commands.repository import CommandsRepository
+from .commands.repository import CommandsRepository, CLONE_MODES, CLONE_MODE_BLOBLESS
 from .constants import DUCKIETOWN_TOKEN_URL, SHELL_LIB_DIR, DEFAULT_COMMAND_SET_REPOSITORY, \
     DEFAULT_PROFILES_DIR, DB_SECRETS, DB_SECRETS_DOCKER, DB_SETTINGS, DB_USER_COMMAND_SETS_REPOSITORIES, \
     DB_PROFILES, KNOWN_DISTRIBUTIONS, SUGGESTED_DISTRIBUTION, DB_UPDATES_CHECK, EMBEDDED_COMMAND_SET_NAME, \
-    Distro
+    Distro, CHECK_CMDS_UPDATE_MINS, CHECK_CMDS_UPDATE_MAX_MINS
 from .database.database import DTShellDatabase, NOTSET, DTSerializable
 from .statistics import ShellProfileEventsDatabase
 from .utils import safe_pathname, validator_token, yellow_bold, cli_style, parse_version, render_version, \
@@ -174,6 +174,30 @@ class ShellProfileSettings(DTShellDatabase):
         assert isinstance(value, bool)
         self.set("auto_update", value)
 
+    @property
+    def clone_mode(self) -> str:
+        # the environment variable DTSHELL_CLONE_MODE takes priority
+        return os.environ.get("DTSHELL_CLONE_MODE", self.get("clone_mode", CLONE_MODE_BLOBLESS))
+
+    @clone_mode.setter
+    def clone_mode(self, value: str):
+        assert value in CLONE_MODES
+        self.set("clone_mode", value)
+
+    @property
+    def update_check_bounds(self) -> Tuple[float, float]:
+        # shortest and longest interval (in minutes) between checks for updates of the command sets
+        return (
+            self.get("update_check_min_mins", CHECK_CMDS_UPDATE_MINS),
+            self.get("update_check_max_mins", CHECK_CMDS_UPDATE_MAX_MINS),
+        )
+
+    @update_check_bounds.setter
+    def update_check_bounds(self, value: Tuple[float, float]):
+        assert 0 < value[0] <= value[1]
+        self.set("update_check_min_mins", value[0])
+        self.set("update_check_max_mins", value[1])
+
 
 @dataclasses.dataclass
 class ShellProfile:
@@ -258,7 +282,8 @@ class ShellProfile:
                     )
                 )
         if commands_path:
-            self.update_command_descriptions(commands_path)
+            # command sets might run from a revision other than the one they were cloned with
+            self.update_command_descriptions(self.command_sets[-1].path)
 
         # add user defined command sets
         for n, r in self.user_command_sets_repositories:
@@ -323,6 +348,21 @@ class ShellProfile:
     def _databases_location(self) -> str:
         return os.path.join(self.path, "databases")
 
+    @property
+    def pycache_path(self) -> str:
+        # bytecode of command sets and dependencies (see PYTHONPYCACHEPREFIX)
+        return os.path.join(self.path, "pycache")
+
+    @property
+    def requirements_lock(self) -> str:
+        # dependencies installed in the virtual environment, as resolved the last time they changed
+        return os.path.join(self.path, "requirements.lock")
+
+    @property
+    def history_path(self) -> str:
+        # commands typed in the interactive sessions (see `dts shell`)
+        return os.path.join(self.path, "history")
+
     @property
     def user_command_sets_repositories(self) -> Iterator[Tuple[str, CommandsRepository]]:
         for k, v in self.database(DB_USER_COMMAND_SETS_REPOSITORIES).items():
@@ -0,0 +1,218 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from typing import List, Optional, Callable, Dict
+
+import requests
+from filelock import FileLock, Timeout
+from requests import JSONDecodeError, Response
+
+from . import logger
+from .constants import DTShellConstants, DTHUB_URL, DB_BILLBOARDS, DB_UPDATES_CHECK, DB_SETTINGS, \
+    CHECK_SHELL_UPDATE_MINS, CHECK_BILLBOARD_UPDATE_SECS, PUSH_USER_EVENTS_TO_HUB_SECS
+from .database import DTShellDatabase
+
+# NOTE: this module is also the entrypoint of the process performing the periodic checks in the background,
+#       see DTShell.run_background_tasks(). The process only writes what it finds to the local state, the
+#       shell reads it at the next launch (e.g., to show notices or apply updates).
+
+# keys of the periodic checks in the database 'updates_check'
+CHECK_SHELL_VERSION: str = "shell_version"
+CHECK_COMMAND_SETS: str = "command_sets"
+CHECK_BILLBOARDS: str = "billboards"
+CHECK_STATISTICS: str = "upload_events"
+
+
+def lock(profile) -> FileLock:
+    # only one refresher per profile at a time
+    return FileLock(os.path.join(profile.path, "refresher.lock"), timeout=0)
+
+
+def log(profile) -> str:
+    # output of the last refresh
+    return os.path.join(profile.path, "refresher.log")
+
+
+def running(profile) -> bool:
+    """
+    Tells whether a refresher is already running for the given profile.
+    """
+    try:
+        with lock(profile):
+            return False
+    except Timeout:
+        return True
+
+
+def due(profile) -> List[str]:
+    """
+    Returns the periodic checks that are due for the given profile.
+    """
+    updates_check: DTShellDatabase = DTShellDatabase.open(DB_UPDATES_CHECK)
+    settings: DTShellDatabase = DTShellDatabase.open(DB_SETTINGS)
+    checks: List[str] = []
+    # new versions of the shell
+    if settings.get("check_for_updates", True) and \
+            _is_time(updates_check, CHECK_SHELL_VERSION, CHECK_SHELL_UPDATE_MINS * 60):
+        checks.append(CHECK_SHELL_VERSION)
+    # updates of the command sets (each keeps its own record)
+    if profile.settings.check_for_updates:
+        if any(not cs.leave_alone and cs.update_check_due for cs in profile.command_sets):
+            checks.append(CHECK_COMMAND_SETS)
+    # billboards
+    if _is_time(updates_check, CHECK_BILLBOARDS, CHECK_BILLBOARD_UPDATE_SECS):
+        checks.append(CHECK_BILLBOARDS)
+    # usage statistics
+    if profile.secrets.dt_token is not None and \
+            _is_time(updates_check, CHECK_STATISTICS, PUSH_USER_EVENTS_TO_HUB_SECS):
+        checks.append(CHECK_STATISTICS)
+    return checks
+
+
+def refresh_in_background(profile, checks: List[str]):
+    """
+    Starts a detached process performing the given checks for the given profile. The process outlives the shell,
+    its output goes to the file returned by log().
+    """
+    log_fpath: str = log(profile)
+    env: dict = {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in sys.path if p)}
+    with open(log_fpath, "wb") as fout:
+        subprocess.Popen(
+            [sys.executable, "-m", "dt_shell.refresher", profile.name, *checks],
+            stdin=subprocess.DEVNULL,
+            stdout=fout,
+            stderr=subprocess.STDOUT,
+            env=env,
+            start_new_session=True,
+        )
+    logger.debug(f"Refreshing {', '.join(checks)} in the background, see '{log_fpath}'")
+
+
+def refresh(profile_name: str, checks: List[str]) -> bool:
+    """
+    Performs the given checks for the given profile. Returns whether all of them succeeded.
+    """
+    from .profile import ShellProfile
+    # ---
+    profile: ShellProfile = ShellProfile(profile_name, readonly=True)
+    updates_check: DTShellDatabase = DTShellDatabase.open(DB_UPDATES_CHECK)
+    handlers: Dict[str, Callable] = {
+        CHECK_SHELL_VERSION: refresh_shell_version,
+        CHECK_COMMAND_SETS: refresh_command_sets,
+        CHECK_BILLBOARDS: refresh_billboards,
+        CHECK_STATISTICS: upload_statistics,
+    }
+    success: bool = True
+    try:
+        with lock(profile):
+            for check in checks:
+                stime: float = time.time()
+                try:
+                    handlers[check](profile)
+                    logger.info(f"Check '{check}' done in {time.time() - stime:.2f}s")
+                except Exception as e:
+                    logger.warning(f"Check '{check}' failed: {e}")
+                    logger.debug(traceback.format_exc())
+                    success = False
+                # failed checks are not retried right away either
+                updates_check.set(check, time.time())
+    except Timeout:
+        logger.info(f"The profile '{profile_name}' is already being refreshed by another process")
+        return False
+    return success
+
+
+def refresh_shell_version(_):
+    from .checks.version import get_last_version_fresh, write_cache
+    from datetime import datetime
+    # the shell reads the cache at the next launch
+    write_cache(get_last_version_fresh(), datetime.now())
+
+
+def refresh_command_sets(profile):
+    # updates are downloaded and prepared here, the shell activates them (see DTShell.apply_command_set_updates)
+    for cs in profile.command_sets:
+        if cs.revisions is None or not os.path.isdir(cs.repository_path):
+            continue
+        # command sets that were never checked before are checked right away (see CommandSet.update_check_due)
+        if cs.update_check_due:
+            if cs.check_for_updates():
+                logger.info(f"Updates available for the command set '{cs.name}'")
+        if cs.prepare_updates() is not None:
+            logger.info(f"Updates of the command set '{cs.name}' ready to be applied")
+        # revisions left behind by updates once nobody uses them anymore
+        for sha in cs.revisions.garbage_collect():
+            logger.info(f"Removed revision {sha[:8]} of the command set '{cs.name}'")
+
+
+def refresh_billboards(profile):
+    db: DTShellDatabase = DTShellDatabase.open(DB_BILLBOARDS)
+    url: str = f"{DTHUB_URL}/api/v1/billboard/list/"
+    raw: Optional[Response] = None
+    bboards: List[dict] = []
+    # reach out to the HUB and grab the new billboards
+    while url:
+        try:
+            logger.debug(f"GET {url}")
+            raw = requests.get(url, timeout=10)
+            response: dict = raw.json()
+            profile.events.new("shell/billboards/update")
+        except JSONDecodeError:
+            logger.debug("HUB response:\n" + str(raw))
+            raise
+        # check response
+        if response.get("success", False) is not True:
+            raise RuntimeError("HUB response:\n" + json.dumps(response, indent=4, sort_keys=True))
+        result: dict = response.get("result", {})
+        results: List[dict] = result.get("results", [])
+        bboards.extend(results)
+        url = result.get("next", "")
+    # update local database
+    db.clear()
+    for bboard in bboards:
+        db.set(bboard["name"], bboard)
+    logger.debug("Billboards updated!")
+
+
+def upload_statistics(profile):
+    from .hub import HUBApiError, hub_api_post
+    # ---
+    token: Optional[str] = profile.secrets.dt_token
+    if token is None:
+        return
+    # push events
+    for evt in profile.events.events():
+        try:
+            data: dict = {
+                "key": evt.name,
+                "format": evt.format,
+                "payload": evt.payload,
+                "stamp": evt.time_millis
+            }
+            if evt.labels:
+                data["labels"] = evt.labels
+            hub_api_post("statistics/user/event", data, token=token)
+            evt.delete()
+            if DTShellConstants.VERBOSE:
+                logger.debug(f"Event '{evt.__key__}' pushed to the HUB")
+        except HUBApiError as e:
+            if e.code == 409:
+                # duplicated stats points
+                evt.delete()
+                continue
+            logger.debug(e.human)
+
+
+def _is_time(db: DTShellDatabase, key: str, period: float) -> bool:
+    try:
+        return time.time() - db.get(key) > period
+    except DTShellDatabase.NotFound:
+        return True
+
+
+if __name__ == '__main__':
+    DTShellConstants.BACKGROUND = True
+    sys.exit(0 if refresh(sys.argv[1], sys.argv[2:]) else 1)
@@ -0,0 +1,151 @@
+import os
+import shlex
+import sys
+import time
+from typing import Optional, List, Dict, Tuple
+
+from . import logger
+from .commands.finder import CommandSetFinder
+from .commands.manifest import git_head
+from .constants import SESSION_TASKS_SECS, SESSION_HISTORY_LENGTH, DB_COMMAND_SET_UPDATES_CHECK
+from .environments import Python3Environment
+from .logging import dts_print
+from .shell import DTShell
+
+
+class InteractiveSession:
+    """
+    Interactive session running many commands on the same shell, so that the startup cost (e.g., profile
+    checks, discovery of the commands, the switch to the virtual environment) is paid only once.
+    """
+
+    def __init__(self, shell: DTShell, prompt: str = "dts> "):
+        self.shell: DTShell = shell
+        self.prompt: str = prompt
+        self._readline = None
+        self._last_tasks: float = time.time()
+        # where the command sets were and what they looked like the last time we discovered their commands
+        self._heads: Dict[str, Tuple[str, Optional[str]]] = {
+            cs.name: (cs.path, git_head(cs.path)) for cs in shell.command_sets
+        }
+
+    def run(self) -> int:
+        """
+        Reads and runs commands until the user ends the session. Returns the exit code of the last command.
+        """
+        self._setup_readline()
+        exit_code: int = 0
+        try:
+            while True:
+                try:
+                    line: str = input(self.prompt).strip()
+                except EOFError:
+                    print()
+                    break
+                except KeyboardInterrupt:
+                    print()
+                    continue
+                if not line:
+                    continue
+                # run what needs to run on a schedule before the next command
+                self._run_tasks()
+                # commands handled by the session
+                words: List[str] = line.split()
+                if words[0] in ["exit", "quit"]:
+                    break
+                if words[0] == "reload":
+                    self.reload()
+                    continue
+                exit_code = self.execute(line)
+                if exit_code != 0:
+                    dts_print(f"Exit code: {exit_code}", color="red")
+        finally:
+            self._save_history()
+        return exit_code
+
+    def execute(self, line: str) -> int:
+        try:
+            args: List[str] = shlex.split(line)
+        except ValueError as e:
+            dts_print(f"Invalid command: {e}", color="red")
+            return 1
+        try:
+            return Python3Environment.run(self.shell, args)
+        except SystemExit as e:
+            # commands are used to end the process when they are done, the session goes on
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            dts_print(str(e.code), color="red")
+            return 1
+
+    def reload(self):
+        """
+        Rediscovers the commands of the command sets that changed since the last time.
+        """
+        changed: List[str] = []
+        for cs in self.shell.command_sets:
+            head: Optional[str] = git_head(cs.path)
+            path, last_head = self._heads.get(cs.name, (cs.path, None))
+            # command sets that are not git repositories might have changed at any time
+            if head is not None and (cs.path, head) == (path, last_head):
+                continue
+            self._heads[cs.name] = (cs.path, head)
+            # forget the modules imported from the command set (updates move it to a new revision)
+            prefix: str = os.path.join(os.path.abspath(path), "")
+            for name, module in list(sys.modules.items()):
+                if (getattr(module, "__file__", None) or "").startswith(prefix):
+                    del sys.modules[name]
+            CommandSetFinder.get(cs).invalidate_caches()
+            cs.refresh()
+            changed.append(cs.name)
+        if not changed:
+            dts_print("Nothing changed.")
+            return
+        self.shell.reload_commands(skeleton=False)
+        dts_print(f"Commands reloaded from: {', '.join(changed)}")
+
+    def _run_tasks(self):
+        if time.time() - self._last_tasks < SESSION_TASKS_SECS:
+            return
+        self._last_tasks = time.time()
+        # periodic tasks (each decides whether it is time for it to run)
+        self.shell.run_background_tasks()
+        # command set updates found by the background refresher in the meantime
+        self.shell.profile.database(DB_COMMAND_SET_UPDATES_CHECK).reload()
+        try:
+            updated: bool = self.shell.apply_command_set_updates()
+        except Exception as e:
+            logger.warning(f"Could not update the command sets: {e}")
+            return
+        if updated:
+            self.reload()
+            self.shell.stage_virtual_environment()
+
+    def _setup_readline(self):
+        try:
+            import readline
+        except ImportError:
+            logger.debug("Module 'readline' not available, completion and history disabled")
+            return
+        self._readline = readline
+        # completion comes from the commands tree in memory
+        readline.set_completer(self.shell.complete)
+        readline.set_completer_delims(readline.get_completer_delims().replace("-", "", 1))
+        if "libedit" in (readline.__doc__ or ""):
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+        # history persists across sessions
+        readline.set_history_length(SESSION_HISTORY_LENGTH)
+        try:
+            readline.read_history_file(self.shell.profile.history_path)
+        except (FileNotFoundError, OSError):
+            pass
+
+    def _save_history(self):
+        if self._readline is None:
+            return
+        try:
+            self._readline.write_history_file(self.shell.profile.history_path)
+        except OSError as e:
+            logger.debug(f"Could not save the history of the session: {e}")
@@ -3,6 +3,8 @@
 import argparse
 import atexit
 import dataclasses
+import functools
+import importlib
 import inspect
 import os
 import random
@@ -28,7 +30,9 @@ from . import __version__, logger, compatibility
 from .checks.version import check_for_updates
 from .commands import DTCommandAbs, CommandDescriptor, DTCommandPlaceholder, DTCommandConfigurationAbs, \
     CommandSet, NoOpCommand
-from .commands.importer import import_command, import_configuration
+from .commands.finder import CommandSetFinder
+from .commands.manifest import CommandSetManifest
+from .commands.tree import CommandNode, CommandsNamespace
 from .compatibility.migrations import \
     migrate_distro, \
     needs_migrate_docker_credentials, migrate_docker_credentials, \
@@ -36,16 +40,17 @@ from .compatibility.migrations import \
     needs_migrate_secrets, migrate_secrets, mark_docker_credentials_migrated, \
     mark_token_dt1_migrated, mark_secrets_migrated, needs_migrations, mark_all_migrated
 from .constants import DNAME, KNOWN_DISTRIBUTIONS, SUGGESTED_DISTRIBUTION, EMBEDDED_COMMAND_SET_NAME, \
-    DB_BILLBOARDS, DB_UPDATES_CHECK, CHECK_BILLBOARD_UPDATE_SECS, PUSH_USER_EVENTS_TO_HUB_SECS
+    DB_BILLBOARDS, DB_UPDATES_CHECK
 from .constants import DTShellConstants, IGNORE_ENVIRONMENTS, DB_SETTINGS, DB_PROFILES
 from .database import DTShellDatabase
-from .environments import ShellCommandEnvironmentAbs, DEFAULT_COMMAND_ENVIRONMENT
+from .environments import ShellCommandEnvironmentAbs, DEFAULT_COMMAND_ENVIRONMENT, VirtualPython3Environment
 from .exceptions import UserError, NotFound, CommandNotFound, CommandsLoadingException, UserAborted, \
     ConfigNotPresent
 from .logging import dts_print
 from .profile import ShellProfile
+from .snapshot import ShellSnapshot
 from .utils import text_justify, text_distribute, cli_style, indent_block, ensure_bash_completion_installed, \
-    env_option
+    env_option, disable_prompts
 
 BILLBOARDS_VERSION: str = "v1"
 
@@ -60,6 +65,14 @@ class CLIOptions:
     quiet: bool = env_option("DTSHELL_QUIET", False)
     complete: bool = False
     profile: Optional[str] = env_option("DTSHELL_PROFILE", None)
+    batch: Optional[str] = None
+    keep_going: bool = False
+    summary: Optional[str] = None
+    lean: bool = env_option("DTSHELL_LEAN", False)
+
+
+# shell options taking a value
+CLI_OPTIONS_WITH_VALUE: List[str] = ["--profile", "--batch", "--summary"]
 
 
 def get_cli_options(args: List[str]) -> Tuple[CLIOptions, List[str]]:
@@ -71,13 +84,9 @@ def get_cli_options(args: List[str]) -> Tuple[CLIOptions, List[str]]:
 
     # find first non-option word
     i: int = 0
-    for w in args:
-        if w.startswith("-"):
-            i += 1
-            if w == "--profile":
-                i += 1
-        else:
-            break
+    while i < len(args) and args[i].startswith("-"):
+        # skip the value of the option (if any)
+        i += 2 if args[i] in CLI_OPTIONS_WITH_VALUE else 1
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -104,6 +113,31 @@ def get_cli_options(args: List[str]) -> Tuple[CLIOptions, List[str]]:
         default=default_opts.profile,
         help="Select specific profile just for this session"
     )
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        default=default_opts.lean,
+        help="Lean mode, skip banners, update checks and background tasks and never prompt the user "
+             "(default when neither stdin nor stdout are terminals)"
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        default=default_opts.batch,
+        help="Run the commands in the given file, one per line ('-' to read them from stdin)"
+    )
+    parser.add_argument(
+        "--keep-going",
+        action="store_true",
+        default=default_opts.keep_going,
+        help="In batch mode, keep running the commands after one fails"
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        default=default_opts.summary,
+        help="In batch mode, write a JSON summary of the commands run to the given file ('-' for stdout)"
+    )
 
     if "--complete" in args[:i]:
         parser.add_argument(
@@ -118,6 +152,13 @@ def get_cli_options(args: List[str]) -> Tuple[CLIOptions, List[str]]:
     return CLIOptions(**parsed.__dict__), args[i:]
 
 
+def lean_mode(options: CLIOptions) -> bool:
+    """
+    Tells whether the shell should run in lean mode, i.e., as asked or when nobody is at the terminal.
+    """
+    return options.lean or not (sys.stdin.isatty() or sys.stdout.isatty())
+
+
 prompt = "dts> "
 
 
@@ -183,7 +224,7 @@ class DTShell(Cmd):
     ]
 
     # tree of commands once loaded
-    include: types.SimpleNamespace
+    include: CommandsNamespace
 
     def __init__(self,
                  skeleton: bool = False,
@@ -202,14 +243,14 @@ class DTShell(Cmd):
         self._banner: bool = banner
         self._billboard: bool = billboard
 
-        # errors while loading end up in here
-        self._errors_loading: List[str] = []
+        # records of the root commands once loaded
+        self._command_nodes: Dict[CommandName, CommandNode] = {}
 
         # updates check database
         self.updates_check_db: DTShellDatabase[float] = DTShellDatabase.open(DB_UPDATES_CHECK)
 
         # namespace will contain the map to the loaded commands
-        DTShell.include = types.SimpleNamespace()
+        DTShell.include = CommandsNamespace([])
 
         # event handlers
         self._event_handlers: Dict[EventType, List[Callable]] = {
@@ -271,10 +312,29 @@ class DTShell(Cmd):
                 with self.settings.in_memory():
                     self.settings.profile = profile
 
+        # state handed over by the shell that delegated the execution to this interpreter (if any)
+        self._snapshot: Optional[ShellSnapshot] = ShellSnapshot.current()
+        if self._snapshot is not None and self._snapshot.profile != self.settings.profile:
+            logger.debug(f"Ignoring shell snapshot, profile '{self._snapshot.profile}' != "
+                         f"'{self.settings.profile}'")
+            ShellSnapshot.discard()
+            self._snapshot = None
+        # profile checks, migrations and updates might have been performed already
+        checks_done: bool = self._snapshot is not None and self._snapshot.checks_done
+
         # load current profile
         self._profile: ShellProfile = ShellProfile(self.settings.profile, readonly=readonly) \
             if self.settings.profile else None
 
+        # in lean mode we skip what is cosmetic or periodic and never prompt the user
+        lean: bool = DTShellConstants.LEAN
+        self.skipped: List[str] = []
+        if lean:
+            disable_prompts()
+            if banner or billboard:
+                self.skipped.append("banner and billboards")
+            banner = billboard = False
+
         # start event
         self._trigger_event(Event(EventType.START, "shell"))
 
@@ -291,17 +351,25 @@ class DTShell(Cmd):
             self._show_banner(profile=self._profile, billboard=bboard)
 
         # make sure the bash completion script is installed
-        if not readonly:
-            ensure_bash_completion_installed()
+        if not readonly and not checks_done:
+            if lean:
+                self.skipped.append("bash completion check")
+            else:
+                ensure_bash_completion_installed()
 
         # check if we configure the shell by migrating an old profile
-        self.performed_migrations: bool = self._attempt_migrations(readonly)
+        self.performed_migrations: bool = False
+        if not checks_done:
+            if lean:
+                self.skipped.append("migrations check")
+            else:
+                self.performed_migrations = self._attempt_migrations(readonly)
 
         # make sure the shell is configured
-        self.configured_shell: bool = self._configure(readonly)
+        self.configured_shell: bool = False if checks_done else self._configure(readonly)
 
         # make sure the profile is configured
-        self.configured_profile: bool = self._profile.configure(readonly)
+        self.configured_profile: bool = False if checks_done else self._profile.configure(readonly)
 
         # in readonly mode we stop right here if we don't have a profile
         if readonly and self._profile is None:
@@ -314,17 +382,21 @@ class DTShell(Cmd):
         DTShellConstants.PROFILE = self._profile
         DTShellConstants.ROOT = self._profile.path
 
-        # check for updates
+        # let the user know about new versions of the shell (found by the background refresher)
         if not readonly and not skeleton and self.settings.check_for_updates:
-            check_for_updates()
+            if lean:
+                self.skipped.append("shell update notice")
+            else:
+                check_for_updates(fresh=False)
 
-        # add command set path to PYTHONPATH
+        # keep the bytecode of the command sets in the profile so that read-only and shared checkouts also
+        # benefit from it
+        if not readonly:
+            CommandSetFinder.enable_bytecode_cache(self._profile.pycache_path)
+
+        # make the packages of each command set importable (later command sets take priority)
         for cs in self.command_sets:
-            for path in [cs.path, os.path.join(cs.path, "lib")]:
-                # add new path to PYTHONPATH for this session
-                path: str = os.path.abspath(path)
-                sys.path.insert(0, path)
-                logger.debug(f"Path '{path}' added to PYTHONPATH")
+            CommandSetFinder.get(cs).install()
 
         # add custom PYTHONPATH
         if "DTSHELL_PYTHONPATH" in os.environ:
@@ -344,12 +416,15 @@ class DTShell(Cmd):
             import readline
             readline.set_completer_delims(readline.get_completer_delims().replace("-", "", 1))
 
-        # check for updates (if needed)
-        if not readonly:
-            for cs in self.command_sets:
-                # Do not check it if we are using custom commands (leave-alone)
-                if not cs.leave_alone:
-                    cs.update()
+        # apply the updates found by the background refresher (if needed)
+        self._notified_updates: List[str] = []
+        if not readonly and not checks_done:
+            # in lean mode command sets are only downloaded (if missing), updates wait for an interactive run
+            if lean:
+                self.skipped.append("command sets updates")
+            # updates might bring new dependencies
+            if self.apply_command_set_updates(apply=not lean):
+                self.stage_virtual_environment()
 
         # pre-import event
         self._trigger_event(Event(EventType.PRE_COMMAND_IMPORT, "shell"))
@@ -385,6 +460,10 @@ class DTShell(Cmd):
         #     lambda sig, frame: self._trigger_event(Event(EventType.KEYBOARD_INTERRUPT, "user"))
         # )
 
+        # report what lean mode saved us
+        if self.skipped and DTShellConstants.VERBOSE:
+            logger.info(f"Lean mode, skipped: {', '.join(self.skipped)}")
+
         # register at-exit (we use a lambda so that the event is created at the proper time)
         atexit.register(lambda: self._trigger_event(Event(EventType.SHUTDOWN, "shell")))
 
@@ -400,6 +479,10 @@ class DTShell(Cmd):
     def profiles(self) -> DTShellDatabase:
         return self._db_profiles
 
+    @property
+    def command_nodes(self) -> Dict[CommandName, CommandNode]:
+        return self._command_nodes
+
     @property
     def command_sets(self) -> List[CommandSet]:
         return self._profile.command_sets
@@ -468,22 +551,31 @@ class DTShell(Cmd):
     def mark_done(self, key: str, when: float = None):
         self.mark_updated(key=key, when=when)
 
+    def run_background_tasks(self):
+        # long-running sessions (see `dts shell`) run these periodically, not only at startup
+        self._run_background_tasks(Event(EventType.START, "shell"))
+
     def _run_background_tasks(self, event: Event):
         # we don't run background tasks in skeleton mode
         if self._readonly or self._skeleton:
             return
+        # nor in lean mode
+        if DTShellConstants.LEAN:
+            if "background tasks" not in self.skipped:
+                self.skipped.append("background tasks")
+            return
         if event.type is EventType.START:
-            # update billboards
-            if self.needs_update("billboards", CHECK_BILLBOARD_UPDATE_SECS):
-                from .tasks import UpdateBillboardsTask
-                UpdateBillboardsTask(self).start()
+            # periodic checks (e.g., updates, billboards, statistics) run in a process of their own
+            from . import refresher
+            checks: List[str] = refresher.due(self.profile)
+            if checks and not refresher.running(self.profile):
+                try:
+                    refresher.refresh_in_background(self.profile, checks)
+                except Exception as e:
+                    logger.warning(f"Could not start the background refresher: {e}")
             # get docker versions
             from .tasks import CollectDockerVersionTask
             CollectDockerVersionTask(self).start()
-            # push user events to the hub
-            if self.is_time("upload_events", PUSH_USER_EVENTS_TO_HUB_SECS):
-                from .tasks import UploadStatisticsTask
-                UploadStatisticsTask(self).start()
 
     def _on_keyboard_interrupt_event(self, event: Event):
         pass
@@ -604,6 +696,8 @@ class DTShell(Cmd):
     def load_commands(self, skeleton: bool):
         # rediscover commands
         self.commands = {}
+        self._command_nodes = {}
+        trees: List[Dict[CommandName, CommandNode]] = []
         for cs in self.command_sets:
             # run command set init script
             if not skeleton:
@@ -613,39 +707,39 @@ class DTShell(Cmd):
             if cs.commands is None:
                 continue
 
+            # the manifest lets us skip importing the configuration of each command
+            manifest: CommandSetManifest = CommandSetManifest.load(cs)
+
             # load commands from disk
+            nodes: Dict[CommandName, CommandNode] = {}
             for cmd, subcmds in cs.commands.items():
                 # noinspection PyTypeChecker
-                self._load_command_subtree(cs, "", cmd, subcmds, 0, skeleton)
+                nodes[cmd] = self._load_command_subtree(cs, "", cmd, subcmds, 0, skeleton, manifest)
+
+            # an outdated manifest is rebuilt right away, so that it is complete the next time
+            if not manifest.fresh:
+                for node in nodes.values():
+                    for n in node.walk():
+                        _ = n.configuration
+                # store what we learned for the next time
+                manifest.save()
 
             # add commands to the list of commands
             self.commands.update(cs.commands)
+            self._command_nodes.update(nodes)
+            trees.append(nodes)
+
+        # add commands to DTShell.include.<cmd_path>
+        DTShell.include = CommandsNamespace(trees)
 
         if len(self.commands) <= 0:
             logger.error("No commands found.")
             self.commands = {}
 
-        if self._errors_loading:
-            sep = "-" * 128
-            msg = f"\n\n\n!   Could not load commands. Detailed error messages are printed below.\n" + \
-                  indent_block(
-                      f"\n\n{sep}\n\n\n" +
-                      ("\n\n" + sep + "\n\n\n").join(self._errors_loading) +
-                      f"\n\n{sep}\n\n"
-                  ) + \
-                  f"\n\n!   Could not load commands. Detailed error messages are printed above.\n\n"
-            logger.error(msg)
-            raise CommandsLoadingException("Some commands could not be loaded. Detailed error messages are "
-                                           "reported above.")
-
     def reload_commands(self, skeleton: bool):
-        # remove installed commands
-        installed_commands = self.commands.keys()
-        for command in installed_commands:
-            for a in ["do_", "complete_", "help_"]:
-                if hasattr(DTShell, a + command):
-                    delattr(DTShell, a + command)
-        # rediscover commands
+        # the content of the command sets might have changed (e.g., after an update)
+        importlib.invalidate_caches()
+        # rediscover commands (root commands are resolved on the fly by __getattr__)
         self.load_commands(skeleton)
 
     def _load_command_subtree(
@@ -656,145 +750,58 @@ class DTShell(Cmd):
         sub_commands: Union[None, Mapping[str, object], CommandDescriptor],
         lvl: int,
         skeleton: bool,
-    ) -> Optional[Type[DTCommandAbs]]:
-        # make a new (temporary) class
-        class klass(DTCommandPlaceholder):
-            pass
-        selector: str = f"{package}{command}"
-        configuration: Type[DTCommandConfigurationAbs] = import_configuration(command_set, selector)
-
-        if isinstance(sub_commands, CommandDescriptor):
-            descriptor: CommandDescriptor = sub_commands
-
-            # load command configuration
-            descriptor.configuration = configuration
-
-            # if we ignore environments, we assume default global environment for every command
-            environment: ShellCommandEnvironmentAbs
-            if IGNORE_ENVIRONMENTS:
-                environment = DEFAULT_COMMAND_ENVIRONMENT
-            else:
-                # figure out the environment for this command
-                environment = descriptor.configuration.environment()
-                if environment is None:
-                    # revert to command set's default environment
-                    environment = command_set.configuration.default_environment()
-                if environment is None:
-                    # use default environment
-                    environment = DEFAULT_COMMAND_ENVIRONMENT
-
-            # add environment to command's descriptor
-            descriptor.environment = environment
-
-            # import class only if this is the environment in which the commands will run
-            if not skeleton:
-                try:
-                    klass = import_command(command_set, descriptor.path)
-                except UserError:
-                    raise
-                except (UserAborted, KeyboardInterrupt):
-                    raise
-                except ModuleNotFoundError as e:
-                    lines: List[str] = []
-                    cs_path: str = os.path.abspath(os.path.realpath(command_set.path))
-                    # check PYTHONPATH
-                    found: bool = False
-                    lines += ["\tPYTHONPATH: ["]
-                    for p in sys.path:
-                        p_path: str = os.path.abspath(os.path.realpath(p))
-                        if p_path == cs_path:
-                            found = True
-                        lines += [f"\t\t'{p_path}'"]
-                    lines += ["\t]"]
-                    lines += [f"\t- dir[{cs_path}] in PYTHONPATH: {found}"]
-                    # module already loaded?
-                    m: str = ""
-                    for p in selector.split("."):
-                        m = f"{m}.{p}".lstrip(".")
-                        mod = sys.modules.get(m, None)
-                        if mod:
-                            lines.append(f"\t- module[{m}] already loaded: True; {dir(mod)}")
-                        else:
-                            lines.append(f"\t- module[{m}] already loaded: False")
-
-                    # check all __init__ files
-                    fpath: str = os.path.join(cs_path)
-                    for p in selector.split("."):
-                        fpath = os.path.join(fpath, p)
-                        init_fpath = os.path.join(fpath, "__init__.py")
-                        lines.append(f"\t- file[{init_fpath}] exists: {os.path.isfile(init_fpath)}")
-                    # compile details
-                    details: str = "\n".join(lines)
-                    msg = f"The command '{selector.replace('.', '/')}' could not be imported.\n\n" \
-                          f"ModuleNotFoundError: {e}" \
-                          f"\n\n{details}\n\n" \
-                          f"{traceback.format_exc()}"
-                    self._errors_loading.append(msg)
-                except BaseException:
-                    se = traceback.format_exc()
-                    msg = (
-                        f"Cannot load command class {descriptor.selector}.command.DTCommand "
-                        f"(package={package}, command={command}):\n\n{se}"
-                    )
-                    self._errors_loading.append(msg)
-                    return
-
-            # link descriptor <-> command
-            descriptor.command = klass
-            klass.descriptor = descriptor
-            # add loaded class to DTShell.include.<cmd_path>
-            klass_path = [p for p in package.split(".") if len(p)]
-            base = DTShell.include
-            for p in klass_path:
-                if not hasattr(base, p):
-                    setattr(base, p, types.SimpleNamespace())
-                base = getattr(base, p)
-            setattr(base, command, klass)
-
-        # give command its own info
-        klass.name = command
-        klass.level = lvl
-        klass.parser = configuration.parser()
-        # initialize list of subcommands
-        klass.commands = {}
-
-        # attach first-level commands to the shell
-        if lvl == 0:
-            do_command = getattr(klass, "do_command")
-            get_command = getattr(klass, "get_command")
-            complete_command = getattr(klass, "complete_command")
-            help_command = getattr(klass, "help_command")
-            # wrap [klass, function] around a lambda function
-            do_command_lam = lambda s, w: do_command(s, w)
-            get_command_lam = lambda s, w: get_command(s, w)
-            complete_command_lam = lambda s, w, l, i, _: complete_command(s, w, l, i, _)
-            help_command_lam = lambda s: help_command(s)
-            # add functions do_* and complete_* to the shell
-            for command_name in [command] + configuration.aliases():
-                if DTShellConstants.VERBOSE:
-                    logger.debug(f"Attaching root command '{command_name}' to shell")
-                setattr(DTShell, "do_" + command_name, do_command_lam)
-                setattr(DTShell, "get_" + command_name, get_command_lam)
-                setattr(DTShell, "complete_" + command_name, complete_command_lam)
-                setattr(DTShell, "help_" + command_name, help_command_lam)
-
-        # stop recursion if there is no subcommand
-        if sub_commands is None:
-            return
+        manifest: Optional[CommandSetManifest] = None,
+    ) -> CommandNode:
+        # make a record for this command, its class and parser are created when first needed
+        node: CommandNode = CommandNode(
+            name=command,
+            level=lvl,
+            selector=f"{package}{command}",
+            command_set=command_set,
+            skeleton=skeleton,
+            descriptor=sub_commands if isinstance(sub_commands, CommandDescriptor) else None,
+            manifest=manifest,
+        )
 
         # load sub-commands
         if isinstance(sub_commands, dict):
             for cmd, subcmds in sub_commands.items():
                 logger.debug("Searching %s at level %d" % (package + command + ".*", lvl))
                 # noinspection PyTypeChecker
-                kl = self._load_command_subtree(
-                    command_set, package + command + ".", cmd, subcmds, lvl + 1, skeleton
+                node.children[cmd] = self._load_command_subtree(
+                    command_set, package + command + ".", cmd, subcmds, lvl + 1, skeleton, manifest
                 )
-                if kl is not None:
-                    klass.commands[cmd] = kl
 
-        # return class for this command
-        return klass
+        # return record for this command
+        return node
+
+    def _root_command(self, name: str) -> Optional[CommandNode]:
+        nodes: Dict[CommandName, CommandNode] = self.__dict__.get("_command_nodes", {})
+        if name in nodes:
+            return nodes[name]
+        # root commands can also be invoked by their aliases
+        for node in nodes.values():
+            if name in node.aliases:
+                return node
+        return None
+
+    def __getattr__(self, item: str):
+        # functions do_*, get_*, complete_* and help_* of the root commands are attached on the fly
+        for prefix in ["do_", "get_", "complete_", "help_"]:
+            if item.startswith(prefix):
+                node: Optional[CommandNode] = self._root_command(item[len(prefix):])
+                if node is not None:
+                    if DTShellConstants.VERBOSE:
+                        logger.debug(f"Attaching root command '{item[len(prefix):]}' to shell")
+                    return functools.partial(getattr(node.klass, f"{prefix}command"), self)
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{item}'")
+
+    def get_names(self) -> List[str]:
+        names: List[str] = super(DTShell, self).get_names()
+        for node in self.__dict__.get("_command_nodes", {}).values():
+            for command_name in [node.name] + node.aliases:
+                names += [f"{prefix}{command_name}" for prefix in ["do_", "complete_", "help_"]]
+        return names
 
     def get_command(self, line) -> CommandDescriptor:
         """
@@ -855,6 +862,37 @@ class DTShell(Cmd):
             bboard_names.extend([billboard_name] * (priority + 1))
         return bboard_names
 
+    def apply_command_set_updates(self, apply: bool = True) -> bool:
+        """
+        Applies the updates of the command sets found by the background refresher. Profiles that do not update
+        automatically (see ShellProfileSettings.auto_update) only let the user know about them, the updates are
+        applied with `dts update`. Command sets that were never downloaded are downloaded first, when not asked to
+        apply updates (e.g., in lean mode) that is all this does. Returns whether any command set was updated.
+        """
+        updated: bool = False
+        for cs in self.command_sets:
+            # Do not touch it if we are using custom commands (leave-alone)
+            if cs.leave_alone:
+                continue
+            # clone the commands if necessary
+            cs.ensure_commands_exist()
+            if not apply:
+                continue
+            sha: Optional[str] = cs.pending_update
+            if sha is None:
+                continue
+            if not self.profile.settings.auto_update:
+                if sha not in self._notified_updates:
+                    self._notified_updates.append(sha)
+                    dts_print(f"Updates are available for the command set '{cs.name}'. "
+                              f"Run 'dts update' to apply them.", color="yellow")
+                continue
+            try:
+                updated = cs.apply_updates() or updated
+            except RuntimeError as e:
+                logger.warning(f"Could not update the command set '{cs.name}': {e}")
+        return updated
+
     def update_commands(self):
         # update all command sets
         for cs in self.command_sets:
@@ -866,8 +904,17 @@ class DTShell(Cmd):
             # update command set
             logger.info(f"Updating the command set '{cs.name}'...")
             self.profile.events.new("shell/commandset/update", {"command_set": cs.as_dict()})
-            cs.update()
+            # the user asked for updates, the remote is checked no matter when it was checked last
+            cs.update(force=True)
             logger.info(f"Command set '{cs.name}' updated!")
+        # updates might bring new dependencies
+        self.stage_virtual_environment()
+
+    def stage_virtual_environment(self):
+        try:
+            VirtualPython3Environment.stage(self)
+        except Exception as e:
+            logger.warning(f"Could not prepare the new virtual environment in the background: {e}")
 
     def _configure(self, readonly: bool = False) -> bool:
         modified_config: bool = False
@@ -0,0 +1,161 @@
+import dataclasses
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Optional, Dict, List, Any
+
+from . import __version__, logger
+from .constants import DTShellConstants
+
+# environment variable used to hand the snapshot over to the next interpreter
+DTSHELL_SNAPSHOT_ENV: str = "DTSHELL_SNAPSHOT"
+# snapshots older than this are not trusted
+SNAPSHOT_MAX_AGE_SECS: int = 60
+# bump this every time the format of the snapshot changes
+SNAPSHOT_VERSION: int = 2
+
+
+@dataclasses.dataclass
+class ShellSnapshot:
+    """
+    State computed by a shell right before it delegates the execution of a command to another interpreter
+    (see VirtualPython3Environment). The new interpreter uses it to skip the work already done: profile
+    checks, migrations, command sets updates and the discovery of the commands on disk.
+    """
+    shell_version: str
+    pid: int
+    time: float
+    profile: str
+    argv: List[str]
+    # whether migrations, configuration and updates already ran
+    checks_done: bool
+    # command set path -> {name, head, tree}
+    command_sets: Dict[str, dict]
+    version: int = SNAPSHOT_VERSION
+
+    # the snapshot handed over to this process (if any), loaded once
+    _current = None
+
+    @classmethod
+    def capture(cls, shell) -> 'ShellSnapshot':
+        from .commands.manifest import git_head
+        # serialize the trees of commands
+        command_sets: Dict[str, dict] = {}
+        for cs in shell.command_sets:
+            if cs.commands is None:
+                continue
+            command_sets[os.path.abspath(cs.path)] = {
+                "name": cs.name,
+                "head": git_head(cs.path),
+                "tree": _dump_tree(cs.commands),
+            }
+        # ---
+        return ShellSnapshot(
+            shell_version=__version__,
+            pid=os.getpid(),
+            time=time.time(),
+            profile=shell.profile.name,
+            argv=sys.argv[1:],
+            checks_done=not shell._readonly,
+            command_sets=command_sets,
+        )
+
+    def save(self) -> str:
+        """
+        Writes the snapshot to a temporary file and returns its path.
+        """
+        fd, fpath = tempfile.mkstemp(prefix="dts-snapshot-", suffix=".json")
+        with os.fdopen(fd, "wt") as fout:
+            json.dump(dataclasses.asdict(self), fout)
+        return fpath
+
+    @classmethod
+    def current(cls) -> Optional['ShellSnapshot']:
+        """
+        Returns the snapshot handed over to this process by the shell that exec'ed it, if any and valid.
+        The file is consumed on first access.
+        """
+        if cls._current is None:
+            cls._current = cls._load() or False
+        return cls._current or None
+
+    @classmethod
+    def discard(cls):
+        cls._current = False
+
+    @classmethod
+    def _load(cls) -> Optional['ShellSnapshot']:
+        fpath: Optional[str] = os.environ.pop(DTSHELL_SNAPSHOT_ENV, None)
+        if not fpath:
+            return None
+        try:
+            with open(fpath, "rt") as fin:
+                data: dict = json.load(fin)
+            os.remove(fpath)
+            snapshot: ShellSnapshot = ShellSnapshot(**data)
+        except (OSError, ValueError, TypeError) as e:
+            logger.debug(f"Could not load the shell snapshot from '{fpath}': {e}")
+            return None
+        # make sure the snapshot was made for us: exec() preserves the PID, the arguments and the time frame
+        reason: Optional[str] = None
+        if snapshot.version != SNAPSHOT_VERSION:
+            reason = f"format v{snapshot.version} != v{SNAPSHOT_VERSION}"
+        elif snapshot.shell_version != __version__:
+            reason = f"shell v{snapshot.shell_version} != v{__version__}"
+        elif snapshot.pid != os.getpid():
+            reason = f"PID {snapshot.pid} != {os.getpid()}"
+        elif snapshot.argv != sys.argv[1:]:
+            reason = f"arguments {snapshot.argv} != {sys.argv[1:]}"
+        elif time.time() - snapshot.time > SNAPSHOT_MAX_AGE_SECS:
+            reason = "too old"
+        if reason is not None:
+            logger.debug(f"Ignoring shell snapshot, {reason}")
+            return None
+        if DTShellConstants.VERBOSE:
+            logger.debug(f"Using shell snapshot of the process {snapshot.pid}")
+        return snapshot
+
+    def commands(self, command_set) -> Optional[Dict[str, Any]]:
+        """
+        Returns the tree of commands discovered by the previous shell for the given command set, None if
+        not available or outdated.
+        """
+        from .commands.manifest import git_head
+        record: Optional[dict] = self.command_sets.get(os.path.abspath(command_set.path), None)
+        if record is None or record["name"] != command_set.name or record["head"] != git_head(command_set.path):
+            return None
+        return _load_tree(command_set, record["tree"])
+
+
+def _dump_tree(tree: Optional[dict]) -> Optional[dict]:
+    from .commands import CommandDescriptor
+    if tree is None:
+        return None
+    out: dict = {}
+    for name, node in tree.items():
+        if isinstance(node, CommandDescriptor):
+            out[name] = {"__command__": {"name": node.name, "path": node.path, "selector": node.selector}}
+        else:
+            out[name] = _dump_tree(node)
+    return out
+
+
+def _load_tree(command_set, tree: Optional[dict]) -> Optional[dict]:
+    from .commands import CommandDescriptor
+    from .commands.commands import DTCommandConfigurationDefault
+    if tree is None:
+        return None
+    out: dict = {}
+    for name, node in tree.items():
+        if node is not None and "__command__" in node:
+            out[name] = CommandDescriptor(
+                **node["__command__"],
+                command_set=command_set,
+                configuration=DTCommandConfigurationDefault,
+                environment=None,
+            )
+        else:
+            out[name] = _load_tree(command_set, node)
+    return out
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+from typing import List, Optional
+
+from filelock import Timeout
+
+from . import logger
+
+# NOTE: this module is also the entrypoint of the process building virtual environments in the background,
+#       see VirtualPython3Environment.stage()
+
+
+def stage_in_background(profile, requirements: List[str], log_fpath: str, marker: str):
+    """
+    Starts a detached process building the virtual environment for the given profile and dependencies lists.
+    The process outlives the shell, its output goes to the given log file. The given marker file exists from
+    now until the process holds the lock of the environment, so that nobody else starts building it meanwhile.
+    """
+    os.makedirs(os.path.dirname(log_fpath), exist_ok=True)
+    with open(marker, "wt") as fout:
+        fout.write(str(os.getpid()))
+    env: dict = {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in sys.path if p)}
+    try:
+        with open(log_fpath, "wb") as log:
+            subprocess.Popen(
+                [sys.executable, "-m", "dt_shell.staging", profile.name, *map(os.path.abspath, requirements)],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                env=env,
+                start_new_session=True,
+            )
+    except BaseException:
+        _remove(marker)
+        raise
+    logger.debug(f"Building virtual environment in the background, see '{log_fpath}'")
+
+
+def stage(profile_name: str, requirements: List[str]) -> bool:
+    """
+    Builds the virtual environment for the given dependencies lists and, if it passes the import test, points
+    the given profile to it. Returns whether the profile now uses the new environment.
+    """
+    from .dependencies import smoke_test, write_lock
+    from .environments import VirtualPython3Environment
+    from .profile import ShellProfile
+    from .venvs import VirtualEnvironmentsPool
+    # ---
+    profile: ShellProfile = ShellProfile(profile_name, readonly=True)
+    pool: VirtualEnvironmentsPool = VirtualEnvironmentsPool()
+    key: str = pool.key(requirements)
+    venv_dir: str = pool.path(key)
+    try:
+        with pool.lock(key, timeout=0):
+            # the build is ours now (see stage_in_background())
+            _remove(pool.staging(key))
+            # start from the environment used by the profile until now (if any)
+            if not pool.contains(key):
+                current: Optional[str] = pool.key_of(profile)
+                seed: Optional[str] = pool.path(current) if current and pool.contains(current) else None
+                seed_deps: Optional[dict] = dict(pool.dependencies(current).items()) if seed else None
+                pool.make(key, seed, seed_deps)
+            VirtualPython3Environment.build(venv_dir, requirements, pool.dependencies(key))
+            # never swap in an environment we cannot import the dependencies from
+            if not smoke_test(os.path.join(venv_dir, "bin", "python3"), venv_dir, requirements):
+                logger.error(f"Discarding the virtual environment '{key}'")
+                pool.remove(key)
+                return False
+    except Timeout:
+        logger.info(f"The virtual environment '{key}' is already being built by another process")
+        return False
+    finally:
+        _remove(pool.staging(key))
+    # swap
+    pool.assign(profile, key)
+    write_lock(profile.requirements_lock, venv_dir, requirements)
+    logger.info(f"Profile '{profile.name}' now uses the virtual environment '{key}'")
+    return True
+
+
+def _remove(fpath: str):
+    try:
+        os.remove(fpath)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(0 if stage(sys.argv[1], sys.argv[2:]) else 1)
@@ -1,11 +1,5 @@
-import json
-import traceback
 from abc import abstractmethod
 from threading import Thread
-from typing import Optional
-
-import requests
-from requests import JSONDecodeError, Response
 
 from dt_shell.utils import DebugInfo
 
@@ -13,10 +7,8 @@ import dockertown
 from dt_shell.database import DTShellDatabase
 
 from dt_shell_cli import logger
-from .constants import DTShellConstants, DTHUB_URL, DB_BILLBOARDS
-from .hub import HUBApiError, hub_api_post
+from .constants import DTShellConstants, DB_BILLBOARDS
 from .shell import Event, DTShell
-from .statistics import ShellProfileEventsDatabase
 
 
 class Task(Thread):
@@ -91,58 +83,6 @@ class Task(Thread):
         pass
 
 
-class UpdateBillboardsTask(Task):
-
-    def __init__(self, shell, **kwargs):
-        super(UpdateBillboardsTask, self).__init__(shell, name="billboards-updater", **kwargs)
-        self._db: DTShellDatabase = DTShellDatabase.open(DB_BILLBOARDS)
-
-    def execute(self):
-        url: str = f"{DTHUB_URL}/api/v1/billboard/list/"
-        raw: Optional[Response] = None
-        bboards: list[dict] = []
-        # reach out to the HUB and grab the new billboards
-        while url:
-            try:
-                logger.debug(f"GET {url}")
-                raw = requests.get(url)
-                response: dict = raw.json()
-                self._shell.profile.events.new("shell/billboards/update")
-            except JSONDecodeError:
-                logger.warning("An error occurred while decoding the received billboards. Use --verbose for further info")
-                logger.debug(traceback.format_exc())
-                logger.debug("HUB response:\n" + str(raw))
-                # mark as updated so we don't retry right away
-                self._shell.mark_updated("billboards")
-                return
-            except Exception:
-                logger.warning("An error occurred while updating the billboards")
-                logger.debug(traceback.format_exc())
-                # mark as updated so we don't retry right away
-                self._shell.mark_updated("billboards")
-                return
-            # check response
-            if response.get("success", False) is not True:
-                logger.warning("An error occurred while updating the billboards")
-                logger.debug("HUB response:\n" + json.dumps(response, indent=4, sort_keys=True))
-                # mark as updated so we don't retry right away
-                self._shell.mark_updated("billboards")
-                return
-            result: dict = response.get("result", {})
-            results: list[dict] = result.get("results", [])
-            bboards.extend(results)
-            url = result.get("next", "")
-        # update local database
-        self._db.clear()
-        for bboard in bboards:
-            self._db.set(bboard["name"], bboard)
-        self._shell.mark_updated("billboards")
-        logger.debug("Billboards updated!")
-
-    def shutdown(self, event: Event):
-        pass
-
-
 class CollectDockerVersionTask(Task):
 
     def __init__(self, shell, **kwargs):
@@ -168,45 +108,3 @@ class CollectDockerVersionTask(Task):
 
     def shutdown(self, event: Event):
         pass
-
-
-class UploadStatisticsTask(Task):
-
-    def __init__(self, shell, **kwargs):
-        super(UploadStatisticsTask, self).__init__(shell, name="stats-uploader", killable=True, **kwargs)
-        self._db: ShellProfileEventsDatabase = shell.profile.events
-        self._token: Optional[str] = shell.profile.secrets.dt_token
-
-    def execute(self):
-        if self._token is None:
-            return
-        # push events
-        for evt in self._db.events():
-            try:
-                data: dict = {
-                    "key": evt.name,
-                    "format": evt.format,
-                    "payload": evt.payload,
-                    "stamp": evt.time_millis
-                }
-                if evt.labels:
-                    data["labels"] = evt.labels
-                hub_api_post("statistics/user/event", data)
-                evt.delete()
-                if DTShellConstants.VERBOSE:
-                    logger.debug(f"Event '{evt.__key__}' pushed to the HUB")
-            except HUBApiError as e:
-                if e.code == 409:
-                    # duplicated stats points
-                    evt.delete()
-                    continue
-                if DTShellConstants.VERBOSE:
-                    logger.debug(e.human)
-            except:
-                if DTShellConstants.VERBOSE:
-                    logger.debug(traceback.format_exc())
-        # mark as done
-        self._shell.mark_done("upload_events")
-
-    def shutdown(self, event: Event):
-        pass
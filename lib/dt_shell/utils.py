@@ -1,3 +1,4 @@
+import glob
 import logging
 import os
 import sys
@@ -5,6 +6,8 @@ import platform
 import re
 import shutil
 import subprocess
+import tempfile
+import time
 import importlib
 import locale
 import json
@@ -23,8 +26,9 @@ from dt_authentication import DuckietownToken
 
 from dt_shell_cli import logger
 from . import __version__
-from .constants import BASH_COMPLETION_DIR, SHELL_LIB_DIR, DTShellConstants
-from .exceptions import ShellInitException, RunCommandException
+from .constants import BASH_COMPLETION_DIR, SHELL_LIB_DIR, DTShellConstants, DEFAULT_WHEELHOUSE_DIR, \
+    DB_BASH_COMPLETION_INSTALL
+from .exceptions import ShellInitException, RunCommandException, UserError
 
 NOTSET = object()
 MAX_PIP_INSTALL_ATTEMPTS = 2
@@ -236,12 +240,101 @@ class DebugInfo:
     name2versions: Dict[str, Union[str, Dict[str, str]]] = {}
 
 
+# distributions seeded in new virtual environments (pip is the only one required)
+BOOTSTRAP_DISTRIBUTIONS: List[str] = ["pip", "setuptools", "wheel"]
+
+
 def install_pip_tool(interpreter: str):
+    """
+    Installs pip (and setuptools and wheel, if available) in the virtual environment of the given interpreter.
+    In order of preference, pip is installed from the wheels in the local wheelhouse (seeded with the ones
+    bundled with Python), through ensurepip, and finally through the bundled get-pip.py (slow, needs network).
+    """
+    logger.info("Installing pip...")
+    stime: float = time.time()
+    steps: List[Tuple[str, Any]] = [
+        ("wheelhouse", _install_pip_tool_from_wheelhouse),
+        ("ensurepip", _install_pip_tool_with_ensurepip),
+        ("get-pip.py", _install_pip_tool_with_get_pip),
+    ]
+    for i, (name, step) in enumerate(steps):
+        step_stime: float = time.time()
+        try:
+            step(interpreter)
+        except ShellInitException as e:
+            logger.debug(f"Could not install pip using {name} in {time.time() - step_stime:.2f}s: {e}")
+            if i == len(steps) - 1:
+                raise
+            continue
+        logger.debug(f"pip installed using {name} in {time.time() - step_stime:.2f}s "
+                     f"({time.time() - stime:.2f}s in total)")
+        return
+
+
+def _bootstrap_wheels() -> Dict[str, str]:
+    """
+    Returns the wheels of the bootstrap distributions available in the local wheelhouse (distribution ->
+    wheel path), seeding the wheelhouse with the wheels bundled with Python (see ensurepip) if needed.
+    """
+    wheelhouse: str = wheelhouse_dir()
+    os.makedirs(wheelhouse, exist_ok=True)
+
+    def find() -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        for name in BOOTSTRAP_DISTRIBUTIONS:
+            # the most recent version wins
+            candidates: List[str] = sorted(
+                glob.glob(os.path.join(wheelhouse, f"{name}-*-py3-none-any.whl")),
+                key=lambda f: [int(p) if p.isdigit() else 0 for p in os.path.basename(f).split("-")[1].split(".")]
+            )
+            if candidates:
+                found[name] = candidates[-1]
+        return found
+
+    wheels: Dict[str, str] = find()
+    if "pip" not in wheels:
+        try:
+            import ensurepip
+            bundled: str = os.path.join(os.path.dirname(ensurepip.__file__), "_bundled")
+            for fname in os.listdir(bundled):
+                if fname.endswith(".whl"):
+                    shutil.copy(os.path.join(bundled, fname), wheelhouse)
+        except (ImportError, OSError) as e:
+            logger.debug(f"Could not find the wheels bundled with Python: {e}")
+        wheels = find()
+    return wheels
+
+
+def _install_pip_tool_from_wheelhouse(interpreter: str):
+    wheels: Dict[str, str] = _bootstrap_wheels()
+    if "pip" not in wheels:
+        raise ShellInitException("No pip wheels available in the local wheelhouse")
+    # pip can run straight from its wheel to install itself
+    pip_from_wheel: str = os.path.join(wheels["pip"], "pip")
+    try:
+        subprocess.check_output(
+            [interpreter, pip_from_wheel, "install", "--no-index", "--no-cache-dir", "--disable-pip-version-check",
+             "--quiet", *wheels.values()],
+            stderr=subprocess.STDOUT
+        )
+    except subprocess.CalledProcessError as e:
+        logger.debug(e.stdout.decode("utf-8", errors="replace"))
+        raise ShellInitException("An error occurred while installing pip from the local wheelhouse")
+
+
+def _install_pip_tool_with_ensurepip(interpreter: str):
+    try:
+        subprocess.check_output([interpreter, "-m", "ensurepip", "--default-pip"], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        logger.debug(e.stdout.decode("utf-8", errors="replace"))
+        raise ShellInitException("An error occurred while installing pip through ensurepip")
+
+
+def _install_pip_tool_with_get_pip(interpreter: str):
     get_pip_fpath: str = os.path.join(SHELL_LIB_DIR, "assets", "get-pip.py")
     if not os.path.exists(get_pip_fpath):
         msg = f"Required file for pip installation not found: {get_pip_fpath}"
         raise ShellInitException(msg)
-    logger.info("Installing pip...")
     try:
         subprocess.check_output([interpreter, get_pip_fpath], stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
@@ -250,24 +343,127 @@ def install_pip_tool(interpreter: str):
         raise ShellInitException(msg, stdout=e.stdout, stderr=e.stderr)
 
 
-def pip_install(interpreter: str, requirements: str):
-    run = subprocess.check_call if logger.level <= logging.DEBUG else subprocess.check_output
+def wheelhouse_dir() -> str:
+    return os.path.abspath(os.environ.get("DTSHELL_WHEELHOUSE", DEFAULT_WHEELHOUSE_DIR))
+
+
+def pip_install(interpreter: str, requirements: Union[str, List[str]], options: Optional[List[str]] = None):
+    """
+    Installs the given dependencies lists with a single invocation of pip, so that they are resolved together.
+    Wheels are taken from (and added to) the local wheelhouse.
+    """
+    requirements: List[str] = [requirements] if isinstance(requirements, str) else requirements
+    if not requirements:
+        return
+    options: List[str] = options or []
+    files: List[str] = [arg for fpath in requirements for arg in ["-r", fpath]]
+    wheelhouse: str = wheelhouse_dir()
+    os.makedirs(wheelhouse, exist_ok=True)
+    local: List[str] = ["--no-index", "--find-links", wheelhouse]
+    what: str = ", ".join(f"'{fpath}'" for fpath in requirements)
+    # try with the wheels we have already (works offline)
+    try:
+        _pip(interpreter, ["install", *local, *options, *files], quiet=True)
+        logger.debug(f"Dependencies in {what} installed from the local wheelhouse")
+        return
+    except ShellInitException:
+        logger.debug(f"Not all the dependencies in {what} are available in the local wheelhouse")
+    # add the missing wheels to the wheelhouse (downloaded or built only once)
+    try:
+        _pip(interpreter, ["wheel", "--wheel-dir", wheelhouse, "--find-links", wheelhouse, *options, *files])
+    except ShellInitException:
+        # some dependencies cannot be turned into wheels, install from the index
+        logger.debug(f"Could not add the dependencies in {what} to the local wheelhouse")
+        _pip(interpreter, ["install", "--find-links", wheelhouse, *options, *files])
+        return
+    # install from the wheelhouse
+    _pip(interpreter, ["install", *local, *options, *files])
+
+
+def pip_resolve(interpreter: str, requirements: List[str]) -> Optional[List[dict]]:
+    """
+    Resolves the given dependencies lists together without installing anything.
+    Returns the 'install' section of pip's installation report (one entry per distribution), None if the
+    resolution is not possible (e.g., pip older than 22.2).
+    """
+    files: List[str] = [arg for fpath in requirements for arg in ["-r", fpath]]
+    wheelhouse: str = wheelhouse_dir()
+    fd, report_fpath = tempfile.mkstemp(prefix="dts-pip-report-", suffix=".json")
+    os.close(fd)
+    resolve: List[str] = ["install", "--dry-run", "--ignore-installed", "--report", report_fpath, *files]
+    try:
+        # try with the wheels we have already (works offline), then with the index
+        for index in [["--no-index", "--find-links", wheelhouse], ["--find-links", wheelhouse]]:
+            try:
+                _pip(interpreter, [*resolve, *index], quiet=True)
+            except ShellInitException:
+                continue
+            with open(report_fpath, "rt") as fin:
+                return json.load(fin)["install"]
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug(f"Could not read pip's installation report: {e}")
+    finally:
+        os.remove(report_fpath)
+    return None
+
+
+def pip_uninstall(interpreter: str, distributions: List[str]):
+    if not distributions:
+        return
+    _pip(interpreter, ["uninstall", "--yes", *distributions])
+
+
+def _pip(interpreter: str, args: List[str], quiet: bool = False):
+    verbose: bool = logger.level <= logging.DEBUG and not quiet
+    run = subprocess.check_call if verbose else subprocess.check_output
+    # we do not want the PYTHONPATH of the shell to leak into the virtual environment
+    env: Dict[str, str] = {**os.environ}
+    env.pop("PYTHONPATH", None)
+    env.pop("PYTHONHOME", None)
     for attempt in range(MAX_PIP_INSTALL_ATTEMPTS):
         try:
             run(
-                [interpreter, "-m", "pip", "install", "-r", requirements],
+                [interpreter, "-m", "pip", *args],
                 stderr=subprocess.STDOUT,
-                env={}
+                env=env
             )
             break
         except subprocess.CalledProcessError as e:
             error = e.stdout.decode("utf-8", errors="replace") if e.stdout else ""
             if attempt == MAX_PIP_INSTALL_ATTEMPTS - 1 or "No module named pip" not in error:
                 msg: str = "An error occurred while installing python dependencies"
+                # failures are expected when quiet (e.g., offline attempts), the caller decides what to show
+                if quiet:
+                    logger.debug(error)
+                    raise ShellInitException(msg)
                 raise ShellInitException(msg, stdout=e.stdout, stderr=e.stderr)
             install_pip_tool(interpreter)
 
 
+def compile_bytecode(interpreter: str, path: str, prefix: Optional[str] = None) -> bool:
+    """
+    Compiles all the python files in the given directory tree to bytecode using all the available cores.
+    If a prefix is given, bytecode is written there instead of next to the sources (see PYTHONPYCACHEPREFIX).
+    """
+    # the user asked python not to write bytecode
+    if sys.dont_write_bytecode or not os.path.isdir(path):
+        return False
+    env: Dict[str, str] = {**os.environ}
+    env.pop("PYTHONPATH", None)
+    if prefix is not None:
+        env["PYTHONPYCACHEPREFIX"] = prefix
+    cmd: List[str] = [interpreter, "-m", "compileall", "-q", "-j", "0", "-x", r"[/\\]\.git[/\\]", path]
+    logger.debug(f"Compiling python files in '{path}' to bytecode...")
+    stime: float = time.time()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+    if proc.returncode != 0:
+        # some files might not compile (e.g., python2 sources in packages), the rest is compiled anyway
+        logger.debug(f"Some files in '{path}' could not be compiled:\n"
+                     f"{proc.stdout.decode('utf-8', errors='replace')}")
+    logger.debug(f"Python files in '{path}' compiled in {time.time() - stime:.2f} seconds")
+    return proc.returncode == 0
+
+
 def indent_block(s: str, indent_len: int = 4) -> str:
     space: str = " " * indent_len
     return space + f"\n{space}".join(s.splitlines() if s is not None else ["None"])
@@ -286,7 +482,7 @@ def ensure_bash_completion_installed():
     import dt_shell
     from dt_shell.database import DTShellDatabase
     if platform.system() in ["Linux", "Darwin"]:
-        db: DTShellDatabase = DTShellDatabase.open("bash-completion-install")
+        db: DTShellDatabase = DTShellDatabase.open(DB_BASH_COMPLETION_INSTALL)
         key: str = f"dts-comletion-{dt_shell.__version__}"
         if not db.contains(key):
             logger.info("Installing bash-completion script...")
@@ -346,6 +542,21 @@ def print_debug_info() -> None:
     dts_print(msg, "yellow")
 
 
+def disable_prompts():
+    """
+    Makes every question to the user fail right away instead of waiting for an answer (see lean mode).
+    """
+    import questionary
+
+    def _fail(question, *_, **__):
+        raise UserError("The shell needs to ask you something but it is running in lean mode (e.g., no "
+                        "terminal attached). Run the command from a terminal without the option --lean and the "
+                        "environment variable DTSHELL_LEAN.")
+
+    questionary.Question.ask = _fail
+    questionary.Question.unsafe_ask = _fail
+
+
 def env_option(key: str, default: Any = NOTSET, true_choices: List[str] = None) -> Optional[Any]:
     if default in [NOTSET, True, False]:
         # boolean options
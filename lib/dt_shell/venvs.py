@@ -0,0 +1,287 @@
+import hashlib
+import os
+import platform
+import shutil
+import sys
+import time
+from typing import Optional, List, Dict, Iterator, Tuple
+
+from filelock import FileLock, Timeout
+
+from . import logger
+from .constants import DTShellConstants, DEFAULT_VENVS_DIR, DB_PROFILES, DB_VIRTUAL_ENVIRONMENTS, DB_INSTALLED_DEPENDENCIES
+from .database import DTShellDatabase
+from .database.utils import InstalledDependenciesDatabase
+
+# bump this every time the way virtual environments are built changes
+POOL_VERSION: int = 1
+# a process building an environment in the background takes the lock within this time from when it is started
+STAGING_GRACE_SECS: int = 60
+
+
+class VirtualEnvironmentsPool:
+    """
+    Pool of Python virtual environments shared among profiles.
+    Environments are addressed by the content of the dependencies lists they were built from and the version
+    of the interpreter, profiles with the same dependencies point (through the symlink <profile>/venv) to the
+    same environment. The database 'virtual_environments' keeps track of which profiles use which environment.
+    """
+
+    def __init__(self, location: Optional[str] = None):
+        self.location: str = location or os.environ.get("DTSHELL_VENVS", DEFAULT_VENVS_DIR)
+        self._db: DTShellDatabase[dict] = DTShellDatabase.open(DB_VIRTUAL_ENVIRONMENTS)
+
+    @staticmethod
+    def key(requirements: List[Optional[str]]) -> str:
+        """
+        Computes the key of the environment satisfying the given dependencies lists.
+        """
+        h = hashlib.sha1()
+        h.update(f"v{POOL_VERSION}\n".encode("utf-8"))
+        # interpreter
+        h.update(f"{platform.python_implementation()}-{platform.python_version()}-{platform.machine()}\n"
+                 f"{os.path.realpath(sys.executable)}\n".encode("utf-8"))
+        # dependencies
+        for fpath in requirements:
+            if fpath is None:
+                continue
+            with open(fpath, "rb") as fin:
+                h.update(fin.read())
+            h.update(b"\n")
+        return h.hexdigest()[:16]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.location, key)
+
+    def _metadata(self, key: str) -> str:
+        # this is never carried over to other environments
+        return os.path.join(self.path(key), ".dts")
+
+    def contains(self, key: str) -> bool:
+        return os.path.isdir(self.path(key))
+
+    def lock(self, key: str, timeout: float = -1) -> FileLock:
+        os.makedirs(self.location, exist_ok=True)
+        return FileLock(os.path.join(self.location, f"{key}.lock"), timeout=timeout)
+
+    def locked(self, key: str) -> bool:
+        """
+        Tells whether the given environment is being built by another process (or one is about to).
+        """
+        try:
+            if time.time() - os.path.getmtime(self.staging(key)) < STAGING_GRACE_SECS:
+                return True
+        except FileNotFoundError:
+            pass
+        try:
+            with self.lock(key, timeout=0):
+                return False
+        except Timeout:
+            return True
+
+    def staging(self, key: str) -> str:
+        # marker left by a process that started a build in the background, until the build takes the lock
+        return os.path.join(self.location, f"{key}.staging")
+
+    def log(self, key: str) -> str:
+        # output of the last build of the environment that happened in the background
+        return os.path.join(self.location, f"{key}.log")
+
+    def dependencies(self, key: str) -> InstalledDependenciesDatabase:
+        """
+        Dependencies lists installed in the given environment.
+        """
+        # noinspection PyTypeChecker
+        return InstalledDependenciesDatabase.open(DB_INSTALLED_DEPENDENCIES, location=self._metadata(key))
+
+    def key_of(self, profile) -> Optional[str]:
+        """
+        Returns the key of the environment used by the given profile, None if the profile does not use one
+        from this pool.
+        """
+        venv_dir: str = os.path.join(profile.path, "venv")
+        if not os.path.islink(venv_dir):
+            return None
+        target: str = os.path.realpath(venv_dir)
+        if os.path.dirname(target) != os.path.realpath(self.location):
+            return None
+        return os.path.basename(target)
+
+    def make(self, key: str, seed: Optional[str] = None, seed_dependencies: Optional[dict] = None):
+        """
+        Makes a new (empty) entry in the pool. If a seed environment is given, its content is carried over
+        so that only the dependencies that changed need to be installed.
+        """
+        destination: str = self.path(key)
+        if seed is None or not os.path.isfile(os.path.join(seed, "bin", "python3")):
+            os.makedirs(destination, exist_ok=True)
+            return
+        logger.info("Creating new virtual environment from the existing one...")
+        tmp: str = f"{destination}.tmp"
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        # hard links make the copy fast and cheap, pip replaces files rather than changing them
+        try:
+            shutil.copytree(seed, tmp, symlinks=True, ignore=_ignore_metadata, copy_function=os.link)
+        except (OSError, shutil.Error):
+            shutil.rmtree(tmp, ignore_errors=True)
+            shutil.copytree(seed, tmp, symlinks=True, ignore=_ignore_metadata)
+        _relocate(tmp, os.path.realpath(seed), destination)
+        os.rename(tmp, destination)
+        # carry over the record of what is installed
+        if seed_dependencies:
+            self.dependencies(key).update(seed_dependencies)
+
+    def adopt(self, key: str, venv_dir: str, dependencies: Optional[dict] = None):
+        """
+        Moves an existing (non-pooled) environment into the pool.
+        """
+        logger.info(f"Moving virtual environment '{venv_dir}' to the shared pool...")
+        source: str = os.path.realpath(venv_dir)
+        destination: str = self.path(key)
+        os.makedirs(self.location, exist_ok=True)
+        shutil.move(source, destination)
+        _relocate(destination, source, destination)
+        if dependencies:
+            self.dependencies(key).update(dependencies)
+
+    def replace(self, key: str, source: str):
+        """
+        Swaps the given entry of the pool (e.g., a '<key>.<pid>.tmp' one, built from scratch) in place of the given
+        environment. Profiles using the environment get the new one from their next run.
+        """
+        destination: str = os.path.abspath(self.path(key))
+        old: str = f"{destination}.{os.getpid()}.old.tmp"
+        _relocate(self.path(source), os.path.abspath(self.path(source)), destination)
+        if os.path.exists(destination):
+            os.rename(destination, old)
+        os.rename(self.path(source), destination)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def assign(self, profile, key: str):
+        """
+        Points the given profile to the given environment.
+        """
+        venv_dir: str = os.path.join(profile.path, "venv")
+        current: Optional[str] = self.key_of(profile)
+        if current != key:
+            if os.path.isdir(venv_dir) and not os.path.islink(venv_dir):
+                # the profile has its own environment but another profile moved an equivalent one to the pool
+                # before us, ours is not needed anymore
+                logger.info(f"Removing virtual environment '{venv_dir}', the one in the shared pool is used "
+                            f"instead...")
+                shutil.rmtree(venv_dir)
+            tmp: str = f"{venv_dir}.{os.getpid()}.tmp"
+            os.symlink(self.path(key), tmp)
+            os.replace(tmp, venv_dir)
+            if DTShellConstants.VERBOSE:
+                logger.debug(f"Profile '{profile.name}' now uses the virtual environment '{key}'")
+        # update references
+        for k, record in self._db.items():
+            if k != key and profile.name in record["profiles"]:
+                self._db.set(k, {**record, "profiles": [p for p in record["profiles"] if p != profile.name]})
+        record: dict = self._db.get(key, {"profiles": [], "created": time.time()})
+        if profile.name not in record["profiles"]:
+            self._db.set(key, {**record, "profiles": record["profiles"] + [profile.name]})
+
+    def release(self, profile):
+        """
+        Detaches the given profile from the environment it uses (if any).
+        """
+        venv_dir: str = os.path.join(profile.path, "venv")
+        if os.path.islink(venv_dir):
+            os.unlink(venv_dir)
+        for k, record in self._db.items():
+            if profile.name in record["profiles"]:
+                self._db.set(k, {**record, "profiles": [p for p in record["profiles"] if p != profile.name]})
+
+    def remove(self, key: str):
+        """
+        Removes the given environment from the pool, regardless of who uses it.
+        """
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        self._db.delete(key)
+
+    def references(self) -> Dict[str, List[str]]:
+        """
+        Returns the profiles using each environment, as found on disk.
+        """
+        refs: Dict[str, List[str]] = {k: [] for k, _ in self.entries()}
+        for name, path in DTShellDatabase.open(DB_PROFILES).items():
+            venv_dir: str = os.path.join(path, "venv")
+            if not os.path.islink(venv_dir):
+                continue
+            target: str = os.path.realpath(venv_dir)
+            if os.path.dirname(target) == os.path.realpath(self.location):
+                refs.setdefault(os.path.basename(target), []).append(name)
+        return refs
+
+    def entries(self) -> Iterator[Tuple[str, str]]:
+        if not os.path.isdir(self.location):
+            return
+        for key in sorted(os.listdir(self.location)):
+            path: str = self.path(key)
+            if os.path.isdir(path) and not key.endswith(".tmp"):
+                yield key, path
+
+    def garbage_collect(self) -> List[str]:
+        """
+        Removes the environments that are not used by any profile. Returns the keys of the removed ones.
+        """
+        removed: List[str] = []
+        for key, profiles in self.references().items():
+            # keep the database in sync with what we find on disk
+            if self._db.contains(key):
+                record: dict = self._db.get(key)
+                if sorted(record["profiles"]) != sorted(profiles):
+                    self._db.set(key, {**record, "profiles": profiles})
+            if profiles:
+                continue
+            # environments that are being built are not garbage
+            try:
+                with self.lock(key, timeout=0):
+                    logger.debug(f"Removing unused virtual environment '{key}'")
+                    shutil.rmtree(self.path(key))
+            except Timeout:
+                continue
+            self._db.delete(key)
+            if os.path.isfile(self.log(key)):
+                os.remove(self.log(key))
+            removed.append(key)
+        # leftovers of interrupted builds
+        if os.path.isdir(self.location):
+            for name in os.listdir(self.location):
+                if not name.endswith(".tmp"):
+                    continue
+                try:
+                    with self.lock(name[:-len(".tmp")], timeout=0):
+                        shutil.rmtree(self.path(name), ignore_errors=True)
+                except Timeout:
+                    continue
+        return removed
+
+
+def _ignore_metadata(path: str, names: List[str]) -> List[str]:
+    return [".dts"] if ".dts" in names else []
+
+
+def _relocate(venv_dir: str, old: str, new: str):
+    """
+    Rewrites the absolute paths to the environment in its scripts (e.g., shebangs, activate scripts).
+    """
+    bin_dir: str = os.path.join(venv_dir, "bin")
+    old_b, new_b = old.encode("utf-8"), new.encode("utf-8")
+    for name in os.listdir(bin_dir):
+        fpath: str = os.path.join(bin_dir, name)
+        if os.path.islink(fpath) or not os.path.isfile(fpath):
+            continue
+        with open(fpath, "rb") as fin:
+            content: bytes = fin.read()
+        if old_b not in content:
+            continue
+        # write a new file, this might be a hard link to a file of another environment
+        tmp: str = f"{fpath}.tmp"
+        with open(tmp, "wb") as fout:
+            fout.write(content.replace(old_b, new_b))
+        shutil.copymode(fpath, tmp)
+        os.replace(tmp, fpath)
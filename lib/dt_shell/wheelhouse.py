@@ -0,0 +1,60 @@
+import glob
+import os
+import re
+from typing import List, Tuple, Set, Optional
+
+from .utils import wheelhouse_dir
+
+Distribution = Tuple[str, str]
+
+
+def normalize_name(name: str) -> str:
+    # see PEP 503
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def wheel_distribution(fpath: str) -> Optional[Distribution]:
+    """
+    Returns the (normalized) name and version of the distribution contained in the given wheel file.
+    """
+    # see PEP 427: {distribution}-{version}(-{build tag})?-{python tag}-{abi tag}-{platform tag}.whl
+    parts: List[str] = os.path.basename(fpath)[:-len(".whl")].split("-")
+    if len(parts) < 5:
+        return None
+    return normalize_name(parts[0]), parts[1]
+
+
+def installed_distributions(venv_dir: str) -> Set[Distribution]:
+    """
+    Returns the (normalized) name and version of the distributions installed in the given virtual environment.
+    """
+    distributions: Set[Distribution] = set()
+    for dist_info in glob.glob(os.path.join(venv_dir, "lib", "python*", "site-packages", "*.dist-info")):
+        name, _, version = os.path.basename(dist_info)[:-len(".dist-info")].partition("-")
+        distributions.add((normalize_name(name), version))
+    return distributions
+
+
+def wheels() -> List[str]:
+    return sorted(glob.glob(os.path.join(wheelhouse_dir(), "*.whl")))
+
+
+def size() -> int:
+    """
+    Size of the wheelhouse in bytes.
+    """
+    return sum(os.path.getsize(fpath) for fpath in wheels())
+
+
+def prune(keep: Optional[Set[Distribution]] = None) -> List[str]:
+    """
+    Removes from the wheelhouse all the wheels of distributions that are not in the given set (all of them if
+    no set is given). Returns the paths to the removed wheels.
+    """
+    removed: List[str] = []
+    for fpath in wheels():
+        if keep is not None and wheel_distribution(fpath) in keep:
+            continue
+        os.remove(fpath)
+        removed.append(fpath)
+    return removed
@@ -39,9 +39,9 @@ def dts():
     from dt_shell.constants import DTShellConstants, EMBEDDED_COMMAND_SET_NAME
     from dt_shell.logging import setup_logging_color, dts_print
     from dt_shell.checks.environment import abort_if_running_with_sudo
-    from dt_shell.shell import get_cli_options
+    from dt_shell.shell import get_cli_options, lean_mode
     from dt_shell.commands import CommandDescriptor
-    from dt_shell.environments import ShellCommandEnvironmentAbs
+    from dt_shell.environments import ShellCommandEnvironmentAbs, VirtualPython3Environment
     from dt_shell.exceptions import CommandNotFound, ShellInitException, UserAborted, UserError, ConfigInvalid
     from dt_shell.utils import replace_spaces, print_debug_info
     from dt_shell import DTShell, dtslogger
@@ -66,6 +66,7 @@ def dts():
     DTShellConstants.DEBUG = cli_options.debug
     DTShellConstants.VERBOSE = cli_options.verbose
     DTShellConstants.QUIET = cli_options.quiet
+    DTShellConstants.LEAN = lean_mode(cli_options)
 
     # notify user of their choices
     if DTSHELL_LIB:
@@ -113,6 +114,23 @@ def dts():
                            "contact technical support")
         # TODO: maybe suggest clearing the profile directory?
 
+    # batches run in the environment of the embedded commands
+    if cli_options.batch:
+        env: ShellCommandEnvironmentAbs = shell.command_set(EMBEDDED_COMMAND_SET_NAME).configuration \
+            .default_environment()
+        # we are already in the interpreter the commands run in, the batch runs here
+        if not isinstance(env, VirtualPython3Environment):
+            from dt_shell.batch import BatchRunner
+            shell.reload_commands(skeleton=False)
+            runner: BatchRunner = BatchRunner(shell, cli_options.batch, cli_options.keep_going, cli_options.summary)
+            exit(runner.run())
+        try:
+            env.execute(shell, [])
+        except ShellInitException:
+            logger.error("An error occurred, the reason for the error should be printed above.")
+            exit(99)
+        return
+
     # get command's environment and use it to execute the command
     arguments = list(map(replace_spaces, arguments))
     cmdline = " ".join(arguments)
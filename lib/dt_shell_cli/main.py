@@ -10,11 +10,12 @@ import logging
 from dt_shell_cli import logger
 
 from dt_shell import DTShell, dtslogger, CommandsLoadingException
-from dt_shell.shell import get_cli_options
+from dt_shell.shell import get_cli_options, lean_mode
 from dt_shell.logging import setup_logging_color, dts_print
 from dt_shell.constants import DTShellConstants
 from dt_shell.environments import Python3Environment
 from dt_shell.checks.environment import abort_if_running_with_sudo
+from dt_shell_launcher import DTSHELL_LAUNCHER_ENV
 
 
 # NOTE: this file runs the shell in this interpreter and in quiet mode, the entrypoint should always be
@@ -36,6 +37,7 @@ def main() -> None:
     DTShellConstants.DEBUG = cli_options.debug
     DTShellConstants.VERBOSE = cli_options.verbose
     DTShellConstants.QUIET = cli_options.quiet
+    DTShellConstants.LEAN = lean_mode(cli_options)
 
     # we run in quiet mode
     logger.setLevel(logging.WARNING)
@@ -46,14 +48,17 @@ def main() -> None:
     if cli_options.verbose:
         logger.setLevel(logging.DEBUG)
 
+    # when started by the launcher, nobody showed the banner yet
+    launched: bool = os.environ.pop(DTSHELL_LAUNCHER_ENV, None) is not None
+
     # instantiate shell
     shell: Optional[DTShell] = None
     try:
         shell = DTShell(
             skeleton=False,
             readonly=False,
-            banner=False,
-            billboard=False,
+            banner=launched,
+            billboard=launched,
             profile=cli_options.profile
         )
     except CommandsLoadingException as e:
@@ -63,6 +68,12 @@ def main() -> None:
         dts_print("FATAL: " + str(e))
         exit(91)
 
+    # run the commands in the given file
+    if cli_options.batch:
+        from dt_shell.batch import BatchRunner
+        runner: BatchRunner = BatchRunner(shell, cli_options.batch, cli_options.keep_going, cli_options.summary)
+        exit(runner.run())
+
     # run command in this interpreter
     Python3Environment().execute(shell, arguments)
 
@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+from typing import Optional, Dict, List
+
+# NOTE: this is the entrypoint of the command `dts`, it has to be as light as possible, only import modules
+#       from the standard library here and DO NOT IMPORT DT_SHELL (see dt_shell_cli/dts.py).
+
+# bump this every time the format of the stamp changes
+STAMP_VERSION: int = 1
+# environment variables that change what the shell does before delegating to the virtual environment
+STAMP_ENVIRONMENT: List[str] = [
+    "DTSHELL_ROOT", "DTSHELL_LIB", "DTSHELL_PROFILE", "DTSHELL_PROFILES", "DTSHELL_DATABASES", "DTSHELL_DISTRO",
+    "DTSHELL_COMMANDS", "DTSHELL_VENV_DIR", "DTSHELL_VENVS", "DTSHELL_PYTHONPATH", "IGNORE_ENVIRONMENTS", "PYTHONPATH",
+]
+# shell options that can be handed over to the virtual environment as they are
+LIGHT_OPTIONS: List[str] = ["--debug", "-vv", "--verbose", "-q", "--quiet", "--lean"]
+# environment variable telling the shell that it was launched by us
+DTSHELL_LAUNCHER_ENV: str = "DTSHELL_LAUNCHER"
+
+
+def stamp_path() -> str:
+    root: str = os.path.expanduser(os.environ.get("DTSHELL_ROOT", "~/.duckietown/shell/"))
+    return os.path.join(root, "launcher.json")
+
+
+def fingerprint(fpath: str) -> Optional[List[int]]:
+    """
+    Cheap fingerprint of a file (modification time and size), None if the file does not exist.
+    """
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def environment() -> Dict[str, Optional[str]]:
+    return {key: os.environ.get(key, None) for key in STAMP_ENVIRONMENT}
+
+
+def write_stamp(interpreter: str, main_py: str, exec_env: Dict[str, str], watch: List[str],
+                excluded: List[str]):
+    """
+    Records what is needed to run the shell straight in the virtual environment the next time.
+
+    Args:
+        interpreter:    Interpreter of the virtual environment
+        main_py:        Entrypoint of the shell inside the virtual environment
+        exec_env:       Environment variables to add to the environment of the virtual environment
+        watch:          Files that, if changed, invalidate the stamp (e.g., databases, dependencies lists)
+        excluded:       Commands that do not run in the virtual environment
+    """
+    stamp: dict = {
+        "version": STAMP_VERSION,
+        "launcher": os.path.abspath(__file__),
+        "interpreter": interpreter,
+        "main": main_py,
+        "exec_env": exec_env,
+        "environment": environment(),
+        "watch": {fpath: fingerprint(fpath) for fpath in watch + [interpreter, main_py]},
+        "excluded": sorted(set(excluded)),
+    }
+    fpath: str = stamp_path()
+    tmp_fpath: str = f"{fpath}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    with open(tmp_fpath, "wt") as fout:
+        json.dump(stamp, fout)
+    os.replace(tmp_fpath, fpath)
+
+
+def invalidate_stamp():
+    try:
+        os.remove(stamp_path())
+    except FileNotFoundError:
+        pass
+
+
+def read_stamp() -> Optional[dict]:
+    """
+    Returns the stamp if nothing it depends on changed since it was written, None otherwise.
+    """
+    try:
+        with open(stamp_path(), "rt") as fin:
+            stamp: dict = json.load(fin)
+    except (OSError, ValueError):
+        return None
+    # make sure nothing changed since the last time
+    if stamp.get("version") != STAMP_VERSION or stamp.get("launcher") != os.path.abspath(__file__):
+        return None
+    if stamp["environment"] != environment():
+        return None
+    for fpath, fp in stamp["watch"].items():
+        if fingerprint(fpath) != fp:
+            return None
+    return stamp
+
+
+def _load_stamp(args: List[str]) -> Optional[dict]:
+    # we need a command to run
+    words: List[str] = [a for a in args if not a.startswith("-")]
+    options: List[str] = args[:args.index(words[0])] if words else args
+    if not words or any(o not in LIGHT_OPTIONS for o in options):
+        return None
+    stamp: Optional[dict] = read_stamp()
+    if stamp is None or words[0] in stamp["excluded"]:
+        return None
+    return stamp
+
+
+def launch():
+    """
+    Runs the shell straight in the virtual environment of the profile if nothing changed since the last
+    time the full shell (see dt_shell_cli/dts.py) did, falls back to the full shell otherwise.
+    """
+    args: List[str] = sys.argv[1:]
+    stamp: Optional[dict] = _load_stamp(args)
+    if stamp is None:
+        from dt_shell_cli.dts import dts
+        dts()
+        return
+    # run shell in virtual environment
+    interpreter: str = stamp["interpreter"]
+    exec_env: Dict[str, str] = {**os.environ, **stamp["exec_env"], DTSHELL_LAUNCHER_ENV: "1"}
+    exec_env.pop("PYTHONPATH", None)
+    os.execle(interpreter, interpreter, stamp["main"], *args, exec_env)
+
+
+if __name__ == '__main__':
+    launch()
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# keep the shell from touching the databases, environments and mirrors of the user running the tests
+_root: str = tempfile.mkdtemp(prefix="dts-tests-")
+os.environ["DTSHELL_DATABASES"] = os.path.join(_root, "databases")
+os.environ["DTSHELL_PROFILES"] = os.path.join(_root, "profiles")
+os.environ["DTSHELL_VENVS"] = os.path.join(_root, "venvs")
+os.environ["DTSHELL_MIRRORS"] = os.path.join(_root, "mirrors")
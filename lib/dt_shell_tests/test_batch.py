@@ -0,0 +1,64 @@
+from typing import List
+
+import pytest
+
+from dt_shell.batch import BatchRunner
+
+
+def _runner(tmp_path, content: str, **kwargs) -> BatchRunner:
+    fpath = tmp_path / "batch.txt"
+    fpath.write_text(content)
+    return BatchRunner(None, str(fpath), **kwargs)
+
+
+def test_parse(tmp_path):
+    runner = _runner(tmp_path, "\n".join([
+        "# build everything",
+        "dts devel build -C one &",
+        "  devel build -C 'two words'&  ",
+        "",
+        "dts devel run --name 'a & b'",
+        "echo &&",
+    ]))
+    commands = runner._parse()
+    assert [c.lineno for c in commands] == [2, 3, 5, 6]
+    assert [c.args for c in commands] == [
+        ["devel", "build", "-C", "one"],
+        ["devel", "build", "-C", "two words"],
+        ["devel", "run", "--name", "a & b"],
+        ["echo", "&"],
+    ]
+    assert [c.parallel for c in commands] == [True, True, False, True]
+    assert commands[0].line == "dts devel build -C one"
+
+
+def test_parse_invalid_line(tmp_path):
+    runner = _runner(tmp_path, "devel build\ndevel run 'unterminated\n")
+    with pytest.raises(ValueError, match="Line 2"):
+        runner._parse()
+
+
+def _run(runner: BatchRunner, exit_codes: dict) -> List[str]:
+    ran: List[str] = []
+
+    def execute(command):
+        ran.append(command.args[0])
+        return exit_codes.get(command.args[0], 0)
+
+    runner._execute = execute
+    runner.exit_code = runner.run()
+    return ran
+
+
+def test_stop_at_first_failure(tmp_path):
+    runner = _runner(tmp_path, "one\ntwo\nthree\n")
+    assert _run(runner, {"two": 3}) == ["one", "two"]
+    assert runner.exit_code == 3
+    assert [c.skipped for c in runner.commands] == [False, False, True]
+
+
+def test_keep_going(tmp_path):
+    runner = _runner(tmp_path, "one\ntwo\nthree\n", keep_going=True)
+    assert _run(runner, {"two": 3, "three": 4}) == ["one", "two", "three"]
+    # the first failure decides the exit code
+    assert runner.exit_code == 3
@@ -0,0 +1,148 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from dt_shell.commands import CommandSet
+from dt_shell.commands.repository import CommandsRepository
+from dt_shell.constants import DB_COMMAND_SET_UPDATES_CHECK
+from dt_shell.database import DTShellDatabase
+
+
+@pytest.fixture
+def command_set(tmp_path) -> CommandSet:
+    databases: str = str(tmp_path / "databases")
+    profile = SimpleNamespace(
+        name="test",
+        path=str(tmp_path),
+        database=lambda name: DTShellDatabase.open(name, location=databases),
+        settings=SimpleNamespace(update_check_bounds=(5, 1440)),
+    )
+    (tmp_path / "commands" / "mine").mkdir(parents=True)
+    return CommandSet(
+        name="mine",
+        path=str(tmp_path / "commands" / "mine"),
+        profile=profile,
+        repository=CommandsRepository.from_remoteurl("https://github.com/duckietown/mine", "main"),
+    )
+
+
+def _records(command_set: CommandSet) -> DTShellDatabase:
+    return command_set.profile.database(DB_COMMAND_SET_UPDATES_CHECK)
+
+
+def test_never_checked_is_due(command_set):
+    assert command_set.update_check_due
+    command_set.mark_as_just_updated("a" * 40)
+    assert not command_set.update_check_due
+    record: dict = _records(command_set).get(command_set.name)
+    _records(command_set).set(command_set.name, {**record, "time": time.time() - 5 * 60})
+    assert command_set.update_check_due
+
+
+class Clock:
+
+    def __init__(self):
+        self.now: float = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def tick(self, minutes: float):
+        self.now += minutes * 60
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+def _interval(command_set: CommandSet) -> float:
+    return _records(command_set).get(command_set.name)["interval"] / 60
+
+
+def test_interval_grows_while_nothing_changes(command_set, clock):
+    command_set.mark_as_just_updated("a")
+    intervals = []
+    for _ in range(12):
+        clock.tick(_interval(command_set) if intervals else 5)
+        command_set._record_check("a", "a")
+        intervals.append(_interval(command_set))
+    # doubles at every check, up to the longest interval
+    assert intervals[:5] == [10, 20, 40, 80, 160]
+    assert intervals[-1] == 1440
+
+
+def test_interval_drops_when_the_remote_changes(command_set, clock):
+    command_set.mark_as_just_updated("a")
+    for _ in range(5):
+        clock.tick(60)
+        command_set._record_check("a", "a")
+    assert _interval(command_set) == 160
+    clock.tick(60)
+    command_set._record_check("a", "b")
+    assert _interval(command_set) == 5
+    record: dict = _records(command_set).get(command_set.name)
+    assert record["changes"] == [clock.now]
+    assert record["remote_sha"] == "b"
+
+
+def test_interval_follows_how_often_the_remote_changes(command_set, clock):
+    command_set.mark_as_just_updated("a")
+    # the remote changes every 2 hours
+    for i in range(6):
+        clock.tick(120)
+        command_set._record_check("a", f"remote-{i}")
+    # nothing new for a while, the interval grows but stays below half the average time between changes
+    for _ in range(10):
+        clock.tick(30)
+        command_set._record_check("a", "remote-5")
+        record: dict = _records(command_set).get(command_set.name)
+        average: float = (clock.now - record["changes"][0]) / len(record["changes"]) / 60
+        assert _interval(command_set) <= average / 2
+    # only the most recent changes are kept
+    assert len(_records(command_set).get(command_set.name)["changes"]) == 5
+
+
+def test_failed_checks_back_off(command_set, clock):
+    command_set.mark_as_just_updated("a")
+    clock.tick(5)
+    command_set._record_check("a", "a")
+    clock.tick(10)
+    command_set._record_check("a", None, failed=True)
+    clock.tick(20)
+    command_set._record_check("a", None, failed=True)
+    record: dict = _records(command_set).get(command_set.name)
+    assert record["failures"] == 2
+    assert _interval(command_set) == 40
+    # what we knew about the remote is kept
+    assert record["remote_sha"] == "a"
+    # the first check that works resets the count
+    clock.tick(40)
+    command_set._record_check("a", "a")
+    assert _records(command_set).get(command_set.name)["failures"] == 0
+
+
+def test_interval_within_bounds(command_set, clock):
+    command_set.profile.settings.update_check_bounds = (10, 60)
+    command_set.mark_as_just_updated("a")
+    for _ in range(5):
+        clock.tick(10)
+        command_set._record_check("a", "a")
+    assert _interval(command_set) == 60
+    # a change right after the previous one
+    clock.tick(1)
+    command_set._record_check("a", "b")
+    assert _interval(command_set) == 10
+
+
+def test_forced_check_ignores_the_schedule(command_set, monkeypatch):
+    checks: list = []
+    monkeypatch.setattr(command_set, "check_for_updates", lambda force=False: checks.append(force) or False)
+    command_set.mark_as_just_updated("a" * 40)
+    assert not command_set.commands_need_update()
+    assert checks == []
+    assert not command_set.commands_need_update(force=True)
+    assert checks == [True]
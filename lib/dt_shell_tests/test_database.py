@@ -0,0 +1,75 @@
+import json
+import os
+
+from dt_shell.constants import DB_UPDATES_CHECK, DB_PYPI_CACHE, STATE_FILE
+from dt_shell.database import DTShellDatabase
+from dt_shell.database.database import DTShellState
+
+
+def test_state_writes_only_its_own_section(tmp_path):
+    location: str = str(tmp_path)
+    # two processes loaded the state at the same time
+    one = DTShellState(location)
+    two = DTShellState(location)
+    one.write("a", {"x": 1})
+    two.write("b", {"y": 2})
+    # nobody overwrote the section of the other
+    assert DTShellState(location).section("a") == {"x": 1}
+    assert DTShellState(location).section("b") == {"y": 2}
+    # sections written by others show up after a reload
+    assert one.section("b") is None
+    one.reload()
+    assert one.section("b") == {"y": 2}
+    # same section, the last writer wins
+    one.write("b", {"y": 3})
+    assert DTShellState(location).section("b") == {"y": 3}
+
+
+def test_state_corrupted(tmp_path):
+    with open(os.path.join(tmp_path, STATE_FILE), "wt") as fout:
+        fout.write("{not json")
+    state = DTShellState(str(tmp_path))
+    assert state.section("a") is None
+    state.write("a", {"x": 1})
+    with open(os.path.join(tmp_path, STATE_FILE), "rt") as fin:
+        assert json.load(fin) == {"version": 1, "sections": {"a": {"x": 1}}}
+
+
+def test_databases_share_the_state_file(tmp_path):
+    location: str = str(tmp_path)
+    updates = DTShellDatabase.open(DB_UPDATES_CHECK, location=location)
+    cache = DTShellDatabase.open(DB_PYPI_CACHE, location=location)
+    updates.set("shell", 123.0)
+    cache.set("requests", {"version": "2.31.0"})
+    assert updates.fpath == cache.fpath == os.path.join(location, STATE_FILE)
+    # none of them has its own file
+    assert sorted(f for f in os.listdir(location) if not f.endswith(".lock")) == [STATE_FILE]
+    state = DTShellState(location)
+    assert state.section(DB_UPDATES_CHECK) == {"shell": 123.0}
+    assert state.section(DB_PYPI_CACHE) == {"requests": {"version": "2.31.0"}}
+
+
+def test_database_carried_over_from_its_own_file(tmp_path):
+    location: str = str(tmp_path / "old")
+    os.makedirs(location)
+    with open(os.path.join(location, f"{DB_UPDATES_CHECK}.yaml"), "wt") as fout:
+        fout.write("version: 1\ndata:\n  shell: 42.0\n")
+    db = DTShellDatabase.open(DB_UPDATES_CHECK, location=location)
+    assert db.get("shell") == 42.0
+    assert DTShellState(location).section(DB_UPDATES_CHECK) == {"shell": 42.0}
+
+
+def test_state_merges_records_of_the_same_section(tmp_path):
+    location: str = str(tmp_path)
+    db = DTShellDatabase.open(DB_UPDATES_CHECK, location=location)
+    db.set("shell", 1.0)
+    db.set("billboards", 1.0)
+    # another process (e.g., the refresher) changes other records of the same database meanwhile
+    other = DTShellState(location)
+    other.merge(DB_UPDATES_CHECK, {"command_sets": 2.0}, deleted=["billboards"])
+    # our next write keeps their changes
+    db.set("shell", 3.0)
+    assert DTShellState(location).section(DB_UPDATES_CHECK) == {"shell": 3.0, "command_sets": 2.0}
+    assert dict(db.items()) == {"shell": 3.0, "command_sets": 2.0}
+    db.delete("command_sets")
+    assert DTShellState(location).section(DB_UPDATES_CHECK) == {"shell": 3.0}
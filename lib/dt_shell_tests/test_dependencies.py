@@ -0,0 +1,137 @@
+import os
+from typing import List
+
+import pytest
+
+from dt_shell import dependencies
+from dt_shell.dependencies import read_lock, write_lock, log_lock_changes, install_dependencies, \
+    requested_distributions
+
+
+def _venv(tmp_path, *distributions: str) -> str:
+    venv_dir = tmp_path / "venv"
+    site_packages = venv_dir / "lib" / "python3.8" / "site-packages"
+    site_packages.mkdir(parents=True, exist_ok=True)
+    for distribution in distributions:
+        (site_packages / f"{distribution}.dist-info").mkdir()
+    return str(venv_dir)
+
+
+def _resolved(name: str, version: str) -> dict:
+    return {"metadata": {"name": name, "version": version}, "download_info": {"url": f"https://pypi/{name}"}}
+
+
+def test_lock_round_trip(tmp_path):
+    venv_dir: str = _venv(tmp_path, "Requests-2.31.0", "pip-23.0", "dt_data_api-1.2.3")
+    fpath: str = str(tmp_path / "requirements.lock")
+    pins = write_lock(fpath, venv_dir, [str(tmp_path / "requirements.txt")])
+    # the tools needed to bootstrap the environment are not pinned
+    assert pins == {"requests": "2.31.0", "dt_data_api": "1.2.3"}
+    assert read_lock(fpath) == pins
+    assert read_lock(str(tmp_path / "missing.lock")) == {}
+
+
+def test_log_lock_changes(caplog):
+    old = {"requests": "2.31.0", "numpy": "1.24.0", "pyyaml": "6.0"}
+    new = {"requests": "2.32.0", "pyyaml": "6.0", "docker": "7.0.0"}
+    with caplog.at_level("INFO"):
+        log_lock_changes(old, new)
+    assert "+ docker==7.0.0" in caplog.text
+    assert "- numpy==1.24.0" in caplog.text
+    assert "~ requests: 2.31.0 -> 2.32.0" in caplog.text
+    assert "pyyaml" not in caplog.text
+    caplog.clear()
+    with caplog.at_level("INFO"):
+        log_lock_changes(old, old)
+    assert caplog.text == ""
+
+
+@pytest.fixture
+def pip(monkeypatch):
+    calls = {"install": [], "uninstall": []}
+
+    def pip_install(interpreter: str, requirements, options: List[str] = None):
+        with open(requirements, "rt") as fin:
+            calls["install"].append(fin.read().split())
+
+    def pip_uninstall(interpreter: str, names: List[str]):
+        calls["uninstall"].append(names)
+
+    monkeypatch.setattr(dependencies, "pip_install", pip_install)
+    monkeypatch.setattr(dependencies, "pip_uninstall", pip_uninstall)
+    return calls
+
+
+def test_install_only_what_changed(tmp_path, monkeypatch, pip):
+    venv_dir: str = _venv(tmp_path, "requests-2.31.0", "numpy-1.24.0", "pyyaml-6.0", "pip-23.0")
+    monkeypatch.setattr(dependencies, "pip_resolve", lambda *_: [
+        _resolved("requests", "2.32.0"),
+        _resolved("PyYAML", "6.0"),
+        _resolved("docker", "7.0.0"),
+    ])
+    install_dependencies("python3", venv_dir, [])
+    assert pip["install"] == [["requests==2.32.0", "docker==7.0.0"]]
+    assert pip["uninstall"] == [["numpy"]]
+
+
+def test_install_without_pruning(tmp_path, monkeypatch, pip):
+    venv_dir: str = _venv(tmp_path, "requests-2.31.0", "numpy-1.24.0")
+    monkeypatch.setattr(dependencies, "pip_resolve", lambda *_: [_resolved("requests", "2.31.0")])
+    install_dependencies("python3", venv_dir, [], prune=False)
+    assert pip["install"] == []
+    assert pip["uninstall"] == []
+
+
+def test_requested_distributions(tmp_path):
+    (tmp_path / "base.txt").write_text("PyYAML>=6\n")
+    (tmp_path / "requirements.txt").write_text("# comment\nrequests==2.31.0  # pinned\n-r base.txt\n\n"
+                                               "dt-data-api @ git+https://github.com/x/y\n")
+    assert requested_distributions([str(tmp_path / "requirements.txt")]) == {"requests", "pyyaml", "dt_data_api"}
+
+
+def test_reinstall_never_changes_shared_environments(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from dt_shell.constants import DB_VIRTUAL_ENVIRONMENTS
+    from dt_shell.database import DTShellDatabase
+    from dt_shell.embedded.profile.dependencies.reinstall import command
+    from dt_shell.venvs import VirtualEnvironmentsPool
+    pool = VirtualEnvironmentsPool(str(tmp_path / "venvs"))
+    pool._db = DTShellDatabase.open(DB_VIRTUAL_ENVIRONMENTS, location=str(tmp_path / "databases"))
+    requirements: List[str] = [str(tmp_path / "requirements.txt")]
+    (tmp_path / "requirements.txt").write_text("requests\n")
+    key: str = pool.key(requirements)
+    # an environment shared by two profiles
+    profiles = []
+    for name in ["one", "two"]:
+        (tmp_path / name).mkdir()
+        profiles.append(SimpleNamespace(name=name, path=str(tmp_path / name),
+                                        requirements_lock=str(tmp_path / name / "requirements.lock")))
+    pool.make(key)
+    (tmp_path / "venvs" / key / "bin").mkdir()
+    (tmp_path / "venvs" / key / "bin" / "old").write_text("")
+    for profile in profiles:
+        pool.assign(profile, key)
+    built: List[str] = []
+
+    def build(venv_dir, reqs, cache, **_):
+        # a new environment, from scratch
+        assert not venv_dir.endswith(key)
+        os.makedirs(os.path.join(venv_dir, "bin"))
+        with open(os.path.join(venv_dir, "bin", "activate"), "wt") as fout:
+            fout.write(f"VIRTUAL_ENV={venv_dir}\n")
+        built.append(venv_dir)
+        return True
+
+    monkeypatch.setattr(command, "VirtualEnvironmentsPool", lambda: pool)
+    monkeypatch.setattr(command.VirtualPython3Environment, "requirements", staticmethod(lambda _: requirements))
+    monkeypatch.setattr(command.VirtualPython3Environment, "build", staticmethod(build))
+    monkeypatch.setattr(command, "install_dependencies", lambda *_, **__: pytest.fail("changed in place"))
+    command.DTCommand.command(SimpleNamespace(profile=profiles[0]), [])
+    assert len(built) == 1
+    # swapped in, for both profiles, with the paths rewritten
+    venv_dir: str = os.path.join(str(tmp_path / "venvs"), key)
+    assert not os.path.exists(os.path.join(venv_dir, "bin", "old"))
+    with open(os.path.join(venv_dir, "bin", "activate")) as fin:
+        assert fin.read() == f"VIRTUAL_ENV={venv_dir}\n"
+    assert [pool.key_of(p) for p in profiles] == [key, key]
+    assert [k for k, _ in pool.entries()] == [key]
@@ -0,0 +1,72 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from dt_shell.commands.finder import CommandSetFinder, command_set_spec, CachedSourceFileLoader
+
+
+@pytest.fixture
+def command_set(tmp_path, monkeypatch):
+    # the import system is left as we found it
+    monkeypatch.setattr(sys, "meta_path", list(sys.meta_path))
+    monkeypatch.setattr(sys, "path_hooks", list(sys.path_hooks))
+    monkeypatch.setattr(sys, "path_importer_cache", dict(sys.path_importer_cache))
+    monkeypatch.setattr(sys, "modules", dict(sys.modules))
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    monkeypatch.setattr(CommandSetFinder, "_finders", {})
+    monkeypatch.setattr(CommandSetFinder, "bytecode_cache", None)
+    path = tmp_path / "commands" / "mine"
+    (path / "mypkg").mkdir(parents=True)
+    (path / "mypkg" / "__init__.py").write_text("")
+    (path / "mypkg" / "helpers.py").write_text("VALUE = 42\n")
+    return SimpleNamespace(name="mine", path=str(path))
+
+
+def _pycs(path) -> list:
+    return sorted(os.path.relpath(os.path.join(d, f), path) for d, _, fs in os.walk(path) for f in fs
+                  if f.endswith(".pyc"))
+
+
+def test_bytecode_of_command_sets_goes_to_the_cache(tmp_path, command_set):
+    cache = str(tmp_path / "pycache")
+    CommandSetFinder.enable_bytecode_cache(cache)
+    CommandSetFinder.get(command_set).install()
+    assert importlib.import_module("mypkg.helpers").VALUE == 42
+    # nothing next to the sources, everything in the cache
+    assert _pycs(command_set.path) == []
+    sources = os.path.abspath(command_set.path).lstrip(os.path.sep)
+    tag = sys.implementation.cache_tag
+    assert _pycs(cache) == [os.path.join(sources, "mypkg", f"{name}.{tag}.pyc") for name in ["__init__", "helpers"]]
+    # and the rest of the process is left alone
+    assert sys.pycache_prefix is None
+
+
+def test_files_of_command_sets_use_the_cache(tmp_path, command_set):
+    fpath = os.path.join(command_set.path, "mypkg", "helpers.py")
+    assert not isinstance(command_set_spec("helpers", fpath).loader, CachedSourceFileLoader)
+    CommandSetFinder.enable_bytecode_cache(str(tmp_path / "pycache"))
+    assert isinstance(command_set_spec("helpers", fpath).loader, CachedSourceFileLoader)
+
+
+def test_command_set_packages_shadow_modules_imported_already(command_set):
+    import code
+    (Path(command_set.path) / "code" / "build").mkdir(parents=True)
+    (Path(command_set.path) / "code" / "__init__.py").write_text("")
+    (Path(command_set.path) / "code" / "build" / "__init__.py").write_text("NAME = 'build'\n")
+    finder = CommandSetFinder.get(command_set)
+    with finder.activated():
+        # our own packages are left alone
+        importlib.import_module("mypkg")
+        finder.claim("mypkg")
+        assert "mypkg" in sys.modules
+        # modules that are not ours are forgotten
+        assert sys.modules["code"] is code
+        finder.claim("code")
+        assert importlib.import_module("code.build").NAME == "build"
+        # names the command set does not have are never touched
+        finder.claim("json")
+        assert "json" in sys.modules
@@ -0,0 +1,74 @@
+import io
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from dt_shell import UserError
+from dt_shell.embedded.install.command import DTCommand, InstallEntry
+
+
+def test_load_manifest(tmp_path):
+    fpath = tmp_path / "command-sets.txt"
+    fpath.write_text("\n".join([
+        "# our command sets",
+        "duckietown/duckietown-shell-commands daffy",
+        "",
+        "   afdaniele/compose-cli   ",
+        "git@github.com:me/private.git ente",
+    ]))
+    entries = DTCommand.load_manifest(str(fpath))
+    assert [(e.repository, e.branch) for e in entries] == [
+        ("duckietown/duckietown-shell-commands", "daffy"),
+        ("afdaniele/compose-cli", "main"),
+        ("git@github.com:me/private.git", "ente"),
+    ]
+    assert all(e.status == "PENDING" for e in entries)
+
+
+def test_load_manifest_invalid_line(tmp_path):
+    fpath = tmp_path / "command-sets.txt"
+    fpath.write_text("# comment\nduckietown/one main extra\n")
+    with pytest.raises(UserError, match="line 2"):
+        DTCommand.load_manifest(str(fpath))
+
+
+def test_load_manifest_from_stdin(monkeypatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("duckietown/one\n"))
+    entries = DTCommand.load_manifest("-")
+    assert [(e.repository, e.branch) for e in entries] == [("duckietown/one", "main")]
+
+
+def _entry(path: str, download) -> InstallEntry:
+    cs = SimpleNamespace(name="mine", path=path, repository_path=path, download=download,
+                         repository=SimpleNamespace(remoteurl="https://github.com/duckietown/mine"))
+    # noinspection PyTypeChecker
+    return InstallEntry(repository="duckietown/mine", branch="main", command_set=cs)
+
+
+def test_download_reuses_valid_leftovers(tmp_path):
+    path = str(tmp_path / "mine")
+    env = {**os.environ, "GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@t", "GIT_COMMITTER_NAME": "t",
+           "GIT_COMMITTER_EMAIL": "t@t"}
+    subprocess.check_call(["git", "init", "-q", path], env=env)
+    subprocess.check_call(["git", "-C", path, "commit", "-q", "--allow-empty", "-m", "first"], env=env)
+    downloads: list = []
+    entry = _entry(path, lambda: downloads.append(path) or True)
+    DTCommand._download_entry(entry)
+    assert entry.status == "OK"
+    assert downloads == []
+
+
+def test_download_replaces_broken_leftovers(tmp_path):
+    path = tmp_path / "mine"
+    # an interrupted clone
+    (path / ".git").mkdir(parents=True)
+    (path / "leftover").write_text("")
+    downloads: list = []
+    entry = _entry(str(path), lambda: downloads.append(path) or True)
+    DTCommand._download_entry(entry)
+    assert entry.status == "OK"
+    assert downloads == [path]
+    assert not path.exists()
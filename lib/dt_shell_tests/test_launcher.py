@@ -0,0 +1,80 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import dt_shell_launcher
+from dt_shell.database import DTShellDatabase
+from dt_shell.environments import VirtualPython3Environment, Python3Environment
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch) -> str:
+    monkeypatch.setenv("DTSHELL_ROOT", str(tmp_path / "root"))
+    return str(tmp_path / "root")
+
+
+def _node(name: str, environment, aliases=None):
+    configuration = SimpleNamespace(aliases=lambda: aliases or []) if environment is not None else None
+    node = SimpleNamespace(name=name, is_leaf=True, known_environment=environment,
+                           known_configuration=configuration)
+    node.walk = lambda: iter([node])
+    return node
+
+
+def _shell(tmp_path, nodes: list) -> SimpleNamespace:
+    databases: str = str(tmp_path / "databases")
+    profile = SimpleNamespace(database=lambda name: DTShellDatabase.open(name, location=databases))
+    return SimpleNamespace(profile=profile, command_sets=[], command_nodes={n.name: n for n in nodes})
+
+
+def _write(tmp_path, shell):
+    interpreter = tmp_path / "python3"
+    if not interpreter.exists():
+        interpreter.write_text("")
+    VirtualPython3Environment._write_launcher_stamp(shell, str(interpreter), __file__, {"A": "1"},
+                                                    str(tmp_path / "deps.yaml"))
+
+
+def test_stamp_excludes_commands_from_the_manifest(tmp_path, root):
+    class Unknown:
+        name = "unknown"
+        is_leaf = True
+        known_environment = None
+        known_configuration = None
+
+        def walk(self):
+            return iter([self])
+
+        @property
+        def aliases(self):
+            # the configuration is imported only for commands unknown to the manifest
+            return ["u"]
+
+    shell = _shell(tmp_path, [
+        _node("venv", VirtualPython3Environment()),
+        _node("system", Python3Environment(), aliases=["sys"]),
+        Unknown(),
+    ])
+    _write(tmp_path, shell)
+    stamp = dt_shell_launcher.read_stamp()
+    assert stamp is not None
+    assert stamp["excluded"] == ["sys", "system", "u", "unknown"]
+
+
+def test_stamp_written_only_when_invalid(tmp_path, root):
+    shell = _shell(tmp_path, [_node("venv", VirtualPython3Environment())])
+    _write(tmp_path, shell)
+    fpath = dt_shell_launcher.stamp_path()
+    mtime = os.stat(fpath).st_mtime_ns
+    # a valid stamp is left alone, command nodes are not even looked at
+    _write(tmp_path, _shell(tmp_path, [_node("system", Python3Environment())]))
+    assert os.stat(fpath).st_mtime_ns == mtime
+    with open(fpath) as fin:
+        assert json.load(fin)["excluded"] == []
+    # anything watched changes
+    (tmp_path / "python3").write_text("changed")
+    assert dt_shell_launcher.read_stamp() is None
+    _write(tmp_path, _shell(tmp_path, [_node("system", Python3Environment())]))
+    assert dt_shell_launcher.read_stamp()["excluded"] == ["system"]
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+from types import SimpleNamespace
+
+from dt_shell.commands import manifest as manifest_module
+from dt_shell.commands.commands import DTCommandConfigurationAbs
+from dt_shell.commands.manifest import CommandSetManifest, environment_spec, environment_from_spec, git_head
+from dt_shell.environments import Python3Environment, VirtualPython3Environment
+
+
+def test_fingerprint_follows_the_working_tree(tmp_path):
+    path = tmp_path / "mine"
+    (path / "cmd").mkdir(parents=True)
+    (path / "cmd" / "configuration.py").write_text("from utils import X\n")
+    (path / "utils.py").write_text("X = 1\n")
+    command_set = SimpleNamespace(name="mine", path=str(path))
+    fingerprint = CommandSetManifest.compute_fingerprint(command_set)
+    assert CommandSetManifest.compute_fingerprint(command_set) == fingerprint
+    # an uncommitted change to a module imported by a configuration
+    (path / "utils.py").write_text("X = 22\n")
+    assert CommandSetManifest.compute_fingerprint(command_set) != fingerprint
+    # files other than Python sources do not matter
+    fingerprint = CommandSetManifest.compute_fingerprint(command_set)
+    (path / "README.md").write_text("")
+    assert CommandSetManifest.compute_fingerprint(command_set) == fingerprint
+
+
+def test_parsers_are_not_recorded(tmp_path, monkeypatch):
+    command_set = SimpleNamespace(name="mine", path=str(tmp_path), profile=SimpleNamespace(path=str(tmp_path)),
+                                  command_path=lambda selector: str(tmp_path / selector))
+
+    class Configuration(DTCommandConfigurationAbs):
+        @classmethod
+        def parser(cls, *args, **kwargs):
+            parser = argparse.ArgumentParser()
+            # computed every time the parser is built
+            parser.add_argument("--user", default=os.environ.get("USER"))
+            return parser
+
+    manifest = CommandSetManifest(command_set, "fingerprint")
+    manifest.record("cmd", Configuration)
+    assert manifest.commands["cmd"] == {"aliases": [], "environment": {"class": None}}
+    # the parser comes from the configuration of the command
+    monkeypatch.setattr(manifest_module, "import_configuration", lambda cs, selector: Configuration)
+    monkeypatch.setenv("USER", "someone")
+    parser = manifest.configuration("cmd").parser()
+    assert parser.parse_args([]).user == "someone"
+
+
+def test_environment_round_trip():
+    for environment in [None, Python3Environment(), VirtualPython3Environment()]:
+        spec = environment_spec(environment)
+        assert spec is not None
+        rebuilt = environment_from_spec(json.loads(json.dumps(spec)))
+        assert rebuilt == environment
+
+
+def test_git_head(tmp_path):
+    repo = str(tmp_path)
+    env = {**os.environ, "GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@t", "GIT_COMMITTER_NAME": "t",
+           "GIT_COMMITTER_EMAIL": "t@t"}
+    subprocess.check_call(["git", "init", "-q", repo], env=env)
+    assert git_head(repo) is None
+    subprocess.check_call(["git", "-C", repo, "commit", "-q", "--allow-empty", "-m", "first"], env=env)
+    sha = subprocess.check_output(["git", "-C", repo, "rev-parse", "HEAD"]).decode().strip()
+    assert git_head(repo) == sha
+    # packed refs
+    subprocess.check_call(["git", "-C", repo, "pack-refs", "--all"], env=env)
+    assert git_head(repo) == sha
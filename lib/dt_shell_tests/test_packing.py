@@ -0,0 +1,108 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from dt_shell import UserError
+from dt_shell.packing import _extract
+
+
+def _archive(tmp_path, *members: tarfile.TarInfo) -> str:
+    fpath = str(tmp_path / "archive.tar.gz")
+    with tarfile.open(fpath, "w:gz") as tar:
+        for member in members:
+            tar.addfile(member, io.BytesIO(b"x" * member.size) if member.isfile() else None)
+    return fpath
+
+
+def _file(name: str) -> tarfile.TarInfo:
+    member = tarfile.TarInfo(name)
+    member.size = 1
+    return member
+
+
+def _symlink(name: str, target: str) -> tarfile.TarInfo:
+    member = tarfile.TarInfo(name)
+    member.type, member.linkname = tarfile.SYMTYPE, target
+    return member
+
+
+@pytest.fixture(params=["data_filter", "fallback"])
+def extract(request, monkeypatch):
+    if request.param == "fallback":
+        monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    elif not hasattr(tarfile, "data_filter"):
+        pytest.skip("this Python has no extraction filters")
+
+    def _run(fpath: str, destination: str):
+        with tarfile.open(fpath, "r:*") as tar:
+            _extract(tar, destination)
+
+    return _run
+
+
+def test_extract(tmp_path, extract):
+    fpath = _archive(tmp_path, _file("manifest.json"), _file("databases/profile.yaml"))
+    destination = tmp_path / "out"
+    destination.mkdir()
+    extract(fpath, str(destination))
+    assert (destination / "manifest.json").read_bytes() == b"x"
+    assert (destination / "databases" / "profile.yaml").is_file()
+
+
+@pytest.mark.parametrize("member", [
+    _file("../escape"),
+    _file("databases/../../escape"),
+    _symlink("link", "/etc/passwd"),
+    _symlink("link", "../escape"),
+], ids=["parent", "nested-parent", "absolute-symlink", "parent-symlink"])
+def test_extract_rejects_entries_outside_destination(tmp_path, extract, member):
+    fpath = _archive(tmp_path, member)
+    destination = tmp_path / "out"
+    destination.mkdir()
+    with pytest.raises(UserError, match="invalid entry"):
+        extract(fpath, str(destination))
+    assert not os.path.lexists(tmp_path / "escape")
+
+
+def test_extract_keeps_absolute_entries_inside_destination(tmp_path, extract):
+    escape = str(tmp_path / "escape")
+    fpath = _archive(tmp_path, _file(escape))
+    destination = tmp_path / "out"
+    destination.mkdir()
+    # either refused or made relative to the destination (what the data filter does)
+    try:
+        extract(fpath, str(destination))
+    except UserError:
+        pass
+    assert not os.path.lexists(escape)
+
+
+def test_pack_keeps_the_state_of_the_profile(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from dt_shell.constants import DB_COMMAND_SET_UPDATES_CHECK, DB_INSTALLED_DEPENDENCIES, DB_UPDATES_CHECK, \
+        STATE_FILE
+    from dt_shell.database.database import DTShellState
+    from dt_shell.packing import ProfilePack
+    path = tmp_path / "profile"
+    state = DTShellState(str(path / "databases"))
+    state.write(DB_UPDATES_CHECK, {"billboards": 1.0})
+    state.write(DB_COMMAND_SET_UPDATES_CHECK, {"mine": {"sha": "a", "remote_sha": "b", "interval": 60}})
+    state.write(DB_INSTALLED_DEPENDENCIES, {"/here/requirements.txt": "requests\n"})
+    (path / "databases" / "settings.yaml").write_text("version: 1\ndata: {}\n")
+    profile = SimpleNamespace(name="mine", path=str(path), requirements_lock=str(path / "requirements.lock"),
+                              command_sets=[])
+    fpath = str(tmp_path / "mine.tar.gz")
+    ProfilePack(fpath).pack(profile, dependencies=False)
+    destination = tmp_path / "out"
+    destination.mkdir()
+    with tarfile.open(fpath, "r:*") as tar:
+        _extract(tar, str(destination))
+    assert sorted(os.listdir(destination / "databases")) == ["settings.yaml", STATE_FILE]
+    packed = DTShellState(str(destination / "databases"))
+    assert packed.section(DB_UPDATES_CHECK) == {"billboards": 1.0}
+    # updates downloaded here are not in the archive
+    assert packed.section(DB_COMMAND_SET_UPDATES_CHECK) == {"mine": {"sha": "a", "remote_sha": None, "interval": 60}}
+    # nor is the environment built here
+    assert packed.section(DB_INSTALLED_DEPENDENCIES) is None
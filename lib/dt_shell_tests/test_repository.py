@@ -0,0 +1,42 @@
+import pytest
+
+from dt_shell.commands import repository
+from dt_shell.commands.repository import git_environment
+from dt_shell.constants import DTShellConstants
+
+
+@pytest.fixture(autouse=True)
+def ssh(tmp_path, monkeypatch):
+    monkeypatch.delenv("GIT_SSH_COMMAND", raising=False)
+    monkeypatch.delenv("GIT_SSH", raising=False)
+    monkeypatch.delenv("GIT_TERMINAL_PROMPT", raising=False)
+    monkeypatch.setenv("DTSHELL_SSH_CONTROL", str(tmp_path / "ssh"))
+
+
+def test_interactive_git_can_prompt():
+    env = git_environment()
+    assert "GIT_TERMINAL_PROMPT" not in env
+    assert "BatchMode" not in env["GIT_SSH_COMMAND"]
+    assert "ControlMaster=auto" in env["GIT_SSH_COMMAND"]
+
+
+def test_non_interactive_git_never_prompts():
+    env = git_environment(interactive=False)
+    assert env["GIT_TERMINAL_PROMPT"] == "0"
+    assert env["GIT_SSH_COMMAND"].startswith("ssh -o BatchMode=yes ")
+    assert "ControlMaster=auto" in env["GIT_SSH_COMMAND"]
+
+
+def test_transfers_in_the_background_never_prompt(monkeypatch):
+    envs: list = []
+
+    def run(cmd, env, **_):
+        envs.append(env)
+        raise RuntimeError("stop")
+
+    monkeypatch.setattr(repository.subprocess, "run", run)
+    for background in [False, True]:
+        monkeypatch.setattr(DTShellConstants, "BACKGROUND", background)
+        with pytest.raises(RuntimeError):
+            repository.git_transfer(["git", "fetch"])
+    assert [env.get("GIT_TERMINAL_PROMPT") for env in envs] == [None, "0"]
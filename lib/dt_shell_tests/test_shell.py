@@ -0,0 +1,48 @@
+import os
+from types import SimpleNamespace
+
+from dt_shell.commands import CommandSet
+from dt_shell.commands.repository import CommandsRepository
+from dt_shell.constants import DB_COMMAND_SET_UPDATES_CHECK
+from dt_shell.database import DTShellDatabase
+from dt_shell.shell import DTShell
+
+
+def _shell(tmp_path, auto_update: bool = True) -> SimpleNamespace:
+    databases: str = str(tmp_path / "databases")
+    profile = SimpleNamespace(
+        name="test",
+        path=str(tmp_path),
+        database=lambda name: DTShellDatabase.open(name, location=databases),
+        settings=SimpleNamespace(update_check_bounds=(5, 1440), auto_update=auto_update),
+    )
+    command_sets = [
+        CommandSet(
+            name=name,
+            path=str(tmp_path / "commands" / name),
+            profile=profile,
+            repository=CommandsRepository.from_remoteurl(f"https://github.com/duckietown/{name}", "main"),
+        ) for name in ["one", "two"]
+    ]
+    return SimpleNamespace(profile=profile, command_sets=command_sets, _notified_updates=[])
+
+
+def test_lean_mode_downloads_command_sets_of_fresh_profiles(tmp_path, monkeypatch, capsys):
+    shell = _shell(tmp_path)
+    downloaded: list = []
+    applied: list = []
+    for cs in shell.command_sets:
+        monkeypatch.setattr(cs, "download", lambda cs=cs: downloaded.append(cs.name) or os.makedirs(cs.path))
+        monkeypatch.setattr(cs, "apply_updates", lambda cs=cs: applied.append(cs.name) or True)
+    # the second one is there already and has updates waiting
+    os.makedirs(shell.command_sets[1].path)
+    shell.profile.database(DB_COMMAND_SET_UPDATES_CHECK).set("two", {"sha": "a" * 40, "remote_sha": "b" * 40})
+    # lean mode
+    assert not DTShell.apply_command_set_updates(shell, apply=False)
+    assert downloaded == ["one"]
+    assert applied == []
+    assert capsys.readouterr().out == ""
+    # interactive mode
+    assert DTShell.apply_command_set_updates(shell)
+    assert downloaded == ["one"]
+    assert applied == ["two"]
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from dt_shell import __version__
+from dt_shell.snapshot import ShellSnapshot, DTSHELL_SNAPSHOT_ENV, SNAPSHOT_MAX_AGE_SECS, SNAPSHOT_VERSION
+
+
+def _snapshot(**kwargs) -> ShellSnapshot:
+    fields = dict(
+        shell_version=__version__,
+        pid=os.getpid(),
+        time=time.time(),
+        profile="default",
+        argv=sys.argv[1:],
+        checks_done=True,
+        command_sets={},
+    )
+    fields.update(kwargs)
+    return ShellSnapshot(**fields)
+
+
+def _handover(monkeypatch, snapshot: ShellSnapshot) -> str:
+    fpath: str = snapshot.save()
+    monkeypatch.setenv(DTSHELL_SNAPSHOT_ENV, fpath)
+    return fpath
+
+
+def test_valid_snapshot_is_loaded_and_consumed(monkeypatch):
+    fpath: str = _handover(monkeypatch, _snapshot())
+    snapshot = ShellSnapshot._load()
+    assert snapshot is not None
+    assert snapshot.profile == "default"
+    # the file and the variable are consumed
+    assert not os.path.exists(fpath)
+    assert DTSHELL_SNAPSHOT_ENV not in os.environ
+    assert ShellSnapshot._load() is None
+
+
+@pytest.mark.parametrize("fields", [
+    {"version": SNAPSHOT_VERSION + 1},
+    {"shell_version": "0.0.0"},
+    {"pid": os.getpid() + 1},
+    {"argv": ["something", "else"]},
+    {"time": time.time() - SNAPSHOT_MAX_AGE_SECS - 1},
+])
+def test_invalid_snapshot_is_ignored(monkeypatch, fields):
+    fpath: str = _handover(monkeypatch, _snapshot(**fields))
+    assert ShellSnapshot._load() is None
+    assert not os.path.exists(fpath)
+
+
+def test_corrupted_snapshot_is_ignored(monkeypatch, tmp_path):
+    fpath = tmp_path / "snapshot.json"
+    fpath.write_text("{not json")
+    monkeypatch.setenv(DTSHELL_SNAPSHOT_ENV, str(fpath))
+    assert ShellSnapshot._load() is None
+
+
+def test_commands_of_other_command_sets_are_not_reused(tmp_path):
+    path: str = str(tmp_path)
+    snapshot = _snapshot(command_sets={path: {"name": "mine", "head": None, "tree": {}}})
+    assert snapshot.commands(SimpleNamespace(name="mine", path=path)) == {}
+    assert snapshot.commands(SimpleNamespace(name="other", path=path)) is None
+    assert snapshot.commands(SimpleNamespace(name="mine", path=os.path.join(path, "else"))) is None
+    # the command set changed since the snapshot was taken
+    snapshot = _snapshot(command_sets={path: {"name": "mine", "head": "0" * 40, "tree": {}}})
+    assert snapshot.commands(SimpleNamespace(name="mine", path=path)) is None
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from dt_shell.commands.commands import DTCommandConfigurationAbs
+from dt_shell.commands.tree import CommandNode, CommandNodesMap
+from dt_shell.environments import Python3Environment
+
+
+def _configuration(*aliases: str):
+    class Configuration(DTCommandConfigurationAbs):
+
+        @classmethod
+        def environment(cls, *args, **kwargs):
+            return Python3Environment()
+
+        @classmethod
+        def aliases(cls) -> List[str]:
+            return list(aliases)
+
+    return Configuration
+
+
+def _node(name: str, aliases: List[str], children: Optional[Dict[str, CommandNode]] = None) -> CommandNode:
+    return CommandNode(
+        name=name,
+        level=0,
+        selector=name,
+        command_set=None,
+        skeleton=True,
+        # groups of commands have no descriptor
+        descriptor=None if children else SimpleNamespace(),
+        children=children or {},
+        _configuration=_configuration(*aliases),
+    )
+
+
+def _nodes() -> Dict[str, CommandNode]:
+    return {
+        "build": _node("build", ["b"]),
+        "run": _node("run", ["r", "start"]),
+        "devel": _node("devel", ["dev"], children={"build": _node("build", [])}),
+    }
+
+
+def test_resolve_by_name():
+    nodes = _nodes()
+    commands = CommandNodesMap(nodes)
+    assert commands.resolve("run").name == "run"
+    assert nodes["run"].materialized
+    assert not nodes["build"].materialized
+    assert not nodes["devel"].materialized
+
+
+def test_resolve_by_alias():
+    nodes = _nodes()
+    commands = CommandNodesMap(nodes)
+    assert commands.resolve("start").name == "run"
+    # the other commands are not materialized to look at their aliases
+    assert not nodes["build"].materialized
+    assert not nodes["devel"].materialized
+
+
+def test_resolve_alias_of_group():
+    nodes = _nodes()
+    commands = CommandNodesMap(nodes)
+    devel = commands.resolve("dev")
+    assert devel.name == "devel"
+    assert "build" in devel.commands
+    assert not nodes["build"].materialized
+
+
+def test_resolve_unknown():
+    nodes = _nodes()
+    commands = CommandNodesMap(nodes)
+    assert commands.resolve("stop") is None
+    assert not any(node.materialized for node in nodes.values())
@@ -0,0 +1,131 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from dt_shell.constants import DB_VIRTUAL_ENVIRONMENTS
+from dt_shell.database import DTShellDatabase
+from dt_shell.venvs import VirtualEnvironmentsPool, STAGING_GRACE_SECS
+
+
+@pytest.fixture
+def pool(tmp_path) -> VirtualEnvironmentsPool:
+    pool = VirtualEnvironmentsPool(str(tmp_path / "venvs"))
+    pool._db = DTShellDatabase.open(DB_VIRTUAL_ENVIRONMENTS, location=str(tmp_path / "databases"))
+    return pool
+
+
+def _profile(tmp_path, name: str, venv: bool = False) -> SimpleNamespace:
+    path = tmp_path / "profiles" / name
+    path.mkdir(parents=True)
+    if venv:
+        # an environment owned by the profile, as profiles used to have
+        (path / "venv" / "bin").mkdir(parents=True)
+        (path / "venv" / "bin" / "activate").write_text(f"VIRTUAL_ENV={path / 'venv'}\n")
+    return SimpleNamespace(name=name, path=str(path))
+
+
+def _requirements(tmp_path, name: str, content: str) -> str:
+    fpath = tmp_path / name
+    fpath.write_text(content)
+    return str(fpath)
+
+
+def test_key_depends_on_content(tmp_path):
+    a = _requirements(tmp_path, "a.txt", "requests\n")
+    b = _requirements(tmp_path, "b.txt", "requests\n")
+    c = _requirements(tmp_path, "c.txt", "requests==2.0\n")
+    assert VirtualEnvironmentsPool.key([a]) == VirtualEnvironmentsPool.key([b])
+    assert VirtualEnvironmentsPool.key([a]) == VirtualEnvironmentsPool.key([a, None])
+    assert VirtualEnvironmentsPool.key([a]) != VirtualEnvironmentsPool.key([c])
+    assert VirtualEnvironmentsPool.key([a]) != VirtualEnvironmentsPool.key([a, c])
+
+
+def test_assign(pool, tmp_path):
+    profile = _profile(tmp_path, "one")
+    pool.make("k1")
+    pool.make("k2")
+    assert pool.key_of(profile) is None
+    pool.assign(profile, "k1")
+    assert pool.key_of(profile) == "k1"
+    assert pool._db.get("k1")["profiles"] == ["one"]
+    # switching environment moves the reference
+    pool.assign(profile, "k2")
+    assert pool.key_of(profile) == "k2"
+    assert pool._db.get("k1")["profiles"] == []
+    assert pool._db.get("k2")["profiles"] == ["one"]
+
+
+def test_adopt(pool, tmp_path):
+    profile = _profile(tmp_path, "one", venv=True)
+    venv_dir: str = os.path.join(profile.path, "venv")
+    pool.adopt("k1", venv_dir, {"requirements.txt": "abc"})
+    pool.assign(profile, "k1")
+    assert pool.key_of(profile) == "k1"
+    assert os.path.islink(venv_dir)
+    # absolute paths to the environment are rewritten
+    with open(os.path.join(pool.path("k1"), "bin", "activate")) as fin:
+        assert fin.read() == f"VIRTUAL_ENV={pool.path('k1')}\n"
+    assert dict(pool.dependencies("k1").items()) == {"requirements.txt": "abc"}
+
+
+def test_assign_profiles_with_their_own_environment(pool, tmp_path):
+    one = _profile(tmp_path, "one", venv=True)
+    two = _profile(tmp_path, "two", venv=True)
+    # the first profile moves its environment to the pool
+    pool.adopt("k1", os.path.join(one.path, "venv"))
+    pool.assign(one, "k1")
+    # the second one has the same dependencies, the environment in the pool is used instead of its own
+    pool.assign(two, "k1")
+    assert pool.key_of(one) == pool.key_of(two) == "k1"
+    assert sorted(pool._db.get("k1")["profiles"]) == ["one", "two"]
+
+
+def test_locked_while_staging(pool):
+    assert not pool.locked("k1")
+    # a build was started in the background but did not take the lock yet
+    os.makedirs(pool.location, exist_ok=True)
+    with open(pool.staging("k1"), "wt"):
+        pass
+    assert pool.locked("k1")
+    # the process building it never made it
+    old: float = time.time() - STAGING_GRACE_SECS - 1
+    os.utime(pool.staging("k1"), (old, old))
+    assert not pool.locked("k1")
+    # a build is in progress
+    os.remove(pool.staging("k1"))
+    with pool.lock("k1"):
+        assert pool.locked("k1")
+
+
+def test_reset_removes_shared_environment(pool, tmp_path, monkeypatch):
+    from dt_shell.constants import DB_PROFILES
+    from dt_shell.embedded.profile.venv.reset import command
+    one, two = _profile(tmp_path, "one"), _profile(tmp_path, "two")
+    pool.make("k1")
+    pool.assign(one, "k1")
+    pool.assign(two, "k1")
+    profiles = DTShellDatabase.open(DB_PROFILES)
+    monkeypatch.setattr(profiles, "items", lambda: [("one", one.path), ("two", two.path)])
+    monkeypatch.setattr(command, "VirtualEnvironmentsPool", lambda: pool)
+    monkeypatch.setattr(command.questionary, "confirm", lambda *_: SimpleNamespace(ask=lambda: True))
+    command.DTCommand.command(SimpleNamespace(profile=one), [])
+    # the broken environment is not handed back at the next run, not even to the other profile
+    assert not pool.contains("k1")
+    assert not pool._db.contains("k1")
+    assert pool.key_of(one) is None
+    assert not os.path.lexists(os.path.join(one.path, "venv"))
+
+
+def test_reset_waits_for_builds(pool, tmp_path, monkeypatch):
+    from dt_shell.embedded.profile.venv.reset import command
+    one = _profile(tmp_path, "one")
+    pool.make("k1")
+    pool.assign(one, "k1")
+    monkeypatch.setattr(command, "VirtualEnvironmentsPool", lambda: pool)
+    monkeypatch.setattr(command.questionary, "confirm", lambda *_: SimpleNamespace(ask=lambda: True))
+    with pool.lock("k1"):
+        command.DTCommand.command(SimpleNamespace(profile=one), [])
+    assert pool.contains("k1")
+    assert pool.key_of(one) == "k1"
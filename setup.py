@@ -80,6 +80,7 @@ setup(
         '': 'lib',
         'dt_shell': 'lib/dt_shell',
         'dt_shell_cli': 'lib/dt_shell_cli',
+        'dt_shell_launcher': 'lib/dt_shell_launcher',
     },
     packages=find_packages(where="lib", exclude=["dt_shell_tests"]),
     # we want the python 2 version to download it, and then exit with an error
@@ -111,7 +112,7 @@ setup(
 
     entry_points={
         'console_scripts': [
-            'dts = dt_shell_cli.dts:dts',
+            'dts = dt_shell_launcher:launch',
         ]
     }
 )